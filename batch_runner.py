@@ -0,0 +1,240 @@
+# batch_runner.py
+
+# --- Load Environment Variables FIRST ---
+from dotenv import load_dotenv
+load_dotenv()
+
+# --- Now, import everything else ---
+import argparse
+import asyncio
+import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.workflow import build_graph, run_config
+from src.analysis_pool import DEFAULT_ANALYSIS_CONCURRENCY
+from src.tools.rag_tool import rag_compliance_lookup
+from src.fanout import FANOUT_VARIANTS
+from src.metrics import METRICS_PATH, registry, track_run
+from src.scheduler import BATCH, lane
+
+# --- Stage Classification ---
+# Nodes that mostly wait on OpenAI (chat or DALL-E) vs. nodes that burn local CPU.
+LLM_STAGES = {"rag", "planner", "designer", "critique", "report"}
+CPU_STAGES = {"analyst"}
+
+
+def load_briefs(path: str) -> list:
+    """
+    Reads design briefs from a JSONL file. Each line may be a plain JSON string
+    or an object with a `user_request`, `brief` or `body` field, and optionally
+    an `id` or `request_id`.
+    """
+    briefs = []
+    with open(path) as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"user_request": record}
+            text = record.get("user_request") or record.get("brief") or record.get("body")
+            if not text:
+                print(f"Skipping line {line_no}: no brief text found.")
+                continue
+            brief_id = record.get("id") or record.get("request_id") or f"brief-{line_no}"
+            briefs.append({"id": str(brief_id), "user_request": text})
+    return briefs
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers (0.0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class StageLimiter:
+    """
+    Bounds how many LLM-bound and CPU-bound stages run at the same time across
+    all briefs in the batch.
+    """
+
+    def __init__(self, llm_concurrency: int, cpu_concurrency: int):
+        self.llm = threading.BoundedSemaphore(llm_concurrency)
+        self.cpu = threading.BoundedSemaphore(cpu_concurrency)
+
+    def semaphore_for(self, stage: str):
+        if stage in CPU_STAGES:
+            return self.cpu
+        if stage in LLM_STAGES:
+            return self.llm
+        return None
+
+    def wrap(self, name: str, fn):
+        """Wraps a graph node so it only runs while holding its stage's slot."""
+        semaphore = self.semaphore_for(name)
+        if semaphore is None:
+            return fn
+
+        def limited(state):
+            with semaphore:
+                return fn(state)
+        return limited
+
+
+def result_record(brief: dict, final_state: dict, start: float) -> dict:
+    """Builds the output record for a finished (or failed, if final_state is None) brief."""
+    record = {"id": brief["id"], "user_request": brief["user_request"]}
+    if final_state is not None:
+        if final_state.get("image_artifact"):
+            final_state["image_artifact"].wait_persisted()
+        record.update({
+            "status": "PASS" if final_state.get("critique_feedback") == "PASS" else "FAIL",
+            "iterations": final_state.get("iteration_count", 0),
+            "image_path": final_state.get("image_path"),
+            "analysis_results": final_state.get("analysis_results"),
+            "critique_feedback": final_state.get("critique_feedback"),
+            "final_report": final_state.get("final_report"),
+            "fanout_stats": final_state.get("fanout_stats"),
+        })
+    record["latency_s"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def run_brief(app, limiter: StageLimiter, brief: dict, num_variants: int = FANOUT_VARIANTS) -> dict:
+    """Runs a single brief through RAG lookup and the compiled graph."""
+    start = time.perf_counter()
+    # Batch OpenAI calls yield to interactive runs sharing the rate limits
+    with lane(BATCH), track_run(brief["id"]) as run:
+        try:
+            with limiter.llm:
+                rag_context = rag_compliance_lookup.invoke(brief["user_request"])
+            final_state = app.invoke({
+                "user_request": brief["user_request"],
+                "rag_context": rag_context,
+                "iteration_count": 0,
+                "num_variants": num_variants,
+            }, run_config())
+            record = result_record(brief, final_state, start)
+        except Exception as e:
+            record = result_record(brief, None, start)
+            record.update({"status": "ERROR", "error": str(e)})
+    record["metrics"] = run.to_dict()
+    return record
+
+
+def run_batch(input_path: str, output_path: str, workers: int = 8,
+              llm_concurrency: int = 8, cpu_concurrency: int = DEFAULT_ANALYSIS_CONCURRENCY,
+              num_variants: int = FANOUT_VARIANTS, metrics_path: str = METRICS_PATH) -> dict:
+    """
+    Runs every brief in `input_path` through the workflow with bounded
+    concurrency, appending one JSON record per brief to `output_path` as soon
+    as it finishes. Aggregated metrics are exported to `metrics_path`.
+    Returns:
+        A summary dict with counts, throughput and p50/p95 latency.
+    """
+    briefs = load_briefs(input_path)
+    limiter = StageLimiter(llm_concurrency, cpu_concurrency)
+    app = build_graph(human_approval=False, wrap_node=limiter.wrap)
+
+    print(f"--- 🚀 Running {len(briefs)} briefs (workers={workers}, llm={llm_concurrency}, cpu={cpu_concurrency}) ---")
+    latencies = []
+    statuses = {}
+    write_lock = threading.Lock()
+    start = time.perf_counter()
+
+    with open(output_path, "a") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_brief, app, limiter, brief, num_variants) for brief in briefs]
+        for future in as_completed(futures):
+            record = future.result()
+            with write_lock:
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+            latencies.append(record["latency_s"])
+            statuses[record["status"]] = statuses.get(record["status"], 0) + 1
+            print(f"[{record['id']}] {record['status']} in {record['latency_s']}s")
+
+    return summarize(len(briefs), statuses, latencies, time.perf_counter() - start, metrics_path)
+
+
+def summarize(count: int, statuses: dict, latencies: list, elapsed: float, metrics_path: str = METRICS_PATH) -> dict:
+    """Prints and returns throughput and p50/p95 latency for a finished batch, and exports its metrics."""
+    summary = {
+        "briefs": count,
+        "statuses": statuses,
+        "wall_time_s": round(elapsed, 3),
+        "throughput_briefs_per_min": round(count / elapsed * 60, 2) if elapsed > 0 else 0.0,
+        "p50_latency_s": percentile(latencies, 50),
+        "p95_latency_s": percentile(latencies, 95),
+        "metrics_path": registry.export(metrics_path),
+    }
+    print("\n--- 📊 BATCH SUMMARY ---")
+    print(json.dumps(summary, indent=2))
+    return summary
+
+
+async def run_batch_async(input_path: str, output_path: str, max_concurrent_runs: int = 32,
+                          timeout_s: float = None, num_variants: int = FANOUT_VARIANTS,
+                          metrics_path: str = METRICS_PATH) -> dict:
+    """
+    Same as run_batch, but drives every brief from a single event loop with
+    the async workflow instead of a thread per brief.
+    """
+    from src.async_workflow import AsyncWorkflowRunner
+
+    briefs = load_briefs(input_path)
+    runner = AsyncWorkflowRunner(max_concurrent_runs=max_concurrent_runs, timeout_s=timeout_s)
+    print(f"--- 🚀 Running {len(briefs)} briefs on one event loop (max in flight={max_concurrent_runs}) ---")
+    latencies = []
+    statuses = {}
+    start = time.perf_counter()
+
+    async def run_one(brief: dict) -> dict:
+        brief_start = time.perf_counter()
+        # The run's task copies this context, so everything it records lands in `run`
+        with lane(BATCH), track_run(brief["id"]) as run:
+            try:
+                final_state = await runner.run(brief["user_request"], run_id=brief["id"], num_variants=num_variants)
+                record = await asyncio.to_thread(result_record, brief, final_state, brief_start)
+            except Exception as e:
+                record = result_record(brief, None, brief_start)
+                error = "timed out" if isinstance(e, asyncio.TimeoutError) else str(e)
+                record.update({"status": "ERROR", "error": error})
+        record["metrics"] = run.to_dict()
+        return record
+
+    # Leaving the runner closes its OpenAI/HTTP clients
+    async with runner:
+        with open(output_path, "a") as out:
+            for next_done in asyncio.as_completed([run_one(brief) for brief in briefs]):
+                record = await next_done
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                latencies.append(record["latency_s"])
+                statuses[record["status"]] = statuses.get(record["status"], 0) + 1
+                print(f"[{record['id']}] {record['status']} in {record['latency_s']}s")
+
+    return summarize(len(briefs), statuses, latencies, time.perf_counter() - start, metrics_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run many design briefs through the UrbanPlan AI workflow.")
+    parser.add_argument("input", help="JSONL file with one brief per line.")
+    parser.add_argument("-o", "--output", default="./outputs/batch_results.jsonl", help="JSONL file to append results to.")
+    parser.add_argument("--workers", type=int, default=8, help="Briefs processed concurrently.")
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="Max concurrent LLM/DALL-E/RAG calls.")
+    parser.add_argument("--cpu-concurrency", type=int, default=DEFAULT_ANALYSIS_CONCURRENCY, help="Max concurrent YOLO analyses (default 1 without ANALYSIS_WORKERS, else 2).")
+    parser.add_argument("--variants", type=int, default=FANOUT_VARIANTS, help="Design candidates rendered per iteration.")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Drive all briefs from one event loop with the async workflow.")
+    parser.add_argument("--timeout", type=float, default=None, help="Per-brief timeout in seconds (async mode).")
+    parser.add_argument("--metrics", default=METRICS_PATH, help="File to export metrics to (.json for JSON, else Prometheus text).")
+    args = parser.parse_args()
+    if args.use_async:
+        asyncio.run(run_batch_async(args.input, args.output, args.workers, args.timeout, args.variants, args.metrics))
+    else:
+        run_batch(args.input, args.output, args.workers, args.llm_concurrency, args.cpu_concurrency, args.variants, args.metrics)
@@ -0,0 +1,110 @@
+# benchmarks/bench_backends.py
+#
+# Accuracy vs. latency of the YOLO inference backends on the sample images in
+# images/. PyTorch is the reference: for every other backend it reports the
+# mean and max absolute coverage error (percentage points) next to the
+# per-image latency and speed-up, and a backend whose task differs from the
+# reference's (e.g. detect-only vs. segment) is flagged. Exports are built on
+# first use.
+#
+#   python -m benchmarks.bench_backends
+#   python -m benchmarks.bench_backends --backends ultralytics onnx:int8 openvino
+
+import argparse
+import glob
+import json
+import os
+import time
+import cv2
+
+DEFAULT_BACKENDS = ["ultralytics", "onnx", "onnx:int8", "openvino", "openvino:int8"]
+IMAGES_GLOB = "images/*.png"
+REPEATS = 5
+
+def parse_backend(spec: str):
+    name, _, flag = spec.partition(":")
+    return name, flag == "int8"
+
+def time_backend(model, images, batch_size: int) -> tuple:
+    """Returns (best seconds per image, coverage dict per image) for one loaded model."""
+    from src.tools.vision_tool import _coverage_from_result
+
+    model(images[:1], verbose=False)  # warm-up
+    best = float("inf")
+    results = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        results = []
+        for i in range(0, len(images), batch_size):
+            results.extend(model(images[i:i + batch_size], verbose=False))
+        best = min(best, (time.perf_counter() - start) / len(images))
+    coverages = [_coverage_from_result(r, *img.shape[:2]) for r, img in zip(results, images)]
+    return best, coverages
+
+def coverage_error(coverages: list, reference: list) -> tuple:
+    """Mean and max absolute difference, in percentage points, over every metric of every image."""
+    diffs = [abs(c[k] - r[k]) for c, r in zip(coverages, reference) for k in r]
+    return sum(diffs) / len(diffs), max(diffs)
+
+def main():
+    from src.model_export import EXPORT_BACKENDS, load_exported
+    from src.tools.vision_tool import MODEL_PATH, load_model
+
+    parser = argparse.ArgumentParser(description="Compare YOLO inference backends.")
+    parser.add_argument("--backends", nargs="+", default=DEFAULT_BACKENDS, help='e.g. "onnx" or "openvino:int8".')
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("-o", "--output", default="./outputs/bench_backends.json")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(IMAGES_GLOB))
+    images = [cv2.imread(p) for p in paths]
+    print(f"{len(images)} images from {IMAGES_GLOB}\n")
+
+    rows = []
+    reference = None
+    reference_s = None
+    reference_task = None
+    for spec in args.backends:
+        backend, int8 = parse_backend(spec)
+        try:
+            start = time.perf_counter()
+            # No silent PyTorch fallback here, or the comparison would be meaningless
+            model = load_exported(MODEL_PATH, backend, int8) if backend in EXPORT_BACKENDS else load_model(backend)
+            load_s = time.perf_counter() - start
+            per_image_s, coverages = time_backend(model, images, args.batch_size)
+        except Exception as e:
+            print(f"{spec:<16} skipped: {e}")
+            rows.append({"backend": spec, "error": str(e)})
+            continue
+        if reference is None:
+            reference, reference_s, reference_task = coverages, per_image_s, model.task
+        elif model.task != reference_task:
+            # A detect-only export would silently drop the masks the coverage uses
+            print(f"{spec:<16} skipped: runs as {model.task}, the reference as {reference_task}")
+            rows.append({"backend": spec, "error": f"task {model.task} != {reference_task}"})
+            continue
+        mean_err, max_err = coverage_error(coverages, reference)
+        rows.append({
+            "backend": spec,
+            "task": model.task,
+            "load_s": round(load_s, 2),
+            "ms_per_image": round(per_image_s * 1000, 2),
+            "speedup": round(reference_s / per_image_s, 2),
+            "mean_abs_error_pp": round(mean_err, 3),
+            "max_abs_error_pp": round(max_err, 3),
+        })
+
+    print(f"{'backend':<16} | {'ms/img':>8} | {'speedup':>7} | {'mean err pp':>11} | {'max err pp':>10}")
+    for row in rows:
+        if "error" not in row:
+            print(
+                f"{row['backend']:<16} | {row['ms_per_image']:>8.2f} | {row['speedup']:>7.2f} | "
+                f"{row['mean_abs_error_pp']:>11.3f} | {row['max_abs_error_pp']:>10.3f}"
+            )
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({"images": paths, "batch_size": args.batch_size, "backends": rows}, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
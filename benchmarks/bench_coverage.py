@@ -0,0 +1,57 @@
+# benchmarks/bench_coverage.py
+#
+# Compares the old per-box area loop from vision_tool against the vectorized
+# union-area engine in src/coverage.py on synthetic site plans.
+#
+#   python -m benchmarks.bench_coverage
+
+import time
+import numpy as np
+from src.coverage import union_area, union_area_raster
+
+IMAGE_SIZE = (1024, 1024)
+BOX_COUNTS = [10, 100, 256, 1000, 5000]
+REPEATS = 5
+
+def legacy_box_sum(boxes: np.ndarray) -> float:
+    """The original yolo_site_analyzer loop: sums box areas one at a time."""
+    total = 0
+    for box in boxes:
+        x1, y1, x2, y2 = box
+        total += (x2 - x1) * (y2 - y1)
+    return float(total)
+
+def random_boxes(count: int, height: int, width: int, rng) -> np.ndarray:
+    """Random, heavily overlapping boxes similar to a dense plan."""
+    x1 = rng.uniform(0, width * 0.9, count)
+    y1 = rng.uniform(0, height * 0.9, count)
+    w = rng.uniform(10, width * 0.2, count)
+    h = rng.uniform(10, height * 0.2, count)
+    return np.stack([x1, y1, np.minimum(x1 + w, width), np.minimum(y1 + h, height)], axis=1)
+
+def time_call(fn, *args) -> tuple:
+    """Returns (best wall time in ms, result) over REPEATS runs."""
+    best, result = float("inf"), None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+def main():
+    H, W = IMAGE_SIZE
+    total = H * W
+    rng = np.random.default_rng(0)
+    print(f"{'boxes':>6} | {'legacy ms':>9} {'legacy %':>9} | {'exact ms':>9} {'exact %':>8} | {'raster ms':>9} {'raster %':>8}")
+    for count in BOX_COUNTS:
+        boxes = random_boxes(count, H, W, rng)
+        legacy_ms, legacy = time_call(legacy_box_sum, boxes)
+        exact_ms, exact = time_call(union_area, boxes, H, W, "exact")
+        raster_ms, raster = time_call(union_area_raster, boxes, H, W)
+        print(
+            f"{count:>6} | {legacy_ms:>9.2f} {legacy / total * 100:>9.1f} | "
+            f"{exact_ms:>9.2f} {exact / total * 100:>8.2f} | {raster_ms:>9.2f} {raster / total * 100:>8.2f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# benchmarks/bench_rules.py
+#
+# Times the compiled rule engine on the shipped rulebook and on a synthetic
+# rulebook with thousands of rules spread across zones and metrics.
+#
+#   python -m benchmarks.bench_rules
+
+import time
+from src.rules import Rule, RuleEngine, MIN, MAX
+
+ANALYSIS = {"green_cover_percentage": 12.5, "building_footprint_percentage": 35.0}
+RULE_COUNTS = [100, 1000, 10000]
+ZONES = 50
+METRICS = 200
+REPEATS = 1000
+
+def synthetic_rules(count: int) -> list:
+    """Rules spread over ZONES zones and METRICS metrics, two of which the analysis reports."""
+    metrics = list(ANALYSIS) + [f"metric_{i}" for i in range(METRICS - len(ANALYSIS))]
+    return [
+        Rule(
+            id=f"R-{i}",
+            metric=metrics[i % len(metrics)],
+            threshold=float(i % 50),
+            direction=MIN if i % 2 else MAX,
+            unit="%",
+            zone=None if i % 10 == 0 else f"zone-{i % ZONES}",
+        )
+        for i in range(count)
+    ]
+
+def time_evaluate(engine: RuleEngine, zone=None) -> float:
+    """Mean microseconds per evaluate() call."""
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        engine.evaluate(ANALYSIS, zone)
+    return (time.perf_counter() - start) / REPEATS * 1e6
+
+def main():
+    engine = RuleEngine.from_file()
+    print(f"shipped rulebook ({len(engine.rules)} rules): {time_evaluate(engine):.1f} µs/eval")
+    for count in RULE_COUNTS:
+        engine = RuleEngine(synthetic_rules(count))
+        print(f"{count:>6} rules, {ZONES} zones: {time_evaluate(engine, 'zone-3'):.1f} µs/eval")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# benchmarks/bench_scheduler.py
+#
+# Drives the real OpenAI clients (chat, embeddings and DALL-E, through
+# src/scheduler.py) against the rate-limited fake server in
+# benchmarks/fake_openai_server.py. Interactive and batch callers share the
+# same limits and part of the workload repeats identical requests, so the run
+# shows 429s avoided, requests coalesced and how each lane's latency holds up.
+#
+#   python -m benchmarks.bench_scheduler
+#   python -m benchmarks.bench_scheduler --no-scheduler   # direct calls, for comparison
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_OUTPUT = "./outputs/bench_scheduler.json"
+CHAT_MODEL = "gpt-4o"
+EMBEDDING_MODEL = "text-embedding-3-small"
+IMAGE_MODEL = "dall-e-3"
+
+def percentile(values, pct):
+    from benchmarks.bench_suite import percentile as nearest_rank
+    return nearest_rank(values, pct) if values else 0.0
+
+def configure(args, server_url: str):
+    """Points the OpenAI SDK at the fake server. Must run before anything under src/ is imported."""
+    os.environ["OPENAI_BASE_URL"] = f"{server_url}/v1"
+    os.environ["OPENAI_API_KEY"] = "sk-fake-server"
+    os.environ["LLM_BACKEND"] = "openai"
+    os.environ["IMAGE_BACKEND"] = "openai"
+    os.environ["DESIGN_CACHE_MODE"] = "bypass"
+    os.environ["OPENAI_SCHEDULER"] = "off" if args.no_scheduler else "on"
+    os.environ["OPENAI_RATE_LIMITS"] = f"{CHAT_MODEL}={args.rpm},{EMBEDDING_MODEL}={args.rpm},{IMAGE_MODEL}={args.image_rpm}"
+    os.environ["OPENAI_BACKOFF_MAX_S"] = "5"
+
+def build_workload(requests: int, duplicate_ratio: float) -> list:
+    """(lane, kind, payload) tuples; a share of them repeat the same payload."""
+    from src.scheduler import BATCH, INTERACTIVE
+    kinds = ["chat"] * 6 + ["embedding"] * 3 + ["image"]
+    duplicates = int(requests * duplicate_ratio)
+    work = []
+    for i in range(requests):
+        kind = kinds[i % len(kinds)]
+        payload = f"shared {kind} request" if i < duplicates else f"{kind} request {i}"
+        work.append((INTERACTIVE if i % 4 == 0 else BATCH, kind, payload))
+    # Interleave the duplicates with the rest so they are in flight together
+    return work[::2] + work[1::2]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the OpenAI request scheduler against a fake server.")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--rpm", type=int, default=600, help="Chat/embedding requests per minute (server and client).")
+    parser.add_argument("--image-rpm", type=int, default=120, help="Image requests per minute (server and client).")
+    parser.add_argument("--latency-ms", type=float, default=100, help="Server response latency.")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.25, help="Share of requests that repeat one payload.")
+    parser.add_argument("--no-scheduler", action="store_true", help="Call OpenAI directly (OPENAI_SCHEDULER=off).")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    from benchmarks.fake_openai_server import FakeOpenAIServer
+    server = FakeOpenAIServer(
+        rpm=args.rpm, limits={IMAGE_MODEL: args.image_rpm}, latency_ms=args.latency_ms
+    ).start()
+    configure(args, server.url)
+
+    from src.agents import llm
+    from src.metrics import registry
+    from src.scheduled_openai import ScheduledOpenAIEmbeddings
+    from src.scheduler import LANE_NAMES, lane
+    from src.tools.design_tool import render_design
+
+    # Without the on-disk cache, and sending text rather than tiktoken ids
+    embeddings = ScheduledOpenAIEmbeddings(model=EMBEDDING_MODEL, check_embedding_ctx_length=False)
+    calls = {
+        "chat": lambda text: llm.invoke(text),
+        "embedding": lambda text: embeddings.embed_query(text),
+        "image": lambda text: render_design(text),
+    }
+
+    def run_one(item) -> dict:
+        priority, kind, payload = item
+        start = time.perf_counter()
+        try:
+            with lane(priority):
+                calls[kind](payload)
+            error = None
+        except Exception as e:
+            error = type(e).__name__
+        return {"lane": LANE_NAMES[priority], "kind": kind, "seconds": time.perf_counter() - start, "error": error}
+
+    work = build_workload(args.requests, args.duplicate_ratio)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(run_one, work))
+    elapsed = time.perf_counter() - start
+    server_stats = server.stats()
+    server.stop()
+
+    counters = registry.to_dict()["counters"]
+    metrics = {
+        "calls": len(results),
+        "failed_calls": sum(1 for r in results if r["error"]),
+        "elapsed_s": round(elapsed, 2),
+        "server_requests": sum(server_stats["requests"].values()),
+        "server_429s": sum(server_stats["rate_limited"].values()),
+        "server_duplicate_requests": server_stats["duplicate_requests"],
+        "coalesced": int(sum(s["value"] for s in counters.get("openai_coalesced_total", []))),
+        "retries": int(sum(s["value"] for s in counters.get("openai_retries_total", []))),
+    }
+    for lane_name in LANE_NAMES.values():
+        seconds = [r["seconds"] for r in results if r["lane"] == lane_name and not r["error"]]
+        metrics[f"{lane_name}.p50_s"] = round(percentile(seconds, 50), 3)
+        metrics[f"{lane_name}.p95_s"] = round(percentile(seconds, 95), 3)
+
+    for name, value in metrics.items():
+        print(f"{name:<28} {value}")
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({"config": vars(args), "metrics": metrics}, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
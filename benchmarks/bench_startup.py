@@ -0,0 +1,42 @@
+# benchmarks/bench_startup.py
+#
+# Measures how long it takes to import each entry point in a fresh
+# interpreter, with lazy resources (default) and with every registered
+# resource forced to load right after import (the old eager behaviour).
+#
+#   python -m benchmarks.bench_startup
+
+import subprocess
+import sys
+import time
+
+ENTRY_POINTS = ["main", "test_tool", "streamlit_app"]
+REPEATS = 3
+
+LAZY_SNIPPET = "import {module}"
+EAGER_SNIPPET = "import {module}; from src.resources import warm_up; warm_up(background=False)"
+
+def time_import(snippet: str) -> float:
+    """Best wall time in seconds for running `snippet` in a new interpreter."""
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-c", snippet], capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        if completed.returncode != 0:
+            raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+        best = min(best, elapsed)
+    return best
+
+def main():
+    print(f"{'entry point':<15} | {'lazy s':>8} | {'eager s':>8}")
+    for module in ENTRY_POINTS:
+        try:
+            lazy = time_import(LAZY_SNIPPET.format(module=module))
+            eager = time_import(EAGER_SNIPPET.format(module=module))
+            print(f"{module:<15} | {lazy:>8.2f} | {eager:>8.2f}")
+        except RuntimeError as e:
+            print(f"{module:<15} | failed: {e}")
+
+if __name__ == "__main__":
+    main()
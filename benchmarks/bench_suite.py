@@ -0,0 +1,318 @@
+# benchmarks/bench_suite.py
+#
+# Offline performance suite: runs the real workflow code against the fake
+# chat/embedding/image backends and the stub YOLO model from src/fakes.py, so
+# it needs no API key, network or GPU. Measures end-to-end throughput and
+# per-node latency, RAG build/query time and analyzer images/sec across image
+# and batch sizes, writes the results as JSON and checks them against
+# regression thresholds (exit code 1 on a regression).
+#
+#   python -m benchmarks.bench_suite
+#   python -m benchmarks.bench_suite --baseline outputs/bench_baseline.json --tolerance 0.25
+#
+# Pass --yolo-model <weights.pt> to benchmark a real (e.g. tiny) YOLO model
+# instead of the stub.
+
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+DEFAULT_THRESHOLDS = os.path.join(os.path.dirname(__file__), "thresholds.json")
+DEFAULT_OUTPUT = "./outputs/bench_results.json"
+
+IMAGE_SIZES = [512, 1024, 2048]
+BATCH_SIZES = [1, 4, 8, 16]
+ANALYZER_IMAGES = 32
+RAG_RULE_FILES = 20
+RAG_RULES_PER_FILE = 200
+RAG_QUERIES = ["green cover", "building footprint", "setback from roads", "water bodies", "parking"]
+
+def configure_backends(args):
+    """Selects the offline backends. Must run before anything under src/ is imported."""
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["IMAGE_BACKEND"] = "fake"
+    os.environ["RAG_EMBEDDINGS"] = "fake"
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["FAKE_IMAGE_LATENCY_MS"] = str(args.image_latency_ms)
+    # Every analysis and render must do the actual work
+    os.environ["ANALYSIS_MEMO"] = "off"
+    os.environ["DESIGN_CACHE_MODE"] = "bypass"
+    os.environ.setdefault("OPENAI_API_KEY", "sk-offline-benchmark")
+    if args.yolo_model:
+        os.environ["YOLO_MODEL_PATH"] = args.yolo_model
+    else:
+        os.environ["YOLO_BACKEND"] = "stub"
+
+def percentile(values, pct):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(pct / 100 * len(ordered))) - 1]
+
+# --- RAG ---
+def write_rule_corpus(directory: str, files: int, rules_per_file: int):
+    """Writes synthetic compliance_rules.json-style files to index."""
+    for f in range(files):
+        rules = [
+            {
+                "id": f"SYN-{f:03d}-{r:04d}",
+                "description": f"Synthetic rule {r} of zone {f}: {RAG_QUERIES[r % len(RAG_QUERIES)]} must stay within {r % 50 + 5} percent of the site area in zone {f}.",
+                "compliance_metric": "green_cover_percentage",
+                "threshold": r % 50 + 5,
+            }
+            for r in range(rules_per_file)
+        ]
+        with open(os.path.join(directory, f"rules_{f:03d}.json"), "w") as out:
+            json.dump({"rules": rules}, out)
+
+def bench_rag(workdir: str) -> tuple:
+    """Returns (metrics, retriever): cold build, no-op resync and query latency."""
+    from langchain_community.vectorstores import Chroma
+    from src.ingest import get_embeddings, find_sources, sync_vector_store, MANIFEST_NAME
+
+    corpus = os.path.join(workdir, "corpus")
+    store_dir = os.path.join(workdir, "chroma")
+    os.makedirs(corpus)
+    write_rule_corpus(corpus, RAG_RULE_FILES, RAG_RULES_PER_FILE)
+    sources = find_sources(corpus)
+    store = Chroma(persist_directory=store_dir, embedding_function=get_embeddings(os.path.join(workdir, "embedding_cache")))
+    manifest = os.path.join(store_dir, MANIFEST_NAME)
+
+    start = time.perf_counter()
+    stats = sync_vector_store(store, sources, manifest)
+    build_s = time.perf_counter() - start
+    start = time.perf_counter()
+    sync_vector_store(store, sources, manifest)
+    resync_s = time.perf_counter() - start
+
+    retriever = store.as_retriever()
+    latencies = []
+    for _ in range(5):
+        for query in RAG_QUERIES:
+            start = time.perf_counter()
+            retriever.invoke(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return {
+        "rag.build_s": round(build_s, 3),
+        "rag.resync_s": round(resync_s, 3),
+        "rag.chunks": stats["chunks_added"],
+        "rag.query_ms_p50": round(percentile(latencies, 50), 3),
+        "rag.query_ms_p95": round(percentile(latencies, 95), 3),
+        **bench_query_cache(workdir, store),
+        **bench_lexical(workdir, store, sources, manifest),
+    }, retriever
+
+def bench_query_cache(workdir: str, store) -> dict:
+    """Warm-query latency of the query cache in front of the store (see src/query_cache.py)."""
+    from src.query_cache import QueryCache
+    from src.tools.rag_tool import QUERY_CACHE_MAX_DISTANCE
+
+    cache = QueryCache(os.path.join(workdir, "query_cache.sqlite3"), 1024, 3600, QUERY_CACHE_MAX_DISTANCE)
+    for query in RAG_QUERIES:
+        embedding = store.embeddings.embed_query(query)
+        docs = store.similarity_search_by_vector(embedding)
+        cache.put(query, embedding, "\n---\n".join(doc.page_content for doc in docs))
+    latencies = []
+    for _ in range(200):
+        for query in RAG_QUERIES:
+            variant = f"  {query.upper()}. "  # normalizes to the cached key
+            start = time.perf_counter()
+            cache.get(variant)
+            latencies.append((time.perf_counter() - start) * 1_000_000)
+    hit_rate = cache.stats()["hit_rate"]
+    # Near misses: another rule ID or threshold. They are given the cached query's own
+    # embedding (the worst case, an embedder that can't tell them apart), so only the
+    # exact-term check stands between them and a wrong hit; paraphrases must still hit
+    false_hits, paraphrase_hits, pairs = 0, 0, 0
+    for query in RAG_QUERIES:
+        for cached, near_miss, paraphrase in (
+            (f"GRN-01 {query}", f"GRN-02 {query}", f"{query} under GRN-01"),
+            (f"{query} at most 40%", f"{query} at most 45%", f"{query} no more than 40.0%"),
+        ):
+            embedding = store.embeddings.embed_query(cached)
+            cache.put(cached, embedding, cached)
+            false_hits += cache.get_similar(near_miss, embedding) is not None
+            paraphrase_hits += cache.get_similar(paraphrase, embedding) == cached
+            pairs += 1
+    return {
+        "rag.cache_hit_us_p50": round(percentile(latencies, 50), 2),
+        "rag.cache_hit_us_p95": round(percentile(latencies, 95), 2),
+        "rag.cache_hit_rate": hit_rate,
+        "rag.cache_near_miss_hit_rate": round(false_hits / pairs, 3),
+        "rag.cache_paraphrase_hit_rate": round(paraphrase_hits / pairs, 3),
+    }
+
+def bench_lexical(workdir: str, store, sources: list, manifest: str) -> dict:
+    """Build time of the BM25 index beside a synced store, and rule ID lookup latency (see src/lexical_index.py)."""
+    from src.ingest import sync_vector_store
+    from src.lexical_index import LexicalIndex
+
+    index = LexicalIndex(os.path.join(workdir, "lexical.sqlite3"))
+    start = time.perf_counter()
+    sync_vector_store(store, sources, manifest, lexical_index=index)  # the store is current, so this only builds the index
+    build_s = time.perf_counter() - start
+    rule_ids = [f"SYN-{f:03d}-{r:04d}" for f in range(RAG_RULE_FILES) for r in range(0, RAG_RULES_PER_FILE, 37)]
+    latencies, found = [], 0
+    for rule_id in rule_ids:
+        start = time.perf_counter()
+        docs = index.search(rule_id, k=4)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found += bool(docs) and docs[0].page_content.startswith(rule_id)
+    return {
+        "rag.lexical_build_s": round(build_s, 3),
+        "rag.lexical_query_ms_p50": round(percentile(latencies, 50), 3),
+        "rag.lexical_query_ms_p95": round(percentile(latencies, 95), 3),
+        "rag.lexical_id_hit_rate": round(found / len(rule_ids), 3),
+    }
+
+# --- Analyzer ---
+def bench_analyzer() -> dict:
+    from src.fakes import fake_design_image
+    from src.tools.vision_tool import analyze_site_images, yolo_model
+
+    yolo_model.get()  # keep model loading out of the timings
+    metrics = {}
+    for size in IMAGE_SIZES:
+        images = [fake_design_image(f"analyzer benchmark {i}", size) for i in range(ANALYZER_IMAGES)]
+        analyze_site_images(images[:2], batch_size=2, use_memo=False)  # warm-up
+        for batch_size in BATCH_SIZES:
+            start = time.perf_counter()
+            analyze_site_images(images, batch_size=batch_size, use_memo=False)
+            elapsed = time.perf_counter() - start
+            metrics[f"analyzer.{size}px.batch{batch_size}.images_per_s"] = round(len(images) / elapsed, 2)
+    return metrics
+
+# --- End to End ---
+def bench_workflow(retriever, runs: int, workers: int) -> dict:
+    from src.metrics import registry, track_run
+    from src.tools.rag_tool import CHUNK_SEPARATOR, compress
+    from src.workflow import get_workflow, run_config
+
+    app = get_workflow()
+    briefs = [f"A mixed-use block number {i} with housing and a small park." for i in range(runs)]
+
+    def run_one(brief: str) -> dict:
+        with track_run() as run:
+            rag_context = compress(brief, CHUNK_SEPARATOR.join(doc.page_content for doc in retriever.invoke(brief)))
+            final_state = app.invoke({"user_request": brief, "rag_context": rag_context, "iteration_count": 0}, run_config())
+        return {"seconds": run.wall_seconds, "iterations": final_state["iteration_count"], "context_tokens_saved": run.context_tokens_saved}
+
+    run_one(briefs[0])  # warm-up: agents, graph and rulebook are built here
+    registry.reset()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(run_one, briefs))
+    elapsed = time.perf_counter() - start
+
+    seconds = [r["seconds"] for r in results]
+    metrics = {
+        "e2e.runs": runs,
+        "e2e.throughput_runs_per_min": round(runs / elapsed * 60, 2),
+        "e2e.p50_run_s": round(percentile(seconds, 50), 4),
+        "e2e.p95_run_s": round(percentile(seconds, 95), 4),
+        "e2e.mean_iterations": round(sum(r["iterations"] for r in results) / runs, 2),
+        "e2e.context_tokens_saved_per_run": round(sum(r["context_tokens_saved"] for r in results) / runs, 1),
+    }
+    for series in registry.to_dict()["histograms"].get("node_seconds", []):
+        node = series["labels"]["node"]
+        metrics[f"node.{node}.mean_ms"] = round(series["sum"] / series["count"] * 1000, 3)
+        metrics[f"node.{node}.calls"] = series["count"]
+    return metrics
+
+# --- Regression Checks ---
+def check_thresholds(metrics: dict, thresholds: dict) -> list:
+    """Absolute limits: `{"metric": {"max": x}}` and/or `{"min": y}`."""
+    failures = []
+    for name, limits in thresholds.items():
+        if name not in metrics:
+            continue
+        value = metrics[name]
+        if "max" in limits and value > limits["max"]:
+            failures.append(f"{name} = {value} is above the limit {limits['max']}")
+        if "min" in limits and value < limits["min"]:
+            failures.append(f"{name} = {value} is below the limit {limits['min']}")
+    return failures
+
+def check_baseline(metrics: dict, baseline: dict, thresholds: dict, tolerance: float) -> list:
+    """
+    Relative limits against a previous results file: a thresholded metric may
+    not get more than `tolerance` worse in the direction its threshold guards.
+    """
+    failures = []
+    for name, limits in thresholds.items():
+        if name not in metrics or name not in baseline:
+            continue
+        value, reference = metrics[name], baseline[name]
+        if "max" in limits and value > reference * (1 + tolerance):
+            failures.append(f"{name} = {value} regressed from {reference} (> {tolerance:.0%} worse)")
+        if "min" in limits and value < reference * (1 - tolerance):
+            failures.append(f"{name} = {value} regressed from {reference} (> {tolerance:.0%} worse)")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline performance benchmarks for the workflow.")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT, help="JSON file to write results to.")
+    parser.add_argument("--thresholds", default=DEFAULT_THRESHOLDS, help="JSON file of absolute metric limits.")
+    parser.add_argument("--baseline", help="Previous results file to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown vs. the baseline.")
+    parser.add_argument("--runs", type=int, default=20, help="End-to-end runs.")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent end-to-end runs.")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Simulated chat latency.")
+    parser.add_argument("--image-latency-ms", type=float, default=0.0, help="Simulated image generation latency.")
+    parser.add_argument("--yolo-model", help="Benchmark these YOLO weights instead of the stub model.")
+    parser.add_argument("--skip", nargs="*", default=[], choices=["rag", "analyzer", "e2e"], help="Sections to skip.")
+    args = parser.parse_args()
+    configure_backends(args)
+
+    metrics = {}
+    with tempfile.TemporaryDirectory(prefix="urbanplan-bench-") as workdir:
+        # The end-to-end runs query the store the RAG section builds
+        if "rag" not in args.skip or "e2e" not in args.skip:
+            print("--- RAG ---")
+            rag_metrics, retriever = bench_rag(workdir)
+            if "rag" not in args.skip:
+                metrics.update(rag_metrics)
+        if "analyzer" not in args.skip:
+            print("--- Analyzer ---")
+            metrics.update(bench_analyzer())
+        if "e2e" not in args.skip:
+            print("--- End to end ---")
+            metrics.update(bench_workflow(retriever, args.runs, args.workers))
+
+    with open(args.thresholds) as f:
+        thresholds = json.load(f)
+    failures = check_thresholds(metrics, thresholds)
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures += check_baseline(metrics, json.load(f)["metrics"], thresholds, args.tolerance)
+
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "thresholds", "baseline")},
+        "metrics": metrics,
+        "regressions": failures,
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    for name, value in metrics.items():
+        print(f"{name:<45} {value}")
+    print(f"\nResults written to {args.output}")
+    if failures:
+        print("\n--- ❌ REGRESSIONS ---")
+        for failure in failures:
+            print(failure)
+        sys.exit(1)
+    print("No regressions.")
+
+if __name__ == "__main__":
+    main()
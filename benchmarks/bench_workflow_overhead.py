@@ -0,0 +1,49 @@
+# benchmarks/bench_workflow_overhead.py
+#
+# Measures the per-iteration setup cost the shared workflow removes: building
+# the planner/critique/report agents on every node call vs. reusing the cached
+# ones, and compiling the graph per run vs. reusing the compiled workflow.
+# No OpenAI request is made; agents are only constructed.
+#
+#   python -m benchmarks.bench_workflow_overhead
+
+import os
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from src import agents
+from src.workflow import build_graph, get_workflow
+
+REPEATS = 50
+
+def per_call_ms(fn, repeats: int = REPEATS) -> float:
+    """Mean wall time of `fn()` in milliseconds."""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1000
+
+def rebuild_agents():
+    agents.create_planner_agent()
+    agents.create_critique_agent()
+    agents.create_report_agent()
+
+def cached_agents():
+    agents.get_planner_agent()
+    agents.get_critique_agent()
+    agents.get_report_agent()
+
+def main():
+    cached_agents()  # populate the caches once
+    get_workflow()
+    rows = [
+        ("agents per iteration", per_call_ms(rebuild_agents), per_call_ms(cached_agents)),
+        ("graph per run", per_call_ms(build_graph, repeats=10), per_call_ms(get_workflow)),
+    ]
+    print(f"{'setup':<22} | {'rebuilt ms':>10} | {'cached ms':>10}")
+    for name, rebuilt, cached in rows:
+        print(f"{name:<22} | {rebuilt:>10.3f} | {cached:>10.4f}")
+
+if __name__ == "__main__":
+    main()
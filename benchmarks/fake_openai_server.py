@@ -0,0 +1,214 @@
+# benchmarks/fake_openai_server.py
+#
+# A local stand-in for the OpenAI API (chat completions, embeddings and image
+# generation) with per-model rate limits that answer 429 + Retry-After like
+# the real service. Point the OpenAI SDK at it with OPENAI_BASE_URL to exercise
+# src/scheduler.py without a network or an API key.
+#
+#   python -m benchmarks.fake_openai_server --port 8765 --rpm 60
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=sk-fake python main.py
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBEDDING_SIZE = 64
+
+def _seed(text: str) -> int:
+    return int(hashlib.sha256(text.encode()).hexdigest()[:8], 16)
+
+def _message_text(messages: list) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        parts.append(content)
+    return "\n".join(parts)
+
+class _Limiter:
+    """Server-side token bucket per model (same shape as the client's, so limits line up)."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> float:
+        """Takes one request; returns 0, or the seconds until one is available."""
+        with self.lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.level >= 1:
+                self.level -= 1
+                return 0.0
+            return (1 - self.level) / self.rate
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # the default backlog of 5 refuses connections under concurrent load
+
+class FakeOpenAIServer:
+    """
+    Threaded HTTP server speaking enough of the OpenAI REST API for the
+    workflow. `rpm` limits every model (or pass `limits` per model); `stats`
+    counts requests, 429s and repeated request bodies.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, rpm: int = 0, limits: dict = None, latency_ms: float = 0):
+        self.rpm = rpm
+        self.limits = limits or {}
+        self.latency_ms = latency_ms
+        self._limiters = {}
+        self._images = {}
+        self._lock = threading.Lock()
+        self.requests = Counter()
+        self.rate_limited = Counter()
+        self.bodies = Counter()
+        self.httpd = _Server((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "rate_limited": dict(self.rate_limited),
+                "duplicate_requests": sum(n - 1 for n in self.bodies.values()),
+            }
+
+    def _limit_wait(self, model: str) -> float:
+        per_minute = self.limits.get(model, self.rpm)
+        if not per_minute:
+            return 0.0
+        with self._lock:
+            limiter = self._limiters.setdefault(model, _Limiter(per_minute))
+        return limiter.take()
+
+    # --- Endpoints ---
+    def chat(self, body: dict) -> dict:
+        from src.fakes import _plain_reply, _tool_arguments
+        text = _message_text(body.get("messages", []))
+        message = {"role": "assistant", "content": None}
+        if body.get("tools"):
+            function = body["tools"][0]["function"]
+            args = _tool_arguments(function["parameters"].get("properties", {}), text)
+            completion = json.dumps(args)
+            message["tool_calls"] = [
+                {"id": f"call_{_seed(text):08x}", "type": "function", "function": {"name": function["name"], "arguments": completion}}
+            ]
+        else:
+            completion = _plain_reply(text)
+            message["content"] = completion
+        prompt_tokens, completion_tokens = len(text) // 4, len(completion) // 4
+        return {
+            "id": f"chatcmpl-{_seed(text):08x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if body.get("tools") else "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def embeddings(self, body: dict) -> dict:
+        import numpy as np
+        inputs = body.get("input")
+        inputs = [inputs] if isinstance(inputs, (str, int)) or (inputs and isinstance(inputs[0], int)) else inputs
+        data = []
+        for index, item in enumerate(inputs):
+            vector = np.random.default_rng(_seed(json.dumps(item))).normal(size=EMBEDDING_SIZE)
+            data.append({"object": "embedding", "index": index, "embedding": (vector / np.linalg.norm(vector)).tolist()})
+        tokens = sum(len(json.dumps(item)) // 4 for item in inputs)
+        return {"object": "list", "data": data, "model": body.get("model"), "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    def images(self, body: dict) -> dict:
+        name = f"{_seed(body.get('prompt', '')):08x}.png"
+        with self._lock:
+            self._images[name] = body.get("prompt", "")
+        return {"created": int(time.time()), "data": [{"url": f"{self.url}/files/{name}", "revised_prompt": body.get("prompt")}]}
+
+    def image_file(self, name: str) -> bytes:
+        from src.fakes import fake_design_png
+        with self._lock:
+            prompt = self._images.get(name)
+        return None if prompt is None else fake_design_png(prompt, latency_ms=0)
+
+    def _handler(self):
+        server = self
+        routes = {"/v1/chat/completions": server.chat, "/v1/embeddings": server.embeddings, "/v1/images/generations": server.images}
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, payload: bytes, content_type: str = "application/json", headers: dict = None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                if self.path.startswith("/files/"):
+                    data = server.image_file(self.path[len("/files/"):])
+                    if data is not None:
+                        return self._send(200, data, "image/png")
+                self._send(404, b'{"error": {"message": "Not found"}}')
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                body = json.loads(raw or b"{}")
+                route = routes.get(self.path)
+                if route is None:
+                    return self._send(404, b'{"error": {"message": "Not found"}}')
+                model = body.get("model", "unknown")
+                with server._lock:
+                    server.requests[model] += 1
+                    server.bodies[raw] += 1
+                wait = server._limit_wait(model)
+                if wait:
+                    with server._lock:
+                        server.rate_limited[model] += 1
+                    error = {"error": {"message": f"Rate limit reached for {model}.", "type": "requests", "code": "rate_limit_exceeded"}}
+                    return self._send(429, json.dumps(error).encode(), headers={"retry-after-ms": str(int(wait * 1000) + 1)})
+                if server.latency_ms:
+                    time.sleep(server.latency_ms / 1000)
+                self._send(200, json.dumps(route(body)).encode())
+
+        return Handler
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local fake OpenAI API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute per model (0 = unlimited).")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+    server = FakeOpenAIServer(args.host, args.port, args.rpm, latency_ms=args.latency_ms)
+    print(f"Fake OpenAI API on {server.url}/v1 (Ctrl+C to stop)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -3,148 +3,100 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # --- Now, import everything else ---
-import os
-from langgraph.graph import StateGraph, END
-from datetime import datetime
-from src.state import GraphState
-from src.agents import create_planner_agent, create_critique_agent, create_report_agent
+import argparse
+import json
 from src.tools.rag_tool import rag_compliance_lookup
-from src.tools.design_tool import generate_aerial_design
-from src.tools.vision_tool import yolo_site_analyzer
+from src.resources import warm_up
+from src.tools.vision_tool import ANALYZER_RESOURCE
+from src.checkpoint import new_run_id, list_runs
+from src.metrics import registry, track_run
+from src.workflow import (
+    get_workflow, run_config, run_state, next_nodes, awaiting_approval, submit_approval, show_design, ask_approval
+)
 
 
-# --- Define Graph Nodes ---
-def planner_node(state: GraphState) -> dict:
-    print("\n--- 🧠 PLANNER ---")
-    planner = create_planner_agent()
-    feedback = state.get("critique_feedback", "N/A")
-    if state.get("human_approval") == "no":
-        feedback += " The previous visual design was rejected by the user. Please generate a significantly different design."
-
-    planner_output = planner.invoke({
-        "user_request": state["user_request"],
-        "rag_context": state["rag_context"],
-        "critique_feedback": feedback
-    })
-    design = planner_output[0]
-    return {
-        "dalle_prompt": design.dalle_prompt,
-        "iteration_count": state["iteration_count"] + 1,
-        "human_approval": None # Reset human approval
-    }
-
-def designer_node(state: GraphState) -> dict:
-    print("\n--- 🎨 DESIGNER ---")
-    image_path = generate_aerial_design.invoke(state["dalle_prompt"])
-    return {"image_path": image_path}
-
-def human_in_the_loop_node(state: GraphState) -> dict:
-    print("\n--- 🧑‍⚖️ HUMAN APPROVAL ---")
-    print(f"Design image generated at: {state['image_path']}")
-    user_input = ""
-    while user_input.lower() not in ["yes", "no"]:
-        user_input = input("Approve the visual design? (yes/no): ")
-    return {"human_approval": user_input.lower()}
-
-def analyst_node(state: GraphState) -> dict:
-    print("\n--- 👁️ ANALYST ---")
-    analysis = yolo_site_analyzer.invoke(state["image_path"])
-    return {"analysis_results": analysis}
-
-def critique_node(state: GraphState) -> dict:
-    print("\n--- 🧐 CRITIQUE ---")
-    critique_agent = create_critique_agent()
-    critique_text = critique_agent.invoke({
-        "analysis_results": state["analysis_results"],
-        "rag_context": state["rag_context"]
-    }).content
-    print(f"Critique: {critique_text}")
-    if "FAIL" in critique_text.upper():
-        return {"critique_feedback": critique_text}
-    else:
-        return {"critique_feedback": "PASS"}
-
-def report_node(state: GraphState) -> dict:
-    print("\n--- 📝 REPORT ---")
-    report_agent = create_report_agent()
-    report_markdown = report_agent.invoke({
-        "user_request": state["user_request"],
-        "analysis_results": state["analysis_results"]
-    }).content
-    
-    final_report = report_markdown.replace("IMAGE_PATH_PLACEHOLDER", str(state["image_path"]))
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    report_path = f"./outputs/report_{timestamp}.md"
-    with open(report_path, "w") as f:
-        f.write(final_report)
-        
-    print(f"Final report saved to {report_path}")
-    print("\n--- FINAL REPORT ---")
-    print(final_report)
-    return {}
-
-# --- Define Conditional Edge Logic ---
-def after_critique_router(state: GraphState) -> str:
-    print("\n--- ❓ COMPLIANCE CHECK ---")
-    if state["critique_feedback"] == "PASS":
-        print("Decision: Design is compliant. Proceeding to report.")
-        return "report"
-    else:
-        if state["iteration_count"] >= 3:
-            print("Decision: Max iterations reached. Ending workflow.")
-            return "end"
-        print("Decision: Design is not compliant. Looping back to Planner.")
-        return "continue"
-
-def after_hitl_router(state: GraphState) -> str:
-    print("\n--- ❓ HUMAN DECISION ---")
-    if state["human_approval"] == "yes":
-        print("Decision: Human approved. Proceeding to analysis.")
-        return "analyst"
-    else:
-        print("Decision: Human rejected. Returning to Planner.")
-        return "planner"
-
-# --- Create and Compile the Graph ---
-def run_graph():
-    workflow = StateGraph(GraphState)
-
-    workflow.add_node("planner", planner_node)
-    workflow.add_node("designer", designer_node)
-    workflow.add_node("human_in_the_loop", human_in_the_loop_node)
-    workflow.add_node("analyst", analyst_node)
-    workflow.add_node("critique", critique_node)
-    workflow.add_node("report", report_node)
-
-    workflow.set_entry_point("planner")
-
-    workflow.add_edge("planner", "designer")
-    workflow.add_edge("designer", "human_in_the_loop")
-    workflow.add_conditional_edges(
-        "human_in_the_loop", after_hitl_router, {"analyst": "analyst", "planner": "planner"}
-    )
-    workflow.add_edge("analyst", "critique")
-    
-    workflow.add_conditional_edges(
-        "critique", after_critique_router, {"continue": "planner", "report": "report", "end": END}
-    )
-    
-    workflow.add_edge("report", END)
-
-    app = workflow.compile()
-
-    # --- Run the graph ---
-    user_request = "A small building in a large green park."
-    rag_context = rag_compliance_lookup.invoke(user_request)
-    inputs = {
-        "user_request": user_request,
-        "rag_context": rag_context,
-        "iteration_count": 0,
-    }
-    
-    for output in app.stream(inputs):
+def stream_run(app, inputs, config):
+    for output in app.stream(inputs, config):
         for key, value in output.items():
             print(f"Node '{key}' output received.")
+            if value and value.get("final_report"):
+                print("\n--- FINAL REPORT ---")
+                print(value["final_report"])
+
+def run_graph(run_id: str = None, resume: bool = False, approval: str = None):
+    """
+    Runs the workflow with every node checkpointed under `run_id`. With
+    `resume`, continues that run from its last completed node instead of
+    starting over; `approval` answers a pending approval without prompting.
+    """
+    # Load YOLO (or start the analysis pool) in the background while the RAG lookup, planner and DALL-E run
+    warm_up([ANALYZER_RESOURCE])
+    app = get_workflow(human_approval=True, durable=True)
+    run_id = run_id or new_run_id()
+    config = run_config(run_id=run_id)
+    print(f"--- Run ID: {run_id} ---")
+
+    run = None
+    try:
+        with track_run(run_id) as run:
+            if resume:
+                if not run_state(app, config):
+                    print(f"No checkpoint found for run {run_id}.")
+                    return
+                inputs = None
+            else:
+                # --- Run the graph ---
+                user_request = "A small building in a large green park."
+                rag_context = rag_compliance_lookup.invoke(user_request)
+                inputs = {
+                    "user_request": user_request,
+                    "rag_context": rag_context,
+                    "iteration_count": 0,
+                }
+            drive_run(app, inputs, config, run_id, approval)
+    except Exception as e:
+        # Every completed node is checkpointed, so nothing before the failure is redone
+        print(f"Run failed: {e}. Resume with: python main.py --resume {run_id}")
+        raise
+    finally:
+        if run is not None:
+            print("\n--- 📊 RUN METRICS ---")
+            print(json.dumps(run.to_dict(), indent=2))
+            print(f"Metrics exported to {registry.export()}")
+
+def drive_run(app, inputs, config, run_id: str, approval: str = None):
+    """Streams the run until it finishes, fails or waits for an approval nobody gives."""
+    # A run paused for approval picks up at the approval step, not inside it
+    if inputs is not None or not awaiting_approval(app, config):
+        stream_run(app, inputs, config)
+
+    while awaiting_approval(app, config):
+        print("\n--- 🧑‍⚖️ HUMAN APPROVAL ---")
+        show_design(run_state(app, config))
+        try:
+            decision = approval or ask_approval()
+        except EOFError:
+            print(f"\nRun paused for approval. Resume with: python main.py --resume {run_id}")
+            return
+        approval = None
+        submit_approval(app, config, decision)
+        stream_run(app, None, config)
+
+    if next_nodes(app, config):
+        print(f"Run stopped before '{next_nodes(app, config)[0]}'. Resume with: python main.py --resume {run_id}")
 
 if __name__ == "__main__":
-    run_graph()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the urban planning workflow.")
+    parser.add_argument("--run-id", help="ID to checkpoint a new run under (default: random)")
+    parser.add_argument("--resume", metavar="RUN_ID", help="continue a checkpointed run from its last completed node")
+    parser.add_argument("--approve", choices=["yes", "no"], help="answer a pending design approval without prompting")
+    parser.add_argument("--list-runs", action="store_true", help="print recently checkpointed run IDs and exit")
+    args = parser.parse_args()
+
+    if args.list_runs:
+        for run_id in list_runs():
+            print(run_id)
+    elif args.resume:
+        run_graph(args.resume, resume=True, approval=args.approve)
+    else:
+        run_graph(args.run_id, approval=args.approve)
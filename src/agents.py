@@ -1,65 +1,84 @@
 # src/agents.py
 
+import os
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 from pydantic import BaseModel, Field
+from typing import List
+from functools import lru_cache
 from langchain_core.output_parsers.openai_tools import PydanticToolsParser
+from src.metrics import TokenUsageHandler
 
 # --- LLM Setup ---
-llm = ChatOpenAI(model="gpt-4o", temperature=0.4)
+# Set LLM_BACKEND=fake to answer offline with src/fakes.py (for benchmarks)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+# Token usage of every call is recorded in src/metrics.py
+if LLM_BACKEND == "fake":
+    from src.fakes import FakeChatModel
+    llm = FakeChatModel(callbacks=[TokenUsageHandler()])
+else:
+    # Rate limited, retried and coalesced by src/scheduler.py
+    from src.scheduled_openai import ScheduledChatOpenAI
+    llm = ScheduledChatOpenAI(model="gpt-4o", temperature=0.4, callbacks=[TokenUsageHandler()])
 
 # --- Planner Pydantic Model ---
 class SimpleDesign(BaseModel):
     """A model to hold the DALL-E prompt for the site plan."""
     dalle_prompt: str = Field(description="A detailed DALL-E 3 prompt for generating a top-down, architectural site plan diagram.")
 
+class DesignVariants(BaseModel):
+    """A model to hold several alternative DALL-E prompts for the same site plan."""
+    dalle_prompts: List[str] = Field(min_length=1, description="Distinct, detailed DALL-E 3 prompts for top-down, architectural site plan diagrams, each taking a different approach to meeting the compliance rules.")
+
 # --- Agent Definitions ---
 
-def create_planner_agent():
-    """Creates the Planner agent that generates a DALL-E prompt based on rules and feedback."""
+def create_planner_agent(num_variants: int = 1):
+    """
+    Creates the Planner agent that generates a DALL-E prompt based on rules and feedback.
+    With `num_variants` > 1, it instead returns a `DesignVariants` with that many
+    alternative prompts, for rendering candidates in parallel.
+    """
+    if num_variants > 1:
+        output_tool = DesignVariants
+        task = f"exactly {num_variants} distinct, detailed DALL-E prompts that each take a different approach to the layout"
+    else:
+        output_tool = SimpleDesign
+        task = "a single, detailed DALL-E prompt"
     prompt = ChatPromptTemplate.from_messages(
         [
             (
                 "system",
-                """You are an expert urban planner. Your task is to convert a user's request, compliance rules, and critique feedback into a single, detailed DALL-E prompt.
+                f"""You are an expert urban planner. Your task is to convert a user's request, compliance rules, and critique feedback into {task}.
                 
                 **Crucially, if you receive feedback about a compliance failure (e.g., "green cover is too low"), you MUST dramatically alter the new prompt to fix that specific issue.** For example, if green space is too low, use phrases like "a vast central park," "extensive green spaces," "covered in lush greenery," or "buildings are secondary to the large park."
                 
-                You MUST respond by calling the `SimpleDesign` tool.
+                You MUST respond by calling the `{output_tool.__name__}` tool.
                 """,
             ),
             ("human", "User Request: {user_request}\n\nRetrieved Compliance Rules:\n---\n{rag_context}\n---\n\nCritique/Feedback from Previous Attempt: {critique_feedback}"),
         ]
     )
-    planner_llm = llm.bind_tools(tools=[SimpleDesign], tool_choice="SimpleDesign")
-    planner_runnable = prompt | planner_llm | PydanticToolsParser(tools=[SimpleDesign])
+    planner_llm = llm.bind_tools(tools=[output_tool], tool_choice=output_tool.__name__)
+    planner_runnable = prompt | planner_llm | PydanticToolsParser(tools=[output_tool])
     return planner_runnable
 
 def create_critique_agent():
     """
     Creates the Critique agent.
-    This agent's job is now to compare the analysis results against
-    a fixed set of rules.
+    The PASS/FAIL decision is made by the rule engine in src/rules.py; this
+    agent only turns the list of violations into feedback for the Planner.
     """
     prompt = ChatPromptTemplate.from_messages(
         [
             (
                 "system",
-                """You are a strict compliance officer. Your task is to evaluate a design's analysis report.
-
-                **Compliance Rules:**
-                1.  `green_cover_percentage` must be >= 15
-                2.  `building_footprint_percentage` must be <= 40
+                """You are a strict compliance officer. A design has failed the compliance checks listed below.
 
                 **Your Task:**
-                1.  **Analyze**: Look at the `analysis_results` (e.g., `{'green_cover_percentage': 21.55, ...}`).
-                2.  **Compare**: Check if the results meet ALL the compliance rules defined above.
-                3.  **Decide**: If ALL rules are met, respond with the single word "PASS".
-                4.  **Feedback**: If ANY rule is violated, respond with "FAIL", followed by a concise, one-sentence feedback for the Planner on what to fix.
+                Respond with "FAIL", followed by a concise, one-sentence feedback for the Planner on what to fix.
+                Only mention the violations you are given; do not invent new rules or numbers.
                 """,
             ),
-            # This prompt ONLY expects the 'analysis_results' variable
-            ("human", "Analysis Results:\n---\n{analysis_results}\n---"),
+            ("human", "Violations:\n---\n{violations}\n---"),
         ]
     )
     critique_runnable = prompt | llm
@@ -84,4 +103,20 @@ def create_report_agent():
         ]
     )
     report_runnable = prompt | llm
-    return report_runnable
\ No newline at end of file
+    return report_runnable
+
+# --- Cached Agents ---
+# Prompt templates and bound runnables are stateless, so each configuration is
+# built once per process and shared by every node execution and thread.
+
+@lru_cache(maxsize=None)
+def get_planner_agent(num_variants: int = 1):
+    return create_planner_agent(num_variants)
+
+@lru_cache(maxsize=None)
+def get_critique_agent():
+    return create_critique_agent()
+
+@lru_cache(maxsize=None)
+def get_report_agent():
+    return create_report_agent()
@@ -0,0 +1,100 @@
+# src/analysis_cache.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def sha256_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Hashes a file in chunks so large weight files aren't read into memory at once."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class AnalysisMemo:
+    """
+    Persistent memo of YOLO analysis results in SQLite, keyed by the hash of the
+    image bytes and a model key (the hash of the weights file plus anything else
+    that changes the result). Updating the weights changes the model key, so
+    stale entries are simply never looked up again.
+
+    Safe to share between threads and between processes: each thread gets its
+    own connection, and the database runs in WAL mode with a busy timeout.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS analyses (
+                    image_hash TEXT NOT NULL,
+                    model_key TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    PRIMARY KEY (image_hash, model_key)
+                )"""
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, image_hash: str, model_key: str) -> Optional[dict]:
+        """Returns the memoized result, or None on a miss."""
+        row = self._connection().execute(
+            "SELECT result FROM analyses WHERE image_hash = ? AND model_key = ?",
+            (image_hash, model_key),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def get_many(self, image_hashes: Iterable[str], model_key: str) -> Dict[str, dict]:
+        """Returns memoized results for every hash that has one."""
+        found = {}
+        for image_hash in set(image_hashes):
+            result = self.get(image_hash, model_key)
+            if result is not None:
+                found[image_hash] = result
+        return found
+
+    def put_many(self, entries: List[Tuple[str, dict]], model_key: str):
+        """Stores `(image_hash, result)` pairs in a single transaction."""
+        if not entries:
+            return
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO analyses (image_hash, model_key, result) VALUES (?, ?, ?)",
+                [(image_hash, model_key, json.dumps(result)) for image_hash, result in entries],
+            )
+
+    def put(self, image_hash: str, model_key: str, result: dict):
+        self.put_many([(image_hash, result)], model_key)
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
@@ -0,0 +1,173 @@
+# src/analysis_pool.py
+#
+# A pool of analyzer processes. YOLO inference is CPU-heavy and holds the GIL
+# in places, so running it in the same process as the LLM calls and the
+# Streamlit script serializes the two. Each worker process loads the model
+# once, then runs analyze_site_images for whatever is submitted to it.
+
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List
+from src.resources import register
+
+# --- Pool Settings ---
+# Number of analyzer processes; 0 runs the analysis in the calling process instead
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "0"))
+# Torch/OpenCV threads inside each worker; by default the cores are split evenly
+ANALYSIS_THREADS_PER_WORKER = int(
+    os.getenv("ANALYSIS_THREADS_PER_WORKER", str(max(1, (os.cpu_count() or 1) // max(1, ANALYSIS_WORKERS))))
+)
+# Submissions allowed in flight before submit() blocks (back-pressure)
+ANALYSIS_QUEUE_SIZE = int(os.getenv("ANALYSIS_QUEUE_SIZE", str(max(1, ANALYSIS_WORKERS) * 4)))
+# Analyses worth running at once by default (async analysis threads, batch CPU
+# stages, Streamlit job workers). Without a pool they share one in-process
+# model whose inference is serialized, so extra concurrency would only queue up
+DEFAULT_ANALYSIS_CONCURRENCY = 2 if ANALYSIS_WORKERS > 0 else 1
+# Seconds submit() waits for a free slot before raising QueueFullError; unset waits forever
+ANALYSIS_SUBMIT_TIMEOUT = float(os.getenv("ANALYSIS_SUBMIT_TIMEOUT")) if os.getenv("ANALYSIS_SUBMIT_TIMEOUT") else None
+
+class QueueFullError(RuntimeError):
+    """Raised when no submission slot frees up within the submit timeout."""
+
+# --- Worker Side ---
+_in_worker = False
+
+def in_worker() -> bool:
+    """True inside an analyzer process, where analysis must run inline."""
+    return _in_worker
+
+def _init_worker(threads: int):
+    """Runs once per worker process: caps its threads and loads the model."""
+    global _in_worker
+    _in_worker = True
+    # Must be set before torch is imported, or its thread pools are already sized
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    import cv2
+    cv2.setNumThreads(threads)
+    from src.tools.vision_tool import YOLO_BACKEND, yolo_model
+    if YOLO_BACKEND != "stub":
+        import torch
+        torch.set_num_threads(threads)
+    yolo_model.get()
+
+def _analyze_in_worker(images: list, batch_size: int) -> tuple:
+    """
+    Returns (analyses, seconds spent in inference, images inferred) so the
+    caller can record them; memo hits never reach the model and aren't counted.
+    """
+    from src.metrics import track_run
+    from src.tools.vision_tool import analyze_site_images
+    with track_run() as run:
+        analyses = analyze_site_images(images, batch_size)
+    return analyses, run.yolo_seconds, run.yolo_images
+
+def _ping() -> int:
+    return os.getpid()
+
+# --- Pool ---
+class AnalysisPool:
+    """
+    Process pool for image analysis with a bounded submission queue. At most
+    `queue_size` submissions are in flight; further submit() calls block until
+    one finishes, so a burst of runs can't pile up unbounded images in memory.
+    Thread-safe.
+    """
+
+    def __init__(
+        self,
+        workers: int = ANALYSIS_WORKERS,
+        threads_per_worker: int = ANALYSIS_THREADS_PER_WORKER,
+        queue_size: int = ANALYSIS_QUEUE_SIZE,
+    ):
+        self.workers = max(1, workers)
+        self.threads_per_worker = threads_per_worker
+        self.queue_size = queue_size
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._generation = 0
+        self._executor = self._start_executor()
+
+    def _start_executor(self) -> ProcessPoolExecutor:
+        # "spawn" rather than fork: the parent has threads (UI, writers) that fork would copy mid-state
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.threads_per_worker,),
+        )
+
+    def warm(self) -> List[int]:
+        """
+        Sends one no-op per worker so processes start (and load the model) now
+        rather than on the first analysis. Returns the PIDs that answered; the
+        executor may reuse an already started worker for some of them.
+        """
+        futures = [self._executor.submit(_ping) for _ in range(self.workers)]
+        return sorted({f.result() for f in futures})
+
+    def submit(self, images: list, batch_size: int, timeout: float = ANALYSIS_SUBMIT_TIMEOUT) -> Future:
+        """
+        Queues analyze_site_images(images, batch_size) on a worker.
+        Args:
+            images: Paths, ImageArtifacts or BGR arrays; they are pickled to the worker.
+            timeout: Seconds to wait for a free slot; None waits as long as it takes.
+        Returns:
+            A future resolving to (analyses, inference seconds, images inferred).
+        Raises:
+            QueueFullError: If no slot frees up within `timeout`.
+        """
+        if self._closed:
+            raise RuntimeError("The analysis pool has been shut down.")
+        if not self._slots.acquire(timeout=timeout):
+            raise QueueFullError(f"Analysis queue is full ({self.queue_size} submissions in flight).")
+        try:
+            with self._lock:
+                future = self._executor.submit(_analyze_in_worker, images, batch_size)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def analyze(self, images: list, batch_size: int) -> List[dict]:
+        """Blocking submit; restarts the pool once if a worker died (e.g. killed for memory)."""
+        from src.metrics import record_yolo
+        generation = self._generation
+        try:
+            analyses, yolo_seconds, yolo_images = self.submit(images, batch_size).result()
+        except BrokenProcessPool:
+            self._restart(generation)
+            analyses, yolo_seconds, yolo_images = self.submit(images, batch_size).result()
+        if yolo_images:
+            record_yolo(yolo_seconds, yolo_images)
+        return analyses
+
+    def _restart(self, generation: int):
+        with self._lock:
+            if generation != self._generation:
+                return  # another caller already restarted it
+            self._generation += 1
+            print("An analysis worker died; restarting the analysis pool.")
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._start_executor()
+
+    def shutdown(self, wait: bool = True, cancel_pending: bool = False):
+        """Stops accepting work; by default lets queued analyses finish first."""
+        self._closed = True
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_pending)
+
+def _create_pool() -> AnalysisPool:
+    pool = AnalysisPool()
+    atexit.register(pool.shutdown)
+    print(f"Analysis pool: {pool.workers} workers x {pool.threads_per_worker} threads.")
+    pool.warm()
+    return pool
+
+# Started on first use; None when analysis runs inline (ANALYSIS_WORKERS=0)
+analysis_pool = register("analysis_pool", _create_pool) if ANALYSIS_WORKERS > 0 else None
@@ -0,0 +1,81 @@
+# src/artifacts.py
+
+import hashlib
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+import cv2
+import numpy as np
+
+# --- Background Writer ---
+# Encoded image bytes are written to disk off the hot path
+_writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix="artifact-writer")
+
+def _write_file(path: str, data: bytes) -> str:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return path
+
+class ImageArtifact:
+    """
+    A generated design image, decoded exactly once and carried through the
+    graph state. The analyzer and the UI both use `image` (a BGR array)
+    directly; `path` is where the encoded bytes are (or will shortly be) saved.
+    """
+
+    def __init__(self, path: str, image: np.ndarray, content_hash: str, persisted: Future):
+        self.path = path
+        self.image = image
+        self.content_hash = content_hash
+        self._persisted = persisted
+
+    @classmethod
+    def from_bytes(
+        cls,
+        data: bytes,
+        path: str,
+        persist: bool = True,
+        writer: Optional[Callable[[], str]] = None,
+    ) -> "ImageArtifact":
+        """
+        Decodes encoded image bytes once. With `persist`, the bytes are saved in
+        the background, by `writer` if given (it must return the final path) or
+        else straight to `path`. Without it, `path` must already hold the bytes.
+        """
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Image data could not be decoded.")
+        if persist:
+            persisted = _writer.submit(writer or (lambda: _write_file(path, data)))
+        else:
+            persisted = Future()
+            persisted.set_result(path)
+        return cls(path, image, hashlib.sha256(data).hexdigest(), persisted)
+
+    @classmethod
+    def from_file(cls, path: str) -> "ImageArtifact":
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read(), path, persist=False)
+
+    def wait_persisted(self, timeout: float = None) -> str:
+        """Blocks until the image is on disk and returns its path."""
+        return self._persisted.result(timeout)
+
+    def __getstate__(self) -> dict:
+        # Sent to analyzer processes (see src/analysis_pool.py); the pending write stays behind
+        return {"path": self.path, "image": self.image, "content_hash": self.content_hash}
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._persisted = Future()
+        self._persisted.set_result(self.path)
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    def __repr__(self) -> str:
+        h, w = self.image.shape[:2]
+        return f"ImageArtifact(path={self.path!r}, size={w}x{h})"
@@ -0,0 +1,176 @@
+# src/async_workflow.py
+
+import asyncio
+import os
+import time
+import uuid
+from typing import Callable, Dict, Optional
+from src.state import GraphState
+from src.agents import get_planner_agent, get_report_agent
+from src.rules import acritique_analysis
+from src.tools.rag_tool import arag_compliance_lookup
+from src.tools.design_tool import AsyncClients, arender_design, use_async_clients
+from src.tools.vision_tool import aanalyze_site_image
+from src.fanout import adesign_candidates, aanalyze_candidates
+from src.workflow import (
+    DEFAULT_MAX_ITERATIONS, build_graph, design_error, planner_request, planner_update, run_config, save_report
+)
+
+# --- Runner Settings ---
+# How many runs one event loop drives at the same time
+MAX_CONCURRENT_RUNS = int(os.getenv("MAX_CONCURRENT_RUNS", "32"))
+
+# --- Async Graph Nodes ---
+async def planner_node(state: GraphState) -> dict:
+    num_variants, inputs = planner_request(state)
+    started = time.perf_counter()
+    planner_output = await get_planner_agent(num_variants).ainvoke(inputs)
+    return planner_update(state, planner_output, num_variants, started)
+
+async def designer_node(state: GraphState) -> dict:
+    if len(state.get("dalle_prompts") or []) > 1:
+        return await adesign_candidates(state)
+    try:
+        artifact = await arender_design(state["dalle_prompt"])
+    except Exception as e:
+        return design_error(e)
+    return {"image_path": artifact.path, "image_artifact": artifact}
+
+async def analyst_node(state: GraphState) -> dict:
+    if state.get("fanout_candidates"):
+        return await aanalyze_candidates(state)
+    analysis = await aanalyze_site_image(state.get("image_artifact") or state["image_path"])
+    return {"analysis_results": analysis}
+
+async def critique_node(state: GraphState) -> dict:
+    feedback, report = await acritique_analysis(state["analysis_results"])
+    return {"critique_feedback": feedback, "compliance_results": report.to_dict()}
+
+async def report_node(state: GraphState) -> dict:
+    report_message = await get_report_agent().ainvoke({
+        "user_request": state["user_request"],
+        "analysis_results": state["analysis_results"]
+    })
+    if state.get("image_artifact"):
+        await asyncio.to_thread(state["image_artifact"].wait_persisted)
+    return await asyncio.to_thread(save_report, state, report_message.content)
+
+ASYNC_NODES = {
+    "planner": planner_node,
+    "designer": designer_node,
+    "analyst": analyst_node,
+    "critique": critique_node,
+    "report": report_node,
+}
+
+def build_async_graph(max_iterations: int = DEFAULT_MAX_ITERATIONS):
+    """Compiles the shared workflow graph with the async nodes swapped in."""
+    return build_graph(max_iterations=max_iterations, nodes=ASYNC_NODES)
+
+# --- Runner ---
+class AsyncWorkflowRunner:
+    """
+    Drives many workflow runs concurrently on one event loop. Each run is an
+    asyncio task that can be cancelled by its run ID or bounded by a timeout
+    (counted from when it gets a slot); at most `max_concurrent_runs` are in
+    flight, the rest wait their turn.
+    Runs share the runner's asyncio OpenAI/HTTP clients, which are opened on
+    the first run and closed by aclose() (or leaving `async with`).
+    """
+
+    def __init__(self, max_concurrent_runs: int = MAX_CONCURRENT_RUNS, timeout_s: Optional[float] = None):
+        self.app = build_async_graph()
+        self.max_concurrent_runs = max_concurrent_runs
+        self.timeout_s = timeout_s
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._clients: Optional[AsyncClients] = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        """Cancels the runs still in flight and closes the runner's clients."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._clients is not None:
+            clients, self._clients = self._clients, None
+            await clients.aclose()
+
+    async def _stream(self, run_id: str, user_request: str, num_variants: Optional[int], on_event: Optional[Callable]) -> dict:
+        state = {
+            "user_request": user_request,
+            "rag_context": await arag_compliance_lookup(user_request),
+            "iteration_count": 0,
+            "num_variants": num_variants,
+        }
+        async for output in self.app.astream(state, run_config()):
+            for key, value in output.items():
+                state.update(value or {})
+                if on_event:
+                    on_event(run_id, key, value)
+        return state
+
+    async def _run(self, run_id: str, user_request: str, num_variants: Optional[int], timeout_s: Optional[float], on_event: Optional[Callable]) -> dict:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_runs)
+        if self._clients is None:
+            self._clients = AsyncClients()
+        # Set in this run's own task context, so its renders (and fan-out tasks) use the runner's clients
+        use_async_clients(self._clients)
+        async with self._semaphore:
+            # The timeout starts once the run has a slot, so time spent queued doesn't count
+            coroutine = self._stream(run_id, user_request, num_variants, on_event)
+            return await (asyncio.wait_for(coroutine, timeout_s) if timeout_s else coroutine)
+
+    async def run(
+        self,
+        user_request: str,
+        run_id: Optional[str] = None,
+        num_variants: Optional[int] = None,
+        timeout_s: Optional[float] = None,
+        on_event: Optional[Callable] = None,
+    ) -> dict:
+        """
+        Runs one brief to completion and returns its final state. Raises
+        asyncio.TimeoutError if it runs longer than the timeout (not counting
+        time queued for a slot) and CancelledError if cancelled.
+        """
+        return await self.submit(user_request, run_id, num_variants, timeout_s, on_event)
+
+    def submit(
+        self,
+        user_request: str,
+        run_id: Optional[str] = None,
+        num_variants: Optional[int] = None,
+        timeout_s: Optional[float] = None,
+        on_event: Optional[Callable] = None,
+    ) -> asyncio.Task:
+        """
+        Starts a run in the background and returns its task (must be called
+        inside the event loop). Raises ValueError if a run with the same ID is
+        still in flight.
+        """
+        run_id = run_id or uuid.uuid4().hex
+        if run_id in self._tasks:
+            raise ValueError(f"Run {run_id} is already in flight.")
+        timeout_s = timeout_s if timeout_s is not None else self.timeout_s
+        coroutine = self._run(run_id, user_request, num_variants, timeout_s, on_event)
+        task = asyncio.get_running_loop().create_task(coroutine, name=f"run-{run_id}")
+        self._tasks[run_id] = task
+        task.add_done_callback(lambda done: self._tasks.pop(run_id) if self._tasks.get(run_id) is done else None)
+        return task
+
+    def cancel(self, run_id: str) -> bool:
+        """Cancels an in-flight or queued run. Returns False if it isn't running."""
+        task = self._tasks.get(run_id)
+        return task.cancel() if task else False
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
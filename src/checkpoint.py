@@ -0,0 +1,127 @@
+# src/checkpoint.py
+
+import hashlib
+import os
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+from typing import List
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from src.artifacts import ImageArtifact
+from src.resources import register
+
+# --- Checkpoint Settings ---
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", "./outputs/checkpoints.sqlite3")
+
+ARTIFACT_MARKER = "__image_artifact__"
+HASH_FIELD = "sha256"
+# Decoded designs kept for rehydration (about 3 MB each at 1024x1024)
+REHYDRATE_CACHE_SIZE = int(os.getenv("CHECKPOINT_IMAGE_CACHE_SIZE", "16"))
+
+_decoded: "OrderedDict[tuple, ImageArtifact]" = OrderedDict()
+_decoded_lock = threading.Lock()
+
+def _dehydrate(value):
+    """Replaces every ImageArtifact in `value` with a reference to its file on disk."""
+    if isinstance(value, ImageArtifact):
+        # The decoded array is never stored; the checkpoint only needs the saved file
+        return {ARTIFACT_MARKER: value.wait_persisted(), HASH_FIELD: value.content_hash}
+    if isinstance(value, dict):
+        return {k: _dehydrate(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_dehydrate(v) for v in value]
+    if isinstance(value, tuple):
+        return tuple(_dehydrate(v) for v in value)
+    return value
+
+def _load_artifact(path: str, content_hash: str = None) -> ImageArtifact:
+    """
+    The ImageArtifact for a checkpointed design, decoded once and then served
+    from a small LRU keyed by path and content hash (every get_state
+    rehydrates the whole state). Raises FileNotFoundError if the file is gone
+    and ValueError if it no longer holds the checkpointed image.
+    """
+    key = (path, content_hash)
+    with _decoded_lock:
+        if content_hash and key in _decoded:
+            _decoded.move_to_end(key)
+            return _decoded[key]
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Checkpointed design {path} is missing; the run can't be resumed from this state.") from None
+    actual_hash = hashlib.sha256(data).hexdigest()
+    if content_hash and actual_hash != content_hash:
+        raise ValueError(f"Checkpointed design {path} was overwritten since the checkpoint was saved.")
+    key = (path, actual_hash)
+    with _decoded_lock:
+        artifact = _decoded.get(key)
+    if artifact is None:
+        artifact = ImageArtifact.from_bytes(data, path, persist=False)
+    with _decoded_lock:
+        _decoded[key] = artifact
+        _decoded.move_to_end(key)
+        while len(_decoded) > REHYDRATE_CACHE_SIZE:
+            _decoded.popitem(last=False)
+    return artifact
+
+def _rehydrate(value):
+    """Turns artifact references back into ImageArtifacts (see _load_artifact)."""
+    if isinstance(value, dict):
+        if ARTIFACT_MARKER in value and set(value) <= {ARTIFACT_MARKER, HASH_FIELD}:
+            return _load_artifact(value[ARTIFACT_MARKER], value.get(HASH_FIELD))
+        return {k: _rehydrate(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_rehydrate(v) for v in value]
+    if isinstance(value, tuple):
+        return tuple(_rehydrate(v) for v in value)
+    return value
+
+class ArtifactSerializer(JsonPlusSerializer):
+    """
+    LangGraph serializer that stores image artifacts by path. A resumed run
+    re-decodes the saved design instead of asking DALL-E for a new one.
+    """
+
+    def dumps(self, obj):
+        return super().dumps(_dehydrate(obj))
+
+    def loads(self, data):
+        return _rehydrate(super().loads(data))
+
+    def dumps_typed(self, obj):
+        return super().dumps_typed(_dehydrate(obj))
+
+    def loads_typed(self, data):
+        return _rehydrate(super().loads_typed(data))
+
+def create_checkpointer(path: str = CHECKPOINT_PATH):
+    """
+    Opens the SQLite checkpointer that persists the graph state after every
+    node, keyed by run ID (LangGraph's `thread_id`).
+    """
+    from langgraph.checkpoint.sqlite import SqliteSaver
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Shared by the Streamlit sessions and batch worker threads; SqliteSaver serializes access itself
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return SqliteSaver(conn, serde=ArtifactSerializer())
+
+# The checkpoint database is opened on first use
+checkpointer = register("checkpointer", create_checkpointer)
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+def list_runs(limit: int = 20) -> List[str]:
+    """Most recently checkpointed run IDs, newest first."""
+    # Read from the table directly: listing through the saver would rehydrate every
+    # checkpoint, and one whose design was deleted would fail the whole listing
+    rows = checkpointer.get().conn.execute(
+        "SELECT thread_id FROM checkpoints GROUP BY thread_id ORDER BY MAX(checkpoint_id) DESC LIMIT ?", (limit,)
+    ).fetchall()
+    return [run_id for (run_id,) in rows]
@@ -0,0 +1,188 @@
+# src/context_compression.py
+
+import math
+import os
+import re
+import zlib
+from collections import Counter
+from typing import List, NamedTuple
+import numpy as np
+
+# --- Compression Settings ---
+# Approximate prompt tokens the retrieved rules may take up
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "800"))
+# A chunk is a near-duplicate when at least this share of its shingles (estimated) is in a better-ranked chunk
+DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.8"))
+# Shortest suffix/prefix match taken as the splitter's chunk overlap rather than chance
+MIN_OVERLAP_CHARS = 40
+SHINGLE_WORDS = 5
+MINHASH_PERMUTATIONS = 64
+# Rank fusion constant: lower lets either ranking move a chunk further
+FUSION_K = 10
+# Below this many tokens of remaining budget, a chunk isn't worth truncating into it
+MIN_PARTIAL_TOKENS = 40
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with "
+    "what which who how should must can may i we you".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word and number terms without stopwords (also used for lexical scoring)."""
+    return [t for t in re.findall(r"[a-z0-9]+(?:\.[0-9]+)?", text.lower()) if t not in STOPWORDS]
+
+def estimate_tokens(text: str) -> int:
+    """Rough prompt-token count (about 4 characters each for English), without a tokenizer download."""
+    return math.ceil(len(text) / 4)
+
+class CompressedContext(NamedTuple):
+    chunks: List[str]
+    retrieved_tokens: int
+    tokens: int
+    merged: int
+    duplicates: int
+    dropped: int
+
+# --- Merging ---
+def _merge_pair(a: str, b: str):
+    """`a` followed by `b` if `b` starts with a suffix of `a` (or is inside it), else None."""
+    if b in a:
+        return a
+    probe = b[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return None
+    pos = a.find(probe)
+    while pos != -1:
+        tail = a[pos:]
+        if b.startswith(tail):
+            return a + b[len(tail):]
+        pos = a.find(probe, pos + 1)
+    return None
+
+def merge_overlapping(chunks: List[str]) -> List[str]:
+    """
+    Stitches chunks that overlap because the splitter repeats the end of one
+    chunk at the start of the next. A merged chunk takes the place of the
+    better-ranked of its parts.
+    """
+    chunks = list(chunks)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(chunks)):
+            for j in range(len(chunks)):
+                if i == j:
+                    continue
+                joined = _merge_pair(chunks[i], chunks[j])
+                if joined is not None:
+                    keep, drop = min(i, j), max(i, j)
+                    chunks[keep] = joined
+                    del chunks[drop]
+                    merged = True
+                    break
+            if merged:
+                break
+    return chunks
+
+# --- Near-Duplicates ---
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(1)
+_A = _rng.integers(1, _PRIME, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+def minhash(text: str):
+    """(MinHash signature, number of shingles) of the text's word shingles."""
+    words = re.findall(r"\w+", text.lower())
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = np.array([zlib.crc32(s.encode("utf-8")) for s in shingles], dtype=np.uint64)
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1), len(shingles)
+
+def _containment(a, b) -> float:
+    """Estimated share of `a`'s shingles that are also in `b`, from their Jaccard similarity and sizes."""
+    (sig_a, size_a), (sig_b, size_b) = a, b
+    jaccard = float(np.mean(sig_a == sig_b))
+    return min(1.0, jaccard * (size_a + size_b) / ((1 + jaccard) * size_a))
+
+def drop_near_duplicates(chunks: List[str], threshold: float = DEDUP_THRESHOLD) -> List[str]:
+    """Drops chunks that are mostly contained in an earlier (better-ranked) one."""
+    kept, signatures = [], []
+    for chunk in chunks:
+        signature = minhash(chunk)
+        if any(_containment(signature, other) >= threshold for other in signatures):
+            continue
+        kept.append(chunk)
+        signatures.append(signature)
+    return kept
+
+# --- Reranking ---
+def bm25_scores(query: str, chunks: List[str], k1: float = 1.2, b: float = 0.75) -> List[float]:
+    """BM25 score of each chunk for the query, with term statistics from the chunks themselves."""
+    terms = set(tokenize(query))
+    docs = [Counter(tokenize(chunk)) for chunk in chunks]
+    if not terms or not docs:
+        return [0.0] * len(chunks)
+    avg_len = sum(sum(d.values()) for d in docs) / len(docs) or 1.0
+    scores = []
+    for doc in docs:
+        length = sum(doc.values())
+        score = 0.0
+        for term in terms:
+            tf = doc.get(term, 0)
+            if tf:
+                df = sum(1 for d in docs if term in d)
+                idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_len))
+        scores.append(score)
+    return scores
+
+def rerank(query: str, chunks: List[str]) -> List[str]:
+    """Fuses the retrieval order with a BM25 ranking of the chunks that match the query (reciprocal rank fusion)."""
+    scores = bm25_scores(query, chunks)
+    lexical = sorted((i for i in range(len(chunks)) if scores[i] > 0), key=lambda i: -scores[i])
+    fused = {i: 1 / (FUSION_K + i) for i in range(len(chunks))}
+    for rank, i in enumerate(lexical):
+        fused[i] += 1 / (FUSION_K + rank)
+    return [chunks[i] for i in sorted(fused, key=lambda i: -fused[i])]
+
+# --- Packing ---
+def _truncate(chunk: str, tokens: int) -> str:
+    """The longest run of whole sentences of `chunk` that fits in `tokens`, or ''."""
+    limit = tokens * 4
+    cut = max(chunk.rfind(mark, 0, limit) for mark in (". ", ".\n", "; ", "\n"))
+    return chunk[:cut + 1].rstrip() if cut > 0 else ""
+
+def pack(chunks: List[str], budget: int) -> List[str]:
+    """Takes chunks in order while they fit the budget, trimming the first one that doesn't."""
+    packed, used = [], 0
+    for chunk in chunks:
+        cost = estimate_tokens(chunk)
+        if used + cost <= budget:
+            packed.append(chunk)
+            used += cost
+            continue
+        remaining = budget - used
+        if remaining >= MIN_PARTIAL_TOKENS:
+            partial = _truncate(chunk, remaining)
+            if partial:
+                packed.append(partial)
+                used += estimate_tokens(partial)
+    return packed
+
+def compress_context(query: str, chunks: List[str], budget: int = CONTEXT_TOKEN_BUDGET) -> CompressedContext:
+    """
+    Shrinks retrieved chunks (best first) for the prompt: stitches overlapping
+    chunks, reranks them against the query, drops near-duplicates and packs
+    what is left into `budget` tokens.
+    """
+    merged = merge_overlapping(chunks)
+    ranked = rerank(query, merged)
+    unique = drop_near_duplicates(ranked)
+    packed = pack(unique, budget)
+    return CompressedContext(
+        chunks=packed,
+        retrieved_tokens=sum(estimate_tokens(c) for c in chunks),
+        tokens=sum(estimate_tokens(c) for c in packed),
+        merged=len(chunks) - len(merged),
+        duplicates=len(ranked) - len(unique),
+        dropped=len(unique) - len(packed),
+    )
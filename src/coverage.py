@@ -0,0 +1,131 @@
+# src/coverage.py
+
+import cv2
+import numpy as np
+from typing import Dict, List, Optional
+
+# --- Coverage Settings ---
+# Resolution of the occupancy raster relative to the image (1.0 = full resolution)
+DEFAULT_RASTER_SCALE = 0.25
+# Above this many boxes, "auto" switches from the exact union to the raster
+EXACT_MAX_BOXES = 256
+
+def _as_boxes(boxes) -> np.ndarray:
+    """Returns an (N, 4) float64 array of x1, y1, x2, y2 boxes."""
+    boxes = np.asarray(boxes, dtype=np.float64)
+    return boxes.reshape(-1, 4)
+
+def _clip_boxes(boxes: np.ndarray, height: int, width: int) -> np.ndarray:
+    """Clips boxes to the image and drops the ones with no area left."""
+    boxes = boxes.copy()
+    boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, width)
+    boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, height)
+    keep = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+    return boxes[keep]
+
+def _covered_cells(ix1, iy1, ix2, iy2, rows: int, cols: int) -> np.ndarray:
+    """
+    Marks every cell covered by at least one box on a `rows` x `cols` grid using
+    a 2D difference array, so all boxes are painted in one vectorized pass.
+    """
+    diff = np.zeros((rows + 1, cols + 1), dtype=np.int32)
+    np.add.at(diff, (iy1, ix1), 1)
+    np.add.at(diff, (iy1, ix2), -1)
+    np.add.at(diff, (iy2, ix1), -1)
+    np.add.at(diff, (iy2, ix2), 1)
+    return diff.cumsum(axis=0).cumsum(axis=1)[:rows, :cols] > 0
+
+def union_area_exact(boxes) -> float:
+    """
+    Exact union area of axis-aligned boxes. The box edges are compressed into a
+    grid of distinct x/y coordinates, so overlapping boxes are counted once.
+    """
+    boxes = _as_boxes(boxes)
+    if len(boxes) == 0:
+        return 0.0
+    xs = np.unique(boxes[:, [0, 2]])
+    ys = np.unique(boxes[:, [1, 3]])
+    ix1, ix2 = np.searchsorted(xs, boxes[:, 0]), np.searchsorted(xs, boxes[:, 2])
+    iy1, iy2 = np.searchsorted(ys, boxes[:, 1]), np.searchsorted(ys, boxes[:, 3])
+    covered = _covered_cells(ix1, iy1, ix2, iy2, len(ys) - 1, len(xs) - 1)
+    cell_areas = np.diff(ys)[:, None] * np.diff(xs)[None, :]
+    return float(cell_areas[covered].sum())
+
+def union_area_raster(boxes, height: int, width: int, scale: float = DEFAULT_RASTER_SCALE) -> float:
+    """
+    Approximate union area of boxes, in original pixels, using an occupancy
+    mask at `scale` times the image resolution.
+    """
+    boxes = _as_boxes(boxes)
+    if len(boxes) == 0:
+        return 0.0
+    rows, cols = max(1, round(height * scale)), max(1, round(width * scale))
+    cell_h, cell_w = height / rows, width / cols
+    ix1 = np.clip(np.rint(boxes[:, 0] / cell_w), 0, cols).astype(np.intp)
+    ix2 = np.clip(np.rint(boxes[:, 2] / cell_w), 0, cols).astype(np.intp)
+    iy1 = np.clip(np.rint(boxes[:, 1] / cell_h), 0, rows).astype(np.intp)
+    iy2 = np.clip(np.rint(boxes[:, 3] / cell_h), 0, rows).astype(np.intp)
+    covered = _covered_cells(ix1, iy1, ix2, iy2, rows, cols)
+    return float(covered.sum()) * cell_h * cell_w
+
+def union_area_polygons(polygons: List[np.ndarray], height: int, width: int, scale: float = DEFAULT_RASTER_SCALE) -> float:
+    """Union area, in original pixels, of segmentation polygons given in image coordinates."""
+    rows, cols = max(1, round(height * scale)), max(1, round(width * scale))
+    mask = np.zeros((rows, cols), dtype=np.uint8)
+    scaled = [
+        np.rint(np.asarray(p, dtype=np.float64) * (cols / width, rows / height)).astype(np.int32)
+        for p in polygons if len(p) >= 3
+    ]
+    # One call per polygon: a single fillPoly over all of them uses even-odd
+    # filling, which leaves the overlap of two masks empty
+    for polygon in scaled:
+        cv2.fillPoly(mask, [polygon], 1)
+    return float(np.count_nonzero(mask)) * (height / rows) * (width / cols)
+
+def union_area(boxes, height: int, width: int, method: str = "auto", scale: float = DEFAULT_RASTER_SCALE) -> float:
+    """
+    Union area of boxes clipped to the image.
+    Args:
+        method: "exact", "raster", or "auto" (exact for up to EXACT_MAX_BOXES boxes).
+    """
+    boxes = _clip_boxes(_as_boxes(boxes), height, width)
+    if method == "auto":
+        method = "exact" if len(boxes) <= EXACT_MAX_BOXES else "raster"
+    if method == "exact":
+        return union_area_exact(boxes)
+    if method == "raster":
+        return union_area_raster(boxes, height, width, scale)
+    raise ValueError(f"Unknown coverage method: {method}")
+
+def coverage_percentages(
+    xyxy,
+    cls,
+    height: int,
+    width: int,
+    class_groups: Dict[str, List[int]],
+    polygons: Optional[List[np.ndarray]] = None,
+    method: str = "auto",
+    scale: float = DEFAULT_RASTER_SCALE,
+) -> Dict[str, float]:
+    """
+    Computes the percentage of the image covered by each group of classes.
+    Args:
+        xyxy: (N, 4) detection boxes in pixels.
+        cls: (N,) class IDs.
+        class_groups: Maps an output key (e.g. "green_cover_percentage") to the class IDs it counts.
+        polygons: Optional per-detection segmentation polygons; used instead of boxes when given.
+    Returns:
+        A dict with one percentage per group, rounded to 2 decimals.
+    """
+    boxes = _as_boxes(xyxy)
+    cls = np.asarray(cls).astype(np.int64).reshape(-1)
+    total_pixel_area = height * width
+    percentages = {}
+    for key, class_ids in class_groups.items():
+        selected = np.isin(cls, class_ids)
+        if polygons is not None:
+            area = union_area_polygons([p for p, keep in zip(polygons, selected) if keep], height, width, scale)
+        else:
+            area = union_area(boxes[selected], height, width, method, scale)
+        percentages[key] = round(area / total_pixel_area * 100, 2)
+    return percentages
@@ -0,0 +1,125 @@
+# src/design_cache.py
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from typing import Optional
+
+# --- Cache Modes ---
+READ_THROUGH = "read_through"  # serve hits from disk, call DALL-E on a miss and store the result
+CACHE_ONLY = "cache_only"      # serve hits from disk, never call DALL-E
+BYPASS = "bypass"              # ignore the cache entirely
+CACHE_MODES = (READ_THROUGH, CACHE_ONLY, BYPASS)
+
+def _link_or_copy(src: str, dest: str):
+    """Hardlinks `src` to `dest`, copying instead where links aren't supported."""
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
+
+class DesignCache:
+    """
+    Content-addressed store for generated design images. Each image is saved as
+    `<sha256 of the generation request>.png`, so the same prompt/model/size/quality
+    always maps to the same file. The least recently used files are evicted once
+    the directory grows past `max_bytes`, so anything that must outlive a run
+    (reports, checkpoints) gets its own link to the image via `put(copy_to=...)`
+    or `export`.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, mode: str = READ_THROUGH):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown design cache mode: {mode}")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(prompt: str, model: str, size: str, quality: str) -> str:
+        """Hash of everything that determines the generated image."""
+        payload = json.dumps(
+            {"prompt": prompt, "model": model, "size": size, "quality": quality}, sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached image path for `key`, or None on a miss."""
+        if self.mode == BYPASS:
+            return None
+        path = self.path_for(key)
+        with self._lock:
+            if os.path.exists(path):
+                self.hits += 1
+                # Touch the file so eviction treats it as recently used
+                os.utime(path)
+                return path
+            self.misses += 1
+            return None
+
+    def put(self, key: str, image_bytes: bytes, copy_to: Optional[str] = None) -> str:
+        """
+        Stores `image_bytes` under `key`. With `copy_to`, the image is also
+        linked there (outside the cache) and that path is returned; otherwise
+        the cache path is, which later eviction may remove.
+        """
+        path = self.path_for(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(image_bytes)
+        if copy_to:
+            _link_or_copy(tmp_path, copy_to)
+        os.replace(tmp_path, path)
+        self._evict(keep=path)
+        return copy_to or path
+
+    def export(self, key: str, dest: str) -> Optional[str]:
+        """Links the cached image for `key` to `dest` and returns `dest`, or None if it was evicted meanwhile."""
+        try:
+            _link_or_copy(self.path_for(key), dest)
+        except FileNotFoundError:
+            return None
+        return dest
+
+    def _evict(self, keep: Optional[str] = None):
+        """Deletes least recently used images (never `keep`) until the cache fits in `max_bytes`."""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".png"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                path = os.path.join(self.cache_dir, name)
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
@@ -0,0 +1,196 @@
+# src/fakes.py
+#
+# Deterministic, offline stand-ins for the chat model, DALL-E and the YOLO
+# model, selected with LLM_BACKEND=fake, IMAGE_BACKEND=fake and
+# YOLO_BACKEND=stub (RAG_EMBEDDINGS=fake covers the embeddings). They make the
+# whole workflow runnable without network access or GPU, for benchmarks.
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from typing import List
+import cv2
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# Simulated service latency, so throughput runs see realistic waiting
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "0"))
+FAKE_IMAGE_LATENCY_MS = float(os.getenv("FAKE_IMAGE_LATENCY_MS", "0"))
+FAKE_IMAGE_SIZE = 1024
+
+# Flat BGR colors drawn by fake_design_png and detected by StubYOLO
+BACKGROUND_BGR = (200, 200, 200)
+BUILDING_BGR = (70, 70, 150)
+GREEN_BGR = (60, 170, 60)
+WATER_BGR = (190, 120, 40)
+STUB_CLASS_COLORS = {0: BUILDING_BGR, 1: GREEN_BGR, 2: WATER_BGR}
+
+# The planner's standard fix for low green cover (see create_planner_agent)
+GREEN_FIX_PHRASE = "a vast central park with extensive green spaces"
+
+def _seed(text: str) -> int:
+    return int(hashlib.sha256(text.encode()).hexdigest()[:8], 16)
+
+# --- Chat Model ---
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that answers instantly (or after `latency_ms`) without a
+    network call. Tool-bound calls return a tool call with arguments filled in
+    from the tool's schema; plain calls return a short canned reply. Token
+    usage is reported like OpenAI's so metrics still work.
+    """
+    model_name: str = "fake-chat"
+    latency_ms: float = FAKE_LLM_LATENCY_MS
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools, tool_choice=None, **kwargs):
+        from langchain_core.utils.function_calling import convert_to_openai_tool
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _respond(self, messages, tools) -> ChatResult:
+        text = "\n".join(str(m.content) for m in messages)
+        if tools:
+            function = tools[0]["function"]
+            args = _tool_arguments(function["parameters"].get("properties", {}), text)
+            message = AIMessage(
+                content="",
+                tool_calls=[{"name": function["name"], "args": args, "id": f"call_{_seed(text):08x}"}],
+            )
+            completion = json.dumps(args)
+        else:
+            completion = _plain_reply(text)
+            message = AIMessage(content=completion)
+        usage = {"prompt_tokens": len(text) // 4, "completion_tokens": len(completion) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={"token_usage": usage, "model_name": self.model_name},
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return self._respond(messages, kwargs.get("tools"))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return self._respond(messages, kwargs.get("tools"))
+
+def _fake_design_prompt(text: str, index: int = 0) -> str:
+    request = re.search(r"User Request: (.*)", text)
+    prompt = f"Top-down site plan for {request.group(1).strip() if request else 'a mixed-use block'} (variant {index + 1})"
+    # Act on compliance feedback the way the real planner is told to
+    feedback = re.search(r"Critique/Feedback from Previous Attempt: (.*)", text)
+    if feedback and "FAIL" in feedback.group(1):
+        prompt += f", with {GREEN_FIX_PHRASE}"
+    return prompt
+
+def _tool_arguments(properties: dict, text: str) -> dict:
+    if "dalle_prompts" in properties:
+        count = re.search(r"exactly (\d+) distinct", text)
+        return {"dalle_prompts": [_fake_design_prompt(text, i) for i in range(int(count.group(1)) if count else 3)]}
+    return {name: _fake_design_prompt(text) for name in properties}
+
+def _plain_reply(text: str) -> str:
+    if "IMAGE_PATH_PLACEHOLDER" in text:
+        return (
+            "# Offline Design Report\n\n"
+            "## Initial Brief\nGenerated with the offline backends.\n\n"
+            "## Final Design Image\n![Final Design](IMAGE_PATH_PLACEHOLDER)\n\n"
+            "## Compliance Analysis\nAll checked metrics are within their limits.\n\n"
+            "## Conclusion\nDone.\n"
+        )
+    return "FAIL: Increase the green cover with a large central park and reduce the building footprint."
+
+# --- Image Generation ---
+def fake_design_image(prompt: str, size: int = FAKE_IMAGE_SIZE) -> np.ndarray:
+    """
+    Draws a synthetic site plan for `prompt` as flat-colored rectangles. The
+    layout is a pure function of the prompt; prompts asking for a vast park
+    get far more green cover.
+    """
+    rng = np.random.default_rng(_seed(prompt))
+    image = np.full((size, size, 3), BACKGROUND_BGR, dtype=np.uint8)
+    green_target = 0.35 if GREEN_FIX_PHRASE in prompt else rng.uniform(0.03, 0.2)
+    layers = [(GREEN_BGR, green_target), (BUILDING_BGR, rng.uniform(0.1, 0.3)), (WATER_BGR, rng.uniform(0.0, 0.05))]
+    for color, target in layers:
+        remaining = target * size * size
+        while remaining > 0:
+            w, h = (int(v) for v in rng.uniform(0.05, 0.25, 2) * size)
+            x, y = int(rng.uniform(0, size - w)), int(rng.uniform(0, size - h))
+            cv2.rectangle(image, (x, y), (x + w, y + h), color, thickness=-1)
+            remaining -= w * h
+    return image
+
+def fake_design_png(prompt: str, size: int = FAKE_IMAGE_SIZE, latency_ms: float = FAKE_IMAGE_LATENCY_MS) -> bytes:
+    """PNG bytes of fake_design_image, after the simulated render latency."""
+    if latency_ms:
+        time.sleep(latency_ms / 1000)
+    ok, encoded = cv2.imencode(".png", fake_design_image(prompt, size))
+    if not ok:
+        raise ValueError("Fake design could not be encoded.")
+    return encoded.tobytes()
+
+# --- YOLO Stub ---
+class _Array:
+    """Mimics the `.cpu().numpy()` chain of an ultralytics tensor."""
+
+    def __init__(self, values: np.ndarray):
+        self._values = values
+
+    def cpu(self):
+        return self
+
+    def numpy(self) -> np.ndarray:
+        return self._values
+
+class _Boxes:
+    def __init__(self, xyxy: np.ndarray, cls: np.ndarray):
+        self.xyxy = _Array(xyxy)
+        self.conf = _Array(np.ones(len(xyxy), dtype=np.float32))
+        self.cls = _Array(cls)
+
+class _Result:
+    def __init__(self, xyxy: np.ndarray, cls: np.ndarray):
+        self.boxes = _Boxes(xyxy, cls)
+        self.masks = None
+
+class StubYOLO:
+    """
+    Stand-in for the YOLO model: "detects" the flat-colored regions drawn by
+    fake_design_image with color thresholding and contours, so it does real
+    per-pixel work without torch. Called like an ultralytics model.
+    """
+
+    task = "detect"
+
+    def __init__(self, tolerance: int = 12, min_area: int = 64):
+        self.tolerance = tolerance
+        self.min_area = min_area
+
+    def _detect(self, image: np.ndarray) -> _Result:
+        boxes: List[List[float]] = []
+        classes: List[int] = []
+        for class_id, color in STUB_CLASS_COLORS.items():
+            lower = np.clip(np.array(color) - self.tolerance, 0, 255).astype(np.uint8)
+            upper = np.clip(np.array(color) + self.tolerance, 0, 255).astype(np.uint8)
+            mask = cv2.inRange(image, lower, upper)
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            for contour in contours:
+                x, y, w, h = cv2.boundingRect(contour)
+                if w * h >= self.min_area:
+                    boxes.append([x, y, x + w, y + h])
+                    classes.append(class_id)
+        return _Result(np.array(boxes, dtype=np.float32).reshape(-1, 4), np.array(classes, dtype=np.float32))
+
+    def __call__(self, images, verbose: bool = False) -> List[_Result]:
+        return [self._detect(image) for image in images]
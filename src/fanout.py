@@ -0,0 +1,136 @@
+# src/fanout.py
+
+import os
+import time
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from src.tools.design_tool import render_design, arender_design
+from src.tools.vision_tool import dispatch_analysis, arun_analysis
+from src.rules import rule_engine
+
+# --- Fan-out Settings ---
+# Prompt variants the planner writes per iteration (1 = the classic sequential loop)
+FANOUT_VARIANTS = int(os.getenv("FANOUT_VARIANTS", "1"))
+# Max DALL-E renders in flight at once per run
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "4"))
+
+def render_candidates(prompts: List[str], concurrency: int = FANOUT_CONCURRENCY) -> List[dict]:
+    """
+    Renders every prompt concurrently.
+    Returns:
+        One dict per prompt, in order, with the `prompt`, its `artifact` (None
+        on failure), an `error` message and the render time `render_s`.
+    """
+    def render(prompt: str) -> dict:
+        start = time.perf_counter()
+        try:
+            artifact, error = render_design(prompt), None
+        except Exception as e:
+            artifact, error = None, f"An error occurred during image generation: {str(e)}"
+        return {"prompt": prompt, "artifact": artifact, "error": error, "render_s": time.perf_counter() - start}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(prompts)))) as pool:
+        # Each render runs in a copy of the caller's context so it counts towards the current run
+        futures = [pool.submit(contextvars.copy_context().run, render, prompt) for prompt in prompts]
+        return [future.result() for future in futures]
+
+def design_candidates(state: dict) -> dict:
+    """Designer step in fan-out mode: renders all of the planner's prompts at once."""
+    start = time.perf_counter()
+    candidates = render_candidates(state["dalle_prompts"])
+    return {"fanout_candidates": candidates, "fanout_render_wall_s": time.perf_counter() - start}
+
+async def arender_candidates(prompts: List[str], concurrency: int = FANOUT_CONCURRENCY) -> List[dict]:
+    """Async version of render_candidates."""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def render(prompt: str) -> dict:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                artifact, error = await arender_design(prompt), None
+            except Exception as e:
+                artifact, error = None, f"An error occurred during image generation: {str(e)}"
+            return {"prompt": prompt, "artifact": artifact, "error": error, "render_s": time.perf_counter() - start}
+
+    return list(await asyncio.gather(*(render(p) for p in prompts)))
+
+async def adesign_candidates(state: dict) -> dict:
+    """Async version of design_candidates."""
+    start = time.perf_counter()
+    candidates = await arender_candidates(state["dalle_prompts"])
+    return {"fanout_candidates": candidates, "fanout_render_wall_s": time.perf_counter() - start}
+
+def select_candidate(reports: list) -> int:
+    """
+    Picks the candidate to move forward: among passing designs the one with the
+    largest worst-case margin, otherwise the one closest to compliance.
+    """
+    passing = [i for i, r in enumerate(reports) if r.passed]
+    if passing:
+        return max(passing, key=lambda i: min(res.margin for res in reports[i].results))
+    return min(range(len(reports)), key=lambda i: reports[i].shortfall)
+
+def _update_stats(stats: dict, planner_s: float, candidates: List[dict], reports: list, analysis_s: float, wall_s: float) -> dict:
+    """
+    Accumulates how this fan-out iteration compares with the sequential loop.
+    Sequentially, the same prompts would have been tried one per iteration
+    until the first passing one, each paying planner, render and analysis time.
+    """
+    stats = dict(stats or {})
+    first_pass = next((i for i, r in enumerate(reports) if r.passed), None)
+    tried = len(candidates) if first_pass is None else first_pass + 1
+    per_image_analysis_s = analysis_s / len(candidates)
+    sequential_s = sum(planner_s + c["render_s"] + per_image_analysis_s for c in candidates[:tried])
+
+    stats["iterations"] = stats.get("iterations", 0) + 1
+    stats["candidates_rendered"] = stats.get("candidates_rendered", 0) + len(candidates)
+    stats["sequential_iterations_estimate"] = stats.get("sequential_iterations_estimate", 0) + tried
+    stats["wall_time_s"] = round(stats.get("wall_time_s", 0.0) + planner_s + wall_s, 3)
+    stats["sequential_time_estimate_s"] = round(stats.get("sequential_time_estimate_s", 0.0) + sequential_s, 3)
+    stats["iterations_saved"] = stats["sequential_iterations_estimate"] - stats["iterations"]
+    stats["time_saved_s"] = round(stats["sequential_time_estimate_s"] - stats["wall_time_s"], 3)
+    return stats
+
+def analyze_candidates(state: dict) -> dict:
+    """
+    Scores all rendered candidates in one batch, keeps the best one and
+    returns the state update that makes it the current design.
+    """
+    start = time.perf_counter()
+    candidates = state["fanout_candidates"]
+    rendered = [c for c in candidates if c["artifact"] is not None]
+    analyses = dispatch_analysis([c["artifact"] for c in rendered]) if rendered else []
+    analysis_s = time.perf_counter() - start
+    by_candidate = iter(analyses)
+    analyses = [next(by_candidate) if c["artifact"] is not None else {"error": c["error"]} for c in candidates]
+
+    engine = rule_engine.get()
+    reports = [engine.evaluate(a) for a in analyses]
+    chosen = select_candidate(reports)
+    best = candidates[chosen]
+
+    render_wall_s = state.get("fanout_render_wall_s") or 0.0
+    stats = _update_stats(
+        state.get("fanout_stats"),
+        state.get("planner_seconds") or 0.0,
+        candidates,
+        reports,
+        analysis_s,
+        render_wall_s + (time.perf_counter() - start),
+    )
+    print(f"Fan-out: picked candidate {chosen + 1}/{len(candidates)} ({'PASS' if reports[chosen].passed else 'closest to compliance'}); {stats}")
+    return {
+        "dalle_prompt": best["prompt"],
+        "image_artifact": best["artifact"],
+        "image_path": best["artifact"].path if best["artifact"] else best["error"],
+        "analysis_results": analyses[chosen],
+        "fanout_candidates": None,
+        "fanout_stats": stats,
+    }
+
+async def aanalyze_candidates(state: dict) -> dict:
+    """Async version of analyze_candidates; scoring runs on the YOLO executor."""
+    return await arun_analysis(analyze_candidates, state)
@@ -0,0 +1,294 @@
+# src/ingest.py
+
+import glob
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from typing import Dict, Iterator, List, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# --- Ingestion Settings ---
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+# Chunks sent to the embedding API per request
+EMBED_BATCH_SIZE = 128
+# Embeddings are cached by chunk text, so re-ingesting unchanged text is free
+EMBEDDING_CACHE_PATH = "./embedding_cache"
+# Set RAG_EMBEDDINGS=fake to build and query the store offline with deterministic vectors
+RAG_EMBEDDINGS = os.getenv("RAG_EMBEDDINGS", "openai").lower()
+FAKE_EMBEDDING_SIZE = 256
+MANIFEST_NAME = "manifest.json"
+# PDF text extraction runs in a process pool; each task extracts this many pages
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+PAGES_PER_TASK = 16
+
+def get_embeddings(cache_path: str = EMBEDDING_CACHE_PATH):
+    """
+    Returns the embedding function used for the vector store, wrapped in an
+    on-disk cache keyed by chunk text and model.
+    """
+    from langchain.embeddings import CacheBackedEmbeddings
+    from langchain.storage import LocalFileStore
+
+    if RAG_EMBEDDINGS == "fake":
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        underlying = DeterministicFakeEmbedding(size=FAKE_EMBEDDING_SIZE)
+        namespace = f"fake-{FAKE_EMBEDDING_SIZE}"
+    else:
+        from src.scheduled_openai import ScheduledOpenAIEmbeddings
+        underlying = ScheduledOpenAIEmbeddings()
+        namespace = underlying.model
+    return CacheBackedEmbeddings.from_bytes_store(
+        underlying, LocalFileStore(cache_path), namespace=namespace, batch_size=EMBED_BATCH_SIZE
+    )
+
+def find_sources(*paths_or_dirs: str) -> List[str]:
+    """Expands the given files and directories into the PDF/JSON files to index."""
+    sources = set()
+    for path in paths_or_dirs:
+        if os.path.isdir(path):
+            for pattern in ("*.pdf", "*.json"):
+                sources.update(glob.glob(os.path.join(path, pattern)))
+        elif os.path.exists(path):
+            sources.add(path)
+    return sorted(os.path.normpath(p) for p in sources)
+
+def file_fingerprint(path: str) -> dict:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _extract_pages(path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    """Worker task: extracts the text of pages [start, stop) of a PDF."""
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    return [(i, reader.pages[i].extract_text() or "") for i in range(start, stop)]
+
+def iter_pdf_pages(path: str, workers: int = INGEST_WORKERS, pages_per_task: int = PAGES_PER_TASK) -> Iterator:
+    """
+    Yields one Document per PDF page, in page order, without holding the whole
+    PDF's text in memory. Extraction is spread across `workers` processes, with
+    at most two tasks per worker in flight.
+    """
+    from pypdf import PdfReader
+    from langchain_core.documents import Document
+
+    page_count = len(PdfReader(path).pages)
+    ranges = [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+
+    def to_documents(pages):
+        for page_no, text in pages:
+            yield Document(page_content=text, metadata={"source": path, "page": page_no})
+
+    if workers <= 1 or len(ranges) <= 1:
+        for start, stop in ranges:
+            yield from to_documents(_extract_pages(path, start, stop))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        pending = iter(ranges)
+        for start, stop in pending:
+            in_flight.append(pool.submit(_extract_pages, path, start, stop))
+            if len(in_flight) >= workers * 2:
+                break
+        while in_flight:
+            pages = in_flight.popleft().result()
+            next_range = next(pending, None)
+            if next_range:
+                in_flight.append(pool.submit(_extract_pages, path, *next_range))
+            yield from to_documents(pages)
+
+def rule_text(rule: dict) -> str:
+    """A rule as indexed text: its ID, metric and threshold (for exact lookups) ahead of the description."""
+    limit = f"{rule.get('direction', '')} {rule.get('threshold', '')}{rule.get('unit', '')}".strip()
+    return f"{rule.get('id', '')} ({rule.get('compliance_metric', '')} {limit}): {rule.get('description', '')}"
+
+def iter_rule_documents(path: str) -> Iterator:
+    """
+    Yields one Document per rule of a compliance_rules.json-style file. Other
+    JSON files (no top-level "rules" list) are skipped with a message, as are
+    entries of that list that aren't objects.
+    """
+    from langchain_core.documents import Document
+    with open(path) as f:
+        data = json.load(f)
+    rules = data.get("rules") if isinstance(data, dict) else None
+    if not isinstance(rules, list):
+        print(f"Skipping {path}: no top-level \"rules\" list.")
+        return
+    for seq_num, rule in enumerate(rules, start=1):
+        if not isinstance(rule, dict):
+            print(f"Skipping rule {seq_num} of {path}: not an object.")
+            continue
+        metadata = {"source": path, "seq_num": seq_num, "rule_id": rule.get("id", ""), "compliance_metric": rule.get("compliance_metric", "")}
+        yield Document(page_content=rule_text(rule), metadata=metadata)
+
+def iter_documents(path: str) -> Iterator:
+    """Yields the documents of a PDF (one per page, lazily) or a compliance rules JSON file."""
+    if path.lower().endswith(".pdf"):
+        yield from iter_pdf_pages(path)
+        return
+    yield from iter_rule_documents(path)
+
+def iter_source_chunks(path: str) -> Iterator:
+    """Streams the chunks of one source file as one list of chunks per page."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    for doc in iter_documents(path):
+        yield text_splitter.split_documents([doc])
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process in MB (0.0 where unsupported)."""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024), 1)
+
+def chunk_id(source: str, doc) -> str:
+    """Stable ID for a chunk: the hash of its source, page and text."""
+    payload = json.dumps([source, doc.metadata.get("page"), doc.page_content])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def load_manifest(path: str) -> dict:
+    if not os.path.exists(path):
+        return {"sources": {}}
+    with open(path) as f:
+        return json.load(f)
+
+def corpus_version(manifest_path: str) -> str:
+    """Hash of the indexed sources' contents and the embedding backend, for caches of query results."""
+    sources = load_manifest(manifest_path).get("sources", {})
+    payload = json.dumps([RAG_EMBEDDINGS, sorted((s, e.get("hash")) for s, e in sources.items())])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def save_manifest(path: str, manifest: dict):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def _add_batch(vector_store, batch: List[Tuple[str, object]]):
+    vector_store.add_texts(
+        [doc.page_content for _, doc in batch],
+        metadatas=[doc.metadata for _, doc in batch],
+        ids=[cid for cid, _ in batch],
+    )
+
+def _delete_in_batches(vector_store, ids: List[str], batch_size: int):
+    for start in range(0, len(ids), batch_size):
+        vector_store.delete(ids=ids[start:start + batch_size])
+
+def sync_vector_store(vector_store, sources: List[str], manifest_path: str, batch_size: int = EMBED_BATCH_SIZE, lexical_index=None) -> Dict[str, int]:
+    """
+    Brings `vector_store` in line with `sources`, touching only what changed.
+    Files whose size/mtime (or, failing that, content hash) match the manifest
+    are skipped. Changed files are streamed page by page, and only chunks whose
+    IDs are new get embedded, `batch_size` at a time, so memory stays bounded
+    by the batch rather than the document. Chunks that disappeared are deleted,
+    and sources that no longer exist have all their chunks removed.
+    A `lexical_index` (src/lexical_index.py) gets each changed source's chunks
+    too, staged `batch_size` at a time in short transactions between the
+    embedding calls and swapped in once the source is fully read; a
+    source it hasn't seen at its current hash is re-read for it even when the
+    vector store is up to date, which embeds nothing.
+    Returns:
+        Counts of files, pages and chunks processed, plus pages/sec and peak RSS.
+    """
+    start = time.perf_counter()
+    has_manifest = os.path.exists(manifest_path)
+    manifest = load_manifest(manifest_path)
+    known = manifest.setdefault("sources", {})
+    stats = {"files_changed": 0, "files_skipped": 0, "files_removed": 0, "chunks_added": 0, "chunks_removed": 0, "pages": 0}
+
+    if not has_manifest:
+        # A store built before manifests existed has IDs we can't track; start it over
+        legacy_ids = vector_store.get(include=[])["ids"]
+        if legacy_ids:
+            print(f"Resetting {len(legacy_ids)} untracked vectors from a legacy store...")
+            _delete_in_batches(vector_store, legacy_ids, batch_size)
+
+    for source in sources:
+        entry = known.get(source)
+        fingerprint = file_fingerprint(source)
+        lexical_current = lexical_index is None or (entry is not None and lexical_index.source_hash(source) == entry["hash"])
+        if lexical_current and entry and entry["size"] == fingerprint["size"] and entry["mtime"] == fingerprint["mtime"]:
+            stats["files_skipped"] += 1
+            continue
+        content_hash = file_hash(source)
+        if entry and entry["hash"] == content_hash and (lexical_index is None or lexical_index.source_hash(source) == content_hash):
+            entry.update(fingerprint)
+            stats["files_skipped"] += 1
+            continue
+
+        print(f"Indexing changed source: {source}")
+        old_ids = set(entry["chunk_ids"]) if entry else set()
+        chunk_ids, seen, batch, added, lexical_batch = [], set(), [], 0, []
+        lexical_update = lexical_index.replace_source(source, content_hash) if lexical_index is not None else nullcontext()
+        with lexical_update as add_lexical:
+            for chunks in iter_source_chunks(source):
+                stats["pages"] += 1
+                for doc in chunks:
+                    cid = chunk_id(source, doc)
+                    if cid in seen:
+                        continue
+                    seen.add(cid)
+                    chunk_ids.append(cid)
+                    if add_lexical is not None:
+                        lexical_batch.append((cid, doc))
+                    if cid not in old_ids:
+                        batch.append((cid, doc))
+                    if len(batch) >= batch_size:
+                        _add_batch(vector_store, batch)
+                        added += len(batch)
+                        batch = []
+                    if len(lexical_batch) >= batch_size:
+                        add_lexical(lexical_batch)
+                        lexical_batch = []
+            if batch:
+                _add_batch(vector_store, batch)
+                added += len(batch)
+            if lexical_batch:
+                add_lexical(lexical_batch)
+        removed_ids = sorted(old_ids - seen)
+
+        _delete_in_batches(vector_store, removed_ids, batch_size)
+        known[source] = {**fingerprint, "hash": content_hash, "chunk_ids": chunk_ids}
+        save_manifest(manifest_path, manifest)
+        stats["files_changed"] += 1
+        stats["chunks_added"] += added
+        stats["chunks_removed"] += len(removed_ids)
+
+    for source in sorted(set(known) - set(sources)):
+        print(f"Removing vectors for deleted source: {source}")
+        _delete_in_batches(vector_store, known[source]["chunk_ids"], batch_size)
+        stats["chunks_removed"] += len(known.pop(source)["chunk_ids"])
+        stats["files_removed"] += 1
+    if lexical_index is not None:
+        for source in sorted(set(lexical_index.sources()) - set(sources)):
+            lexical_index.remove_source(source)
+
+    save_manifest(manifest_path, manifest)
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = round(elapsed, 3)
+    stats["pages_per_sec"] = round(stats["pages"] / elapsed, 1) if elapsed > 0 else 0.0
+    stats["peak_rss_mb"] = peak_rss_mb()
+    if stats["files_changed"] or stats["files_removed"]:
+        print(f"Vector store synced: {stats}")
+    return stats
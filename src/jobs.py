@@ -0,0 +1,216 @@
+# src/jobs.py
+#
+# A job queue for workflow runs shared by every Streamlit session in the
+# process. Sessions submit runs and poll their progress instead of running the
+# graph inside the script, so the UI stays responsive, a fixed pool of worker
+# threads bounds how many runs execute at once, and the models, retriever and
+# compiled graphs loaded through src/resources.py are shared by all of them.
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+from src.analysis_pool import ANALYSIS_WORKERS
+from src.metrics import registry, track_run
+from src.resources import register
+
+# --- Queue Settings ---
+# Runs executed at once; the rest wait in FIFO order. Without analyzer
+# processes (ANALYSIS_WORKERS=0) every run shares the in-process model, so one at a time
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4" if ANALYSIS_WORKERS > 0 else "1"))
+# Queued runs allowed before submit() refuses new ones
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "64"))
+# Finished jobs stay pollable (by the session that started them) this long
+JOB_RETENTION_S = float(os.getenv("JOB_RETENTION_S", "3600"))
+
+QUEUED = "queued"
+RUNNING = "running"
+AWAITING_APPROVAL = "awaiting_approval"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE = (QUEUED, RUNNING)
+
+# Node update fields copied into job events. Decoded images and candidate lists
+# stay out, so retained jobs stay small; designs are referenced by file path
+EVENT_FIELDS = ("analysis_results", "fanout_stats", "critique_feedback")
+
+class JobQueueFull(RuntimeError):
+    """Raised when JOB_MAX_QUEUED runs are already waiting."""
+
+def job_event(node: str, update: Optional[dict]) -> dict:
+    """
+    The lightweight record of one node update: `summary` holds the fields a
+    poller shows, and `image_path` the design file it produced, if any (it may
+    still be being written when the event is read).
+    """
+    update = update or {}
+    summary = {k: update[k] for k in EVENT_FIELDS if k in update}
+    if update.get("fanout_candidates"):
+        summary["candidates"] = len(update["fanout_candidates"])
+    artifact = update.get("image_artifact")
+    if artifact is None and node == "designer" and update.get("image_path"):
+        # A failed render leaves its error message in image_path
+        summary["error"] = update["image_path"]
+    return {"node": node, "summary": summary, "image_path": artifact.path if artifact is not None else None, "at": time.time()}
+
+class Job:
+    """
+    One workflow run (new or resumed) and its progress. `events` collects a
+    job_event per node update in order, so a poller can render everything
+    past the last one it saw.
+    """
+
+    def __init__(self, run_id: str, inputs: Optional[dict], review: bool):
+        self.run_id = run_id
+        # None resumes the run from its last checkpoint
+        self.inputs = inputs
+        self.review = review
+        self.status = QUEUED
+        self.events: List[dict] = []
+        self.final_report: Optional[str] = None
+        self.run_metrics: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.submitted = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.cancel_requested = threading.Event()
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE
+
+    def emit(self, node: str, update: dict):
+        self.events.append(job_event(node, update))
+
+class JobQueue:
+    """
+    FIFO queue of runs served by `workers` threads.
+
+    A job can be cancelled while queued (it is dropped) or while running
+    (it stops after the node in progress; completed nodes stay checkpointed,
+    so the run can be resumed later). Submitting a run ID that is already
+    queued or running returns the existing job.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = JOB_MAX_QUEUED):
+        self.workers = workers
+        self.max_queued = max_queued
+        self._pending: deque = deque()
+        self._jobs: Dict[str, Job] = {}
+        self._cond = threading.Condition()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True) for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    # --- Client Side ---
+    def submit(self, run_id: str, inputs: Optional[dict] = None, review: bool = False) -> Job:
+        """Queues a new run (with `inputs`) or the resumption of one (without)."""
+        with self._cond:
+            existing = self._jobs.get(run_id)
+            if existing is not None and existing.active:
+                return existing
+            if len(self._pending) >= self.max_queued:
+                raise JobQueueFull(f"{len(self._pending)} runs are already queued; try again shortly.")
+            self._prune()
+            job = Job(run_id, inputs, review)
+            self._jobs[run_id] = job
+            self._pending.append(job)
+            registry.inc("jobs_submitted_total")
+            self._cond.notify()
+        return job
+
+    def get(self, run_id: str) -> Optional[Job]:
+        with self._cond:
+            return self._jobs.get(run_id)
+
+    def position(self, run_id: str) -> int:
+        """1-based place of a queued job in line, 0 once it is running or finished."""
+        with self._cond:
+            for index, job in enumerate(self._pending):
+                if job.run_id == run_id:
+                    return index + 1
+        return 0
+
+    def depth(self) -> Dict[str, int]:
+        with self._cond:
+            running = sum(1 for job in self._jobs.values() if job.status == RUNNING)
+            return {"queued": len(self._pending), "running": running, "workers": self.workers}
+
+    def cancel(self, run_id: str) -> bool:
+        """Cancels a queued or running job; False if it wasn't active."""
+        with self._cond:
+            job = self._jobs.get(run_id)
+            if job is None or not job.active:
+                return False
+            job.cancel_requested.set()
+            if job.status == QUEUED:
+                self._pending.remove(job)
+                self._finish(job, CANCELLED)
+        return True
+
+    def _prune(self):
+        """Forgets finished jobs past JOB_RETENTION_S. Caller holds the lock."""
+        cutoff = time.time() - JOB_RETENTION_S
+        for run_id in [r for r, job in self._jobs.items() if job.finished and job.finished < cutoff]:
+            del self._jobs[run_id]
+
+    def _finish(self, job: Job, status: str):
+        job.status = status
+        job.finished = time.time()
+        registry.inc("jobs_finished_total", status=status)
+
+    # --- Worker Side ---
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                job = self._pending.popleft()
+                job.status = RUNNING
+                job.started = time.time()
+            registry.observe("job_queue_seconds", job.started - job.submitted)
+            try:
+                status = run_job(job)
+            except Exception as e:
+                job.error = str(e)
+                status = FAILED
+            with self._cond:
+                self._finish(job, status)
+
+def run_job(job: Job) -> str:
+    """Runs (or resumes) the job's workflow, recording each node update; returns its final status."""
+    # Imported here so that importing this module stays cheap
+    from src.tools.rag_tool import rag_compliance_lookup
+    from src.workflow import get_workflow, run_config, awaiting_approval
+
+    app = get_workflow(human_approval=job.review, durable=True)
+    config = run_config(run_id=job.run_id)
+    inputs = job.inputs
+    with track_run(job.run_id) as run:
+        try:
+            if inputs is not None and "rag_context" not in inputs:
+                inputs = {**inputs, "rag_context": rag_compliance_lookup.invoke(inputs["user_request"])}
+                job.emit("rag", {})
+            for output in app.stream(inputs, config):
+                for node, update in output.items():
+                    job.emit(node, update)
+                    if node == "report":
+                        job.final_report = update.get("final_report")
+                if job.cancel_requested.is_set():
+                    break
+        except Exception as e:
+            job.error = str(e)
+    job.run_metrics = run.to_dict()
+    registry.export()
+    if job.error:
+        return FAILED
+    if job.cancel_requested.is_set() and job.final_report is None:
+        return CANCELLED
+    return AWAITING_APPROVAL if awaiting_approval(app, config) else DONE
+
+# Started on first use and shared by every session in the process
+job_queue = register("job_queue", JobQueue)
@@ -0,0 +1,149 @@
+# src/lexical_index.py
+
+import json
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+from langchain_core.documents import Document
+from src.context_compression import STOPWORDS
+
+# --- Query Routing ---
+# Rule IDs ("GRN-01"), metric names ("building_footprint_percentage") and numbers ("40", "12.5%")
+EXACT_TERM = re.compile(r"^(?:[A-Za-z]+-\d+[A-Za-z]?|[a-z0-9]+(?:_[a-z0-9]+)+|\d+(?:\.\d+)?%?)$")
+LEXICAL = "lexical"
+HYBRID = "hybrid"
+VECTOR = "vector"
+# Reciprocal rank fusion constant (the usual 60: ranks deep in either list still count)
+FUSION_K = 60
+
+def query_terms(query: str) -> List[str]:
+    """Words of the query with surrounding punctuation stripped, keeping IDs and metric names whole."""
+    words = (w.strip(".,;:!?()[]{}\"'") for w in query.split())
+    return [w for w in words if re.search(r"\w", w) and w.lower() not in STOPWORDS]
+
+def route(query: str) -> str:
+    """
+    LEXICAL when every term is an exact term (a pure ID/metric/number lookup),
+    HYBRID when some are, VECTOR for plain natural language.
+    """
+    terms = query_terms(query)
+    exact = sum(1 for t in terms if EXACT_TERM.match(t))
+    if terms and exact == len(terms):
+        return LEXICAL
+    return HYBRID if exact else VECTOR
+
+def fuse(rankings: Iterable[List[Document]], k: int) -> List[Document]:
+    """Reciprocal rank fusion of several ranked lists; documents are matched on their text."""
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            scores[doc.page_content] = scores.get(doc.page_content, 0.0) + 1 / (FUSION_K + rank + 1)
+            docs.setdefault(doc.page_content, doc)
+    best = sorted(scores, key=lambda text: -scores[text])[:k]
+    return [docs[text] for text in best]
+
+class LexicalIndex:
+    """
+    BM25 inverted index of the same chunks as the vector store, kept in an
+    SQLite FTS5 table next to it. It is persistent, so opening it costs
+    nothing, and answers exact-term lookups without an embedding call.
+
+    src/ingest.py keeps it in step with the sources: each source's chunks are
+    replaced whenever its content hash differs from the one recorded here.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # The default tokenizer splits "GRN-01" and "building_footprint_percentage" into words;
+        # queries search them as phrases so they still match exactly
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(text, chunk_id UNINDEXED, source UNINDEXED, metadata UNINDEXED)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS sources (source TEXT PRIMARY KEY, hash TEXT NOT NULL)")
+        # Chunks of a source being re-indexed, moved into `chunks` once the whole source is read
+        self._conn.execute("CREATE TABLE IF NOT EXISTS staged_chunks (text TEXT, chunk_id TEXT, source TEXT, metadata TEXT)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS staged_chunks_source ON staged_chunks (source)")
+        self._conn.commit()
+
+    # --- Updates ---
+    def source_hash(self, source: str) -> Optional[str]:
+        """Content hash of `source` when it was last indexed, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT hash FROM sources WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else None
+
+    def _clear_staged(self, source: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM staged_chunks WHERE source = ?", (source,))
+
+    @contextmanager
+    def replace_source(self, source: str, content_hash: str):
+        """
+        Replaces everything indexed for `source`. The block receives an
+        `add(chunks)` function to call with each batch of (chunk ID, document)
+        pairs as it is read, so the source is never held in memory whole.
+        Batches are staged in short transactions of their own, so no write lock
+        is held while the caller embeds between them; the staged chunks replace
+        the old ones in one quick transaction when the block ends. Searches see
+        the old chunks until then, and if the block raises, nothing changes.
+        """
+        self._clear_staged(source)  # left over from an ingest that crashed
+
+        def add(chunks: List[Tuple[str, Document]]):
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT INTO staged_chunks (text, chunk_id, source, metadata) VALUES (?, ?, ?, ?)",
+                    [(doc.page_content, cid, source, json.dumps(doc.metadata)) for cid, doc in chunks],
+                )
+
+        try:
+            yield add
+        except BaseException:
+            self._clear_staged(source)
+            raise
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunks WHERE source = ?", (source,))
+            self._conn.execute(
+                "INSERT INTO chunks (text, chunk_id, source, metadata) "
+                "SELECT text, chunk_id, source, metadata FROM staged_chunks WHERE source = ? ORDER BY rowid",
+                (source,),
+            )
+            self._conn.execute("DELETE FROM staged_chunks WHERE source = ?", (source,))
+            self._conn.execute("INSERT OR REPLACE INTO sources (source, hash) VALUES (?, ?)", (source, content_hash))
+
+    def remove_source(self, source: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunks WHERE source = ?", (source,))
+            self._conn.execute("DELETE FROM sources WHERE source = ?", (source,))
+
+    def sources(self) -> List[str]:
+        with self._lock:
+            return [s for (s,) in self._conn.execute("SELECT source FROM sources").fetchall()]
+
+    # --- Search ---
+    def search(self, query: str, k: int = 4) -> List[Document]:
+        """The k chunks matching any query term best by BM25; exact terms are matched as phrases."""
+        terms = query_terms(query)
+        if not terms:
+            return []
+        match = " OR ".join('"{}"'.format(term.replace('"', '""')) for term in terms)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT text, chunk_id, metadata FROM chunks WHERE chunks MATCH ? ORDER BY bm25(chunks) LIMIT ?",
+                (match, k),
+            ).fetchall()
+        return [Document(page_content=text, metadata=json.loads(metadata), id=cid) for text, cid, metadata in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM chunks").fetchone()[0]
@@ -0,0 +1,361 @@
+# src/metrics.py
+
+import asyncio
+import bisect
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from langchain_core.callbacks import BaseCallbackHandler
+
+# --- Metrics Settings ---
+# Set METRICS=off to skip all recording
+METRICS_ENABLED = os.getenv("METRICS", "on").lower() != "off"
+# A ".json" path exports JSON, anything else the Prometheus text format
+METRICS_PATH = os.getenv("METRICS_PATH", "./outputs/metrics.prom")
+# Comma-separated node names to run under cProfile, or "all"
+PROFILE_NODES = {n.strip() for n in os.getenv("PROFILE_NODES", "").split(",") if n.strip()}
+PROFILE_DIR = "./outputs/profiles"
+METRIC_PREFIX = "urbanplan_"
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+COST_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+# --- Prices ---
+# USD per 1M (prompt, completion) tokens, matched on the model name prefix
+LLM_PRICES = {"gpt-4o-mini": (0.15, 0.60), "gpt-4o": (2.50, 10.00)}
+# USD per generated image (standard quality, 1024x1024)
+IMAGE_PRICES = {"dall-e-3": 0.04, "dall-e-2": 0.02}
+
+def llm_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    # Longest prefix first, so "gpt-4o-mini" isn't priced as "gpt-4o"
+    for prefix in sorted(LLM_PRICES, key=len, reverse=True):
+        if model.startswith(prefix):
+            prompt_price, completion_price = LLM_PRICES[prefix]
+            return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+    return 0.0
+
+class Histogram:
+    """Fixed-bucket histogram; bucket `i` counts observations <= `buckets[i]`."""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+def _label_key(labels: dict) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(key, extra: Optional[dict] = None) -> str:
+    pairs = list(key) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+class MetricsRegistry:
+    """Process-wide counters and histograms, safe to update from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[tuple, float]] = {}
+        self._histograms: Dict[str, Dict[tuple, Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = SECONDS_BUCKETS, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "counters": {
+                    name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                    for name, series in self._counters.items()
+                },
+                "histograms": {
+                    name: [
+                        {
+                            "labels": dict(key),
+                            "count": h.count,
+                            "sum": round(h.sum, 6),
+                            "buckets": {("+Inf" if b == float("inf") else str(b)): c for b, c in h.cumulative()},
+                        }
+                        for key, h in series.items()
+                    ]
+                    for name, series in self._histograms.items()
+                },
+            }
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                full = f"{METRIC_PREFIX}{name}"
+                lines.append(f"# TYPE {full} counter")
+                for key, value in series.items():
+                    lines.append(f"{full}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                full = f"{METRIC_PREFIX}{name}"
+                lines.append(f"# TYPE {full} histogram")
+                for key, h in series.items():
+                    for bound, count in h.cumulative():
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(f"{full}_bucket{_format_labels(key, {'le': le})} {count}")
+                    lines.append(f"{full}_sum{_format_labels(key)} {h.sum:.6f}")
+                    lines.append(f"{full}_count{_format_labels(key)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: str = METRICS_PATH) -> str:
+        """Writes every metric to `path` (JSON for ".json", Prometheus text otherwise)."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        text = json.dumps(self.to_dict(), indent=2) if path.endswith(".json") else self.to_prometheus()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        return path
+
+registry = MetricsRegistry()
+
+# --- Per-Run Totals ---
+class RunMetrics:
+    """Totals for a single workflow run, filled in by the record_* functions below."""
+
+    def __init__(self, run_id: Optional[str] = None):
+        self.run_id = run_id
+        self.started = time.perf_counter()
+        self.wall_seconds = 0.0
+        self.node_seconds: Dict[str, float] = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.images_generated = 0
+        self.yolo_seconds = 0.0
+        self.yolo_images = 0
+        self.retrieval_seconds = 0.0
+        # Estimated tokens of retrieved rules before and after compression, and the prompt tokens that saved
+        self.context_tokens_retrieved = 0
+        self.context_tokens = 0
+        self.context_tokens_saved = 0
+        self.cost_usd = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, field: str, value):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + value)
+
+    def add_node(self, node: str, seconds: float):
+        with self._lock:
+            self.node_seconds[node] = self.node_seconds.get(node, 0.0) + seconds
+
+    def to_dict(self) -> dict:
+        return {
+            "run_id": self.run_id,
+            "wall_seconds": round(self.wall_seconds, 3),
+            "node_seconds": {k: round(v, 3) for k, v in self.node_seconds.items()},
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "images_generated": self.images_generated,
+            "yolo_seconds": round(self.yolo_seconds, 3),
+            "yolo_images": self.yolo_images,
+            "retrieval_seconds": round(self.retrieval_seconds, 3),
+            "context_tokens_retrieved": self.context_tokens_retrieved,
+            "context_tokens": self.context_tokens,
+            "context_tokens_saved": self.context_tokens_saved,
+            "cost_usd": round(self.cost_usd, 4),
+        }
+
+# The run being recorded in this thread or task (LangGraph and asyncio copy it into workers)
+_current_run: contextvars.ContextVar = contextvars.ContextVar("current_run", default=None)
+
+def current_run() -> Optional[RunMetrics]:
+    return _current_run.get()
+
+@contextmanager
+def track_run(run_id: Optional[str] = None):
+    """Collects everything recorded inside the block into one RunMetrics."""
+    run = RunMetrics(run_id)
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+        run.wall_seconds = time.perf_counter() - run.started
+        if METRICS_ENABLED:
+            registry.observe("run_seconds", run.wall_seconds)
+            registry.observe("run_cost_usd", run.cost_usd, buckets=COST_BUCKETS)
+
+# --- Recording ---
+def record_node(node: str, seconds: float):
+    if not METRICS_ENABLED:
+        return
+    registry.observe("node_seconds", seconds, node=node)
+    run = current_run()
+    if run:
+        run.add_node(node, seconds)
+
+def record_llm(model: str, prompt_tokens: int, completion_tokens: int):
+    if not METRICS_ENABLED:
+        return
+    cost = llm_cost(model, prompt_tokens, completion_tokens)
+    registry.inc("llm_prompt_tokens_total", prompt_tokens, model=model)
+    registry.inc("llm_completion_tokens_total", completion_tokens, model=model)
+    registry.inc("cost_usd_total", cost, kind="llm")
+    registry.observe("llm_tokens_per_call", prompt_tokens + completion_tokens, buckets=TOKEN_BUCKETS, model=model)
+    run = current_run()
+    if run:
+        run.add("prompt_tokens", prompt_tokens)
+        run.add("completion_tokens", completion_tokens)
+        run.add("cost_usd", cost)
+
+def record_images(model: str, count: int, seconds: float):
+    if not METRICS_ENABLED:
+        return
+    cost = IMAGE_PRICES.get(model, 0.0) * count
+    registry.inc("images_generated_total", count, model=model)
+    registry.inc("cost_usd_total", cost, kind="image")
+    registry.observe("image_generation_seconds", seconds, model=model)
+    run = current_run()
+    if run:
+        run.add("images_generated", count)
+        run.add("cost_usd", cost)
+
+def record_yolo(seconds: float, images: int):
+    if not METRICS_ENABLED:
+        return
+    registry.observe("yolo_inference_seconds", seconds)
+    registry.inc("yolo_images_total", images)
+    run = current_run()
+    if run:
+        run.add("yolo_seconds", seconds)
+        run.add("yolo_images", images)
+
+def record_retrieval(seconds: float):
+    if not METRICS_ENABLED:
+        return
+    registry.observe("retrieval_seconds", seconds)
+    run = current_run()
+    if run:
+        run.add("retrieval_seconds", seconds)
+
+def record_retrieval_route(strategy: str):
+    """Which retrieval path answered a lookup that missed the query cache (lexical, hybrid or vector)."""
+    if METRICS_ENABLED:
+        registry.inc("rag_retrieval_route_total", strategy=strategy)
+
+def record_context(retrieved_tokens: int, tokens: int):
+    """The run's retrieved rules were compressed from `retrieved_tokens` to `tokens`."""
+    if not METRICS_ENABLED:
+        return
+    registry.inc("rag_context_tokens_total", retrieved_tokens, stage="retrieved")
+    registry.inc("rag_context_tokens_total", tokens, stage="compressed")
+    run = current_run()
+    if run:
+        run.add("context_tokens_retrieved", retrieved_tokens)
+        run.add("context_tokens", tokens)
+
+def record_context_prompt():
+    """A planner prompt carried the run's compressed context; counts the tokens that saved."""
+    if not METRICS_ENABLED:
+        return
+    run = current_run()
+    if run:
+        saved = run.context_tokens_retrieved - run.context_tokens
+        registry.inc("rag_context_tokens_saved_total", saved)
+        run.add("context_tokens_saved", saved)
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """LangChain callback that records prompt/completion tokens of every chat call."""
+    run_inline = True
+
+    def on_llm_end(self, response, **kwargs):
+        output = response.llm_output or {}
+        usage = output.get("token_usage") or {}
+        record_llm(
+            output.get("model_name", "unknown"),
+            usage.get("prompt_tokens", 0),
+            usage.get("completion_tokens", 0),
+        )
+
+# --- Node Instrumentation ---
+# cProfile allows one active profiler per process on newer Pythons
+_profile_lock = threading.Lock()
+
+def _profile_call(node: str, fn, state):
+    if not _profile_lock.acquire(blocking=False):
+        return fn(state)
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            return fn(state)
+        finally:
+            profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{node}_{timestamp}.prof"))
+    finally:
+        _profile_lock.release()
+
+def instrument_node(node: str, fn):
+    """
+    Wraps a graph node to record its wall time. Sync nodes listed in
+    PROFILE_NODES also run under cProfile, with stats saved to PROFILE_DIR.
+    """
+    if not METRICS_ENABLED:
+        return fn
+
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def timed_async(state):
+            start = time.perf_counter()
+            try:
+                return await fn(state)
+            finally:
+                record_node(node, time.perf_counter() - start)
+        return timed_async
+
+    profile = node in PROFILE_NODES or "all" in PROFILE_NODES
+
+    @functools.wraps(fn)
+    def timed(state):
+        start = time.perf_counter()
+        try:
+            return _profile_call(node, fn, state) if profile else fn(state)
+        finally:
+            record_node(node, time.perf_counter() - start)
+    return timed
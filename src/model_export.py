@@ -0,0 +1,90 @@
+# src/model_export.py
+#
+# Exports the YOLO weights to CPU-optimized runtimes and loads the exports.
+#
+#   python -m src.model_export --backend onnx --int8
+#   python -m src.model_export --backend openvino
+
+import argparse
+import os
+
+PYTORCH = "ultralytics"
+ONNX = "onnx"
+OPENVINO = "openvino"
+EXPORT_BACKENDS = (ONNX, OPENVINO)
+
+# --- Export Settings ---
+# Input size baked into the export; must match what the model was trained on
+EXPORT_IMGSZ = int(os.getenv("YOLO_EXPORT_IMGSZ", "640"))
+# Calibration dataset YAML for OpenVINO int8 (ultralytics falls back to its sample set)
+INT8_CALIBRATION_DATA = os.getenv("YOLO_INT8_DATA")
+
+def exported_path(weights: str, backend: str, int8: bool = False) -> str:
+    """Where the export of `weights` for `backend` lives (next to the weights, like ultralytics does)."""
+    stem = os.path.splitext(weights)[0]
+    if backend == ONNX:
+        return f"{stem}_int8.onnx" if int8 else f"{stem}.onnx"
+    if backend == OPENVINO:
+        return f"{stem}_int8_openvino_model" if int8 else f"{stem}_openvino_model"
+    raise ValueError(f"Unknown export backend: {backend}")
+
+def _is_fresh(path: str, weights: str) -> bool:
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(weights)
+
+def export_model(weights: str, backend: str, int8: bool = False, imgsz: int = EXPORT_IMGSZ) -> str:
+    """
+    Exports `weights` for `backend`, unless an export newer than the weights
+    already exists. ONNX int8 uses onnxruntime's dynamic quantization;
+    OpenVINO int8 uses NNCF post-training quantization through ultralytics.
+    Returns:
+        The path of the exported model.
+    """
+    target = exported_path(weights, backend, int8)
+    if _is_fresh(target, weights):
+        return target
+
+    from ultralytics import YOLO
+    model = YOLO(weights)
+    if backend == ONNX:
+        # Dynamic axes so analyze_site_images can send micro-batches of any size
+        fp32_path = exported_path(weights, ONNX)
+        if not _is_fresh(fp32_path, weights):
+            fp32_path = model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+        if int8:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(fp32_path, target, weight_type=QuantType.QUInt8)
+        return target
+
+    options = {"format": "openvino", "imgsz": imgsz, "dynamic": True, "int8": int8}
+    if int8 and INT8_CALIBRATION_DATA:
+        options["data"] = INT8_CALIBRATION_DATA
+    exported = model.export(**options)
+    if os.path.abspath(exported) != os.path.abspath(target):
+        os.replace(exported, target)
+    return target
+
+def load_exported(weights: str, backend: str, int8: bool = False):
+    """
+    Exports if needed and loads the result with ultralytics, which runs it on
+    the matching runtime. The task comes from the export's metadata, so a
+    segmentation model keeps its masks; raises ValueError if it doesn't match
+    the PyTorch model's (e.g. a stale export of other weights).
+    """
+    from ultralytics import YOLO
+    path = export_model(weights, backend, int8)
+    model = YOLO(path)
+    expected = YOLO(weights).task
+    if model.task != expected:
+        raise ValueError(f"{path} loads as a {model.task} model but {weights} is a {expected} model; delete the export to rebuild it.")
+    return model
+
+if __name__ == "__main__":
+    from src.tools.vision_tool import MODEL_PATH
+
+    parser = argparse.ArgumentParser(description="Export the YOLO weights to a CPU-optimized runtime.")
+    parser.add_argument("--backend", choices=EXPORT_BACKENDS, default=ONNX)
+    parser.add_argument("--int8", action="store_true", help="Quantize weights to int8.")
+    parser.add_argument("--weights", default=MODEL_PATH)
+    parser.add_argument("--imgsz", type=int, default=EXPORT_IMGSZ)
+    args = parser.parse_args()
+    print(f"Exported to {export_model(args.weights, args.backend, args.int8, args.imgsz)}")
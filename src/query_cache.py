@@ -0,0 +1,236 @@
+# src/query_cache.py
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import FrozenSet, List, Optional
+import numpy as np
+from src.lexical_index import EXACT_TERM, query_terms
+from src.metrics import registry
+
+def normalize_query(query: str) -> str:
+    """Case, whitespace and trailing punctuation don't change what a query retrieves."""
+    return re.sub(r"\s+", " ", query).strip().strip(".!?").strip().lower()
+
+def exact_terms(query: str) -> FrozenSet[str]:
+    """Rule IDs, metric names and numbers in the query, normalized ("40.0%" and "40" are the same)."""
+    terms = set()
+    for term in query_terms(query):
+        if not EXACT_TERM.match(term):
+            continue
+        term = term.lower().rstrip("%")
+        try:
+            term = format(float(term), "g")
+        except ValueError:
+            pass
+        terms.add(term)
+    return frozenset(terms)
+
+class _Entry:
+    __slots__ = ("key", "embedding", "context", "created")
+
+    def __init__(self, key: str, embedding: Optional[np.ndarray], context: str, created: float):
+        self.key = key
+        self.embedding = embedding
+        self.context = context
+        self.created = created
+
+class QueryCache:
+    """
+    Two-level cache of retrieved context in front of the vector store.
+
+    The exact tier is keyed on the normalized query text and needs no
+    embedding call. The semantic tier returns the context of a cached query
+    whose embedding is within `max_distance` (cosine) of the new query's and
+    whose rule IDs, metric names and numbers are the same: embeddings barely
+    tell "green cover above 40%" from "above 45%".
+
+    Entries expire after `ttl_s` and the least recently used are evicted past
+    `max_entries`. Every entry is written through to SQLite and reloaded on
+    start. The cache is tied to a corpus version; a different version empties it.
+    """
+
+    def __init__(self, db_path: str, max_entries: int, ttl_s: float, max_distance: float, corpus_version: str = ""):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.max_distance = max_distance
+        self.corpus_version = corpus_version
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Normalized embeddings of the semantic tier, rebuilt lazily after changes
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+        self._matrix_terms: List[FrozenSet[str]] = []
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS queries (
+                key TEXT PRIMARY KEY,
+                embedding BLOB,
+                context TEXT NOT NULL,
+                created REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._load()
+
+    # --- Persistence ---
+    def _load(self):
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'corpus_version'").fetchone()
+        if row is None or row[0] != self.corpus_version:
+            self._reset_db()
+            return
+        cutoff = time.time() - self.ttl_s
+        with self._conn:
+            self._conn.execute("DELETE FROM queries WHERE created < ?", (cutoff,))
+        rows = self._conn.execute(
+            "SELECT key, embedding, context, created FROM queries ORDER BY created DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        for key, blob, context, created in reversed(rows):
+            embedding = np.frombuffer(blob, dtype=np.float32) if blob else None
+            self._entries[key] = _Entry(key, embedding, context, created)
+
+    def _reset_db(self):
+        with self._conn:
+            self._conn.execute("DELETE FROM queries")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES ('corpus_version', ?)", (self.corpus_version,)
+            )
+
+    def set_corpus_version(self, version: str):
+        """Empties the cache if the indexed documents changed since it was filled."""
+        with self._lock:
+            if version == self.corpus_version:
+                return
+            print("Indexed documents changed; clearing the query cache.")
+            self.corpus_version = version
+            self._entries.clear()
+            self._matrix = None
+            self._reset_db()
+
+    # --- Lookups ---
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return now - entry.created > self.ttl_s
+
+    def _drop(self, keys: List[str]):
+        for key in keys:
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry.embedding is not None:
+                self._matrix = None
+        with self._conn:
+            self._conn.executemany("DELETE FROM queries WHERE key = ?", [(key,) for key in keys])
+
+    def get(self, query: str) -> Optional[str]:
+        """Exact tier: the cached context for this (normalized) query, or None."""
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, time.time()):
+                self._drop([key])
+                entry = None
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.hits["exact"] += 1
+        registry.inc("rag_query_cache_total", result="exact_hit")
+        return entry.context
+
+    def get_similar(self, query: str, embedding) -> Optional[str]:
+        """
+        Semantic tier: the context of the closest cached query, if it is within
+        `max_distance`. Call after get() missed; a miss here counts as a cache
+        miss. A hit also caches `query` itself in the exact tier, expiring
+        with the entry it matched.
+        """
+        vector = _unit(embedding)
+        with self._lock:
+            match = self._nearest(vector, exact_terms(normalize_query(query)))
+            if match is not None:
+                self._entries.move_to_end(match.key)
+                self._store(_Entry(normalize_query(query), None, match.context, match.created))
+                self.hits["semantic"] += 1
+            else:
+                self.misses += 1
+        registry.inc("rag_query_cache_total", result="semantic_hit" if match else "miss")
+        return match.context if match else None
+
+    def record_miss(self):
+        """Counts a miss for a lookup that skipped the semantic tier after get() missed."""
+        with self._lock:
+            self.misses += 1
+        registry.inc("rag_query_cache_total", result="miss")
+
+    def _nearest(self, query: np.ndarray, terms: FrozenSet[str]) -> Optional[_Entry]:
+        if self._matrix is None:
+            semantic = [e for e in self._entries.values() if e.embedding is not None]
+            self._matrix_keys = [e.key for e in semantic]
+            self._matrix_terms = [exact_terms(e.key) for e in semantic]
+            self._matrix = np.stack([e.embedding for e in semantic]) if semantic else np.empty((0, len(query)), np.float32)
+        if not len(self._matrix_keys) or self._matrix.shape[1] != len(query):
+            return None
+        similarities = self._matrix @ query
+        # Closest cached query with the same exact terms
+        candidates = [i for i, t in enumerate(self._matrix_terms) if t == terms]
+        if not candidates:
+            return None
+        best = max(candidates, key=lambda i: similarities[i])
+        if 1.0 - similarities[best] > self.max_distance:
+            return None
+        entry = self._entries.get(self._matrix_keys[best])
+        if entry is None or self._expired(entry, time.time()):
+            return None
+        return entry
+
+    def put(self, query: str, embedding, context: str):
+        """Caches `context` for `query` (and, with an embedding, for similar queries)."""
+        vector = _unit(embedding) if embedding is not None else None
+        with self._lock:
+            self._store(_Entry(normalize_query(query), vector, context, time.time()))
+
+    def _store(self, entry: _Entry):
+        """Adds `entry` in memory and on disk, then evicts expired and overflowing entries. Caller holds the lock."""
+        now = time.time()
+        previous = self._entries.get(entry.key)
+        if entry.embedding is not None or (previous is not None and previous.embedding is not None):
+            self._matrix = None
+        self._entries[entry.key] = entry
+        self._entries.move_to_end(entry.key)
+        stale = [k for k, e in self._entries.items() if self._expired(e, now)]
+        overflow = len(self._entries) - len(stale) - self.max_entries
+        if overflow > 0:
+            expired = set(stale)
+            # Least recently used first
+            stale += [k for k in self._entries if k not in expired][:overflow]
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO queries (key, embedding, context, created) VALUES (?, ?, ?, ?)",
+                (entry.key, entry.embedding.tobytes() if entry.embedding is not None else None, entry.context, entry.created),
+            )
+        if stale:
+            self._drop(stale)
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process."""
+        hits = sum(self.hits.values())
+        lookups = hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.hits["exact"],
+            "semantic_hits": self.hits["semantic"],
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        }
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
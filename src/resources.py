@@ -0,0 +1,84 @@
+# src/resources.py
+
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+class LazyResource:
+    """
+    A heavy object (model, vector store, client) that is only built the first
+    time it is needed. Loading is thread-safe: concurrent callers wait for the
+    single in-progress load instead of loading twice.
+    """
+
+    def __init__(self, name: str, loader: Callable[[], object]):
+        self.name = name
+        self._loader = loader
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self):
+        """Returns the resource, loading it on first use."""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._value = self._loader()
+                    self._loaded = True
+        return self._value
+
+    def warm(self) -> threading.Thread:
+        """Starts loading the resource on a background daemon thread."""
+        thread = threading.Thread(target=self._warm_quietly, name=f"warm-{self.name}", daemon=True)
+        thread.start()
+        return thread
+
+    def _warm_quietly(self):
+        try:
+            self.get()
+        except Exception as e:
+            # The next foreground get() retries and surfaces the error properly
+            print(f"Background warm-up of '{self.name}' failed: {e}")
+
+    def reset(self):
+        """Drops the loaded value so the next get() loads it again."""
+        with self._lock:
+            self._value = None
+            self._loaded = False
+
+# --- Global Registry ---
+_registry: Dict[str, LazyResource] = {}
+_registry_lock = threading.Lock()
+
+def register(name: str, loader: Callable[[], object]) -> LazyResource:
+    """Registers a lazily loaded resource, or returns the one already registered under `name`."""
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = LazyResource(name, loader)
+        return _registry[name]
+
+def get_resource(name: str):
+    """Returns the loaded resource registered under `name`."""
+    return _registry[name].get()
+
+def warm_up(
+    names: Optional[List[str]] = None,
+    background: bool = True,
+    exclude: Iterable[str] = (),
+) -> List[threading.Thread]:
+    """
+    Loads the named resources (all registered ones by default) ahead of first use.
+    Args:
+        background: If True, load on daemon threads and return them; otherwise load inline.
+        exclude: Names to skip.
+    """
+    resources = [_registry[name] for name in names] if names else list(_registry.values())
+    resources = [resource for resource in resources if resource.name not in exclude]
+    if not background:
+        for resource in resources:
+            resource.get()
+        return []
+    return [resource.warm() for resource in resources if not resource.loaded]
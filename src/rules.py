@@ -0,0 +1,184 @@
+# src/rules.py
+
+import json
+import os
+from dataclasses import dataclass, asdict, field
+from typing import Dict, List, Optional, Tuple
+from src.resources import register
+
+# --- Rulebook Settings ---
+RULES_PATH = os.getenv("COMPLIANCE_RULES_PATH", "./rag_data/compliance_rules.json")
+# Set CRITIQUE_LLM_FEEDBACK=on to have GPT-4o word the feedback sentence for the planner
+CRITIQUE_LLM_FEEDBACK = os.getenv("CRITIQUE_LLM_FEEDBACK", "off").lower() == "on"
+
+MIN = "min"  # metric must be >= threshold
+MAX = "max"  # metric must be <= threshold
+
+@dataclass(frozen=True)
+class Rule:
+    """One compliance rule from the rulebook."""
+    id: str
+    metric: str
+    threshold: float
+    direction: str
+    unit: str = ""
+    category: str = ""
+    description: str = ""
+    zone: Optional[str] = None
+
+@dataclass
+class RuleResult:
+    """Outcome of one rule. `margin` is positive when passing, negative when failing."""
+    rule_id: str
+    metric: str
+    value: float
+    threshold: float
+    direction: str
+    unit: str
+    passed: bool
+    margin: float
+
+@dataclass
+class ComplianceReport:
+    """Outcome of evaluating a design against every applicable rule."""
+    passed: bool
+    results: List[RuleResult] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def violations(self) -> List[RuleResult]:
+        return [r for r in self.results if not r.passed]
+
+    @property
+    def shortfall(self) -> float:
+        """Total amount by which the failing rules miss their thresholds (0.0 when passing)."""
+        if self.error:
+            return float("inf")
+        return sum(-r.margin for r in self.violations)
+
+    def feedback(self) -> str:
+        """A deterministic one-line summary: "PASS" or "FAIL: ..." listing every violation."""
+        if self.error:
+            return f"FAIL: {self.error}"
+        if self.passed:
+            return "PASS"
+        parts = []
+        for r in self.violations:
+            bound = "at least" if r.direction == MIN else "at most"
+            parts.append(f"{r.metric} is {r.value:g}{r.unit} but must be {bound} {r.threshold:g}{r.unit} ({r.rule_id})")
+        return "FAIL: " + "; ".join(parts) + "."
+
+    def to_dict(self) -> dict:
+        return {
+            "passed": self.passed,
+            "error": self.error,
+            "results": [asdict(r) for r in self.results],
+        }
+
+def _infer_direction(rule: dict) -> str:
+    """Falls back to the rule's wording when it has no explicit `direction`."""
+    text = rule.get("description", "").lower()
+    if any(phrase in text for phrase in ("not exceed", "at most", "maximum", "no more than")):
+        return MAX
+    return MIN
+
+def parse_rules(data: dict) -> List[Rule]:
+    """Turns the `rules` list of a compliance_rules.json document into Rule objects."""
+    rules = []
+    for raw in data.get("rules", []):
+        direction = raw.get("direction") or _infer_direction(raw)
+        if direction not in (MIN, MAX):
+            raise ValueError(f"Rule {raw.get('id')} has unknown direction: {direction}")
+        rules.append(Rule(
+            id=raw["id"],
+            metric=raw["compliance_metric"],
+            threshold=float(raw["threshold"]),
+            direction=direction,
+            unit=raw.get("unit", ""),
+            category=raw.get("category", ""),
+            description=raw.get("description", ""),
+            zone=raw.get("zone"),
+        ))
+    return rules
+
+class RuleEngine:
+    """
+    Evaluates analysis results against a compiled rulebook without any LLM call.
+    Rules are indexed by zone and then by `compliance_metric`, so evaluating a
+    design only touches the rules for the metrics it actually reports.
+    """
+
+    def __init__(self, rules: List[Rule]):
+        self.rules = rules
+        # zone -> metric -> [(rule id, threshold, sign, unit, direction)]; zone None applies everywhere
+        self._index: Dict[Optional[str], Dict[str, List[Tuple[str, float, int, str, str]]]] = {}
+        for rule in rules:
+            sign = 1 if rule.direction == MIN else -1
+            by_metric = self._index.setdefault(rule.zone, {})
+            by_metric.setdefault(rule.metric, []).append(
+                (rule.id, rule.threshold, sign, rule.unit, rule.direction)
+            )
+
+    @classmethod
+    def from_file(cls, path: str = RULES_PATH) -> "RuleEngine":
+        with open(path) as f:
+            return cls(parse_rules(json.load(f)))
+
+    def evaluate(self, analysis_results, zone: Optional[str] = None) -> ComplianceReport:
+        """
+        Checks every rule for `zone` (plus the zone-independent rules) whose
+        metric appears in `analysis_results`.
+        """
+        if not isinstance(analysis_results, dict):
+            return ComplianceReport(passed=False, error=f"analysis did not produce metrics ({analysis_results})")
+        if "error" in analysis_results:
+            return ComplianceReport(passed=False, error=f"analysis failed ({analysis_results['error']})")
+
+        results = []
+        indexes = [self._index.get(None, {})]
+        if zone is not None:
+            indexes.append(self._index.get(zone, {}))
+        for by_metric in indexes:
+            for metric, value in analysis_results.items():
+                for rule_id, threshold, sign, unit, direction in by_metric.get(metric, ()):
+                    margin = sign * (value - threshold)
+                    results.append(RuleResult(
+                        rule_id, metric, value, threshold, direction, unit, margin >= 0, round(margin, 4)
+                    ))
+        if not results:
+            return ComplianceReport(passed=False, error="no compliance rule matched the analysis metrics")
+        return ComplianceReport(passed=all(r.passed for r in results), results=results)
+
+# The rulebook is compiled once, on first use
+rule_engine = register("rule_engine", RuleEngine.from_file)
+
+def _as_fail(worded: str) -> str:
+    """The critique agent's wording, made to start with "FAIL" like the planner expects."""
+    worded = worded.strip()
+    return worded if worded.upper().startswith("FAIL") else f"FAIL: {worded}"
+
+def critique_analysis(analysis_results, zone: Optional[str] = None, llm_feedback: bool = CRITIQUE_LLM_FEEDBACK) -> Tuple[str, ComplianceReport]:
+    """
+    Runs the rule engine on a design's analysis.
+    Returns:
+        `(critique_feedback, report)` where the feedback is "PASS" or a sentence
+        starting with "FAIL" for the planner. With `llm_feedback`, the critique
+        agent rewords the violations; the PASS/FAIL decision is never the LLM's.
+    """
+    report = rule_engine.get().evaluate(analysis_results, zone)
+    feedback = report.feedback()
+    if report.passed or not llm_feedback:
+        return feedback, report
+
+    from src.agents import get_critique_agent
+    return _as_fail(get_critique_agent().invoke({"violations": feedback}).content), report
+
+async def acritique_analysis(analysis_results, zone: Optional[str] = None, llm_feedback: bool = CRITIQUE_LLM_FEEDBACK) -> Tuple[str, ComplianceReport]:
+    """Async version of critique_analysis(), for the async workflow."""
+    report = rule_engine.get().evaluate(analysis_results, zone)
+    feedback = report.feedback()
+    if report.passed or not llm_feedback:
+        return feedback, report
+
+    from src.agents import get_critique_agent
+    return _as_fail((await get_critique_agent().ainvoke({"violations": feedback})).content), report
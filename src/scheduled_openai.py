@@ -0,0 +1,70 @@
+# src/scheduled_openai.py
+#
+# LangChain's OpenAI chat and embedding models, with every API call routed
+# through the request scheduler in src/scheduler.py. The scheduler owns
+# retries, so the OpenAI SDK's own retries are turned off.
+
+from typing import List
+from langchain_core.messages import messages_to_dict
+from langchain_core.outputs import ChatResult
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from src.scheduler import request_key, scheduler
+
+# Completion budget assumed for calls that don't set max_tokens
+DEFAULT_COMPLETION_TOKENS = 512
+
+def _estimate_tokens(texts: List[str]) -> int:
+    # ~4 characters per token for English; settled against real usage afterwards
+    return sum(len(text) for text in texts) // 4 + 1
+
+def _chat_tokens_used(result: ChatResult) -> int:
+    usage = (result.llm_output or {}).get("token_usage") or {}
+    return usage.get("total_tokens", 0)
+
+def _without_usage(result: ChatResult) -> ChatResult:
+    """The result handed to coalesced callers: their tokens were already paid for and recorded."""
+    return ChatResult(generations=result.generations, llm_output={**(result.llm_output or {}), "token_usage": {}})
+
+class ScheduledChatOpenAI(ChatOpenAI):
+    """ChatOpenAI whose calls are rate limited, retried and coalesced by the scheduler."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**{"max_retries": 0, **kwargs})
+
+    def _schedule_args(self, messages, stop, kwargs) -> dict:
+        prompt_tokens = _estimate_tokens([str(m.content) for m in messages])
+        return {
+            "tokens": prompt_tokens + (self.max_tokens or DEFAULT_COMPLETION_TOKENS),
+            "key": request_key("chat", self._identifying_params, messages_to_dict(messages), stop, kwargs),
+            "usage": _chat_tokens_used,
+            "share": _without_usage,
+        }
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        send = lambda: super(ScheduledChatOpenAI, self)._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        return scheduler.call(self.model_name, send, **self._schedule_args(messages, stop, kwargs))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        send = lambda: super(ScheduledChatOpenAI, self)._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        return await scheduler.acall(self.model_name, send, **self._schedule_args(messages, stop, kwargs))
+
+class ScheduledOpenAIEmbeddings(OpenAIEmbeddings):
+    """
+    OpenAIEmbeddings whose calls are rate limited, retried and coalesced by the
+    scheduler. embed_query goes through embed_documents, so it is covered too.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**{"max_retries": 0, **kwargs})
+
+    def _schedule_args(self, texts) -> dict:
+        texts = list(texts)
+        return {"tokens": _estimate_tokens(texts), "key": request_key("embeddings", self.model, self.dimensions, texts)}
+
+    def embed_documents(self, texts, chunk_size=None, **kwargs):
+        send = lambda: super(ScheduledOpenAIEmbeddings, self).embed_documents(texts, chunk_size, **kwargs)
+        return scheduler.call(self.model, send, **self._schedule_args(texts))
+
+    async def aembed_documents(self, texts, chunk_size=None, **kwargs):
+        send = lambda: super(ScheduledOpenAIEmbeddings, self).aembed_documents(texts, chunk_size, **kwargs)
+        return await scheduler.acall(self.model, send, **self._schedule_args(texts))
@@ -0,0 +1,434 @@
+# src/scheduler.py
+#
+# Client-side scheduler for OpenAI calls (chat, embeddings and images). Every
+# call waits for its model's request and token budget, retries rate limits and
+# transient errors with jittered exponential backoff, and identical requests
+# already in flight are sent once and shared. When the budget is exhausted,
+# interactive callers are admitted ahead of batch jobs.
+
+import asyncio
+import contextvars
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+from src.metrics import registry
+
+# --- Priority Lanes ---
+# Lower runs first; the lane is carried in a context variable, so it follows
+# a run into LangGraph's node threads and asyncio tasks
+INTERACTIVE = 0
+BATCH = 1
+LANE_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+_current_lane: contextvars.ContextVar = contextvars.ContextVar("scheduler_lane", default=INTERACTIVE)
+
+@contextmanager
+def lane(priority: int):
+    """Runs the block's OpenAI calls in the given lane (INTERACTIVE or BATCH)."""
+    token = _current_lane.set(priority)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+def current_lane() -> int:
+    return _current_lane.get()
+
+# --- Scheduler Settings ---
+# Set OPENAI_SCHEDULER=off to call OpenAI directly (no limits, retries or coalescing)
+SCHEDULER_ENABLED = os.getenv("OPENAI_SCHEDULER", "on").lower() != "off"
+# (requests/min, tokens/min) per model name prefix; None means unlimited.
+# Defaults are OpenAI's tier-1 limits; override with OPENAI_RATE_LIMITS.
+DEFAULT_RATE_LIMITS = {
+    "gpt-4o-mini": (500, 200_000),
+    "gpt-4o": (500, 30_000),
+    "text-embedding": (3000, 1_000_000),
+    "dall-e-3": (5, None),
+    "dall-e-2": (5, None),
+}
+MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "6"))
+BACKOFF_BASE_S = float(os.getenv("OPENAI_BACKOFF_BASE_S", "0.5"))
+BACKOFF_MAX_S = float(os.getenv("OPENAI_BACKOFF_MAX_S", "30"))
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {"APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout", "RemoteProtocolError"}
+# How often an async caller waiting for its model's budget re-checks the queue
+ASYNC_POLL_S = float(os.getenv("OPENAI_ASYNC_POLL_S", "0.05"))
+
+def parse_rate_limits(spec: str) -> Dict[str, Tuple[Optional[int], Optional[int]]]:
+    """
+    Parses "gpt-4o=500/30000,dall-e-3=5" into {model: (rpm, tpm)}; a missing or
+    zero value means unlimited.
+    """
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, values = item.partition("=")
+        rpm, _, tpm = values.partition("/")
+        limits[model.strip()] = (int(rpm.strip() or 0) or None, int(tpm.strip() or 0) or None)
+    return limits
+
+RATE_LIMITS = {**DEFAULT_RATE_LIMITS, **parse_rate_limits(os.getenv("OPENAI_RATE_LIMITS", ""))}
+
+def request_key(*parts) -> str:
+    """Stable hash of a request's content, for coalescing identical in-flight calls."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# --- Rate Limiting ---
+class TokenBucket:
+    """
+    Continuously refilled budget of `per_minute` units. Calls take their
+    estimate up front; settle() corrects it once the real usage is known, which
+    may leave the bucket in debt until it refills.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken (0 if it can be taken now)."""
+        self._refill(now)
+        need = min(amount, self.capacity)  # a request larger than the bucket waits for a full one
+        return 0.0 if self.level >= need else (need - self.level) / self.rate
+
+    def take(self, amount: float):
+        self.level -= amount
+
+    def settle(self, delta: float):
+        self.level = max(-self.capacity, self.level - delta)
+
+class ModelLimiter:
+    """
+    Request and token buckets for one model, plus the queue of callers waiting
+    for them. Callers are admitted strictly in (lane, arrival) order, so a
+    batch job never takes the slot an interactive run is waiting for.
+    """
+
+    def __init__(self, model: str, rpm: Optional[int], tpm: Optional[int]):
+        self.model = model
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.paused_until = 0.0
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._arrivals = itertools.count()
+
+    def _wait_time(self, tokens: int, now: float) -> float:
+        wait = max(0.0, self.paused_until - now)
+        if self.requests:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens and tokens:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        return wait
+
+    def _admit(self, ticket: tuple, tokens: int) -> Optional[float]:
+        """
+        Takes the budget for `ticket` if it is first in line and the budget is
+        there (returns 0); otherwise returns the seconds until it could be, or
+        None while callers ahead of it are still waiting. Holds `_cond`.
+        """
+        if self._waiting[0] != ticket:
+            return None
+        wait = self._wait_time(tokens, time.monotonic())
+        if wait > 0:
+            return wait
+        heapq.heappop(self._waiting)
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens:
+            self.tokens.take(tokens)
+        self._cond.notify_all()
+        return 0.0
+
+    def _leave(self, ticket: tuple):
+        """Drops an abandoned ticket from the queue; it never took any budget. Holds `_cond`."""
+        self._waiting.remove(ticket)
+        heapq.heapify(self._waiting)
+        self._cond.notify_all()
+
+    def acquire(self, tokens: int, priority: int) -> float:
+        """Blocks until the call may be sent; returns the seconds spent waiting."""
+        start = time.monotonic()
+        ticket = (priority, next(self._arrivals))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    wait = self._admit(ticket, tokens)
+                    if wait == 0:
+                        break
+                    self._cond.wait(wait)
+            except BaseException:
+                self._leave(ticket)
+                raise
+        return time.monotonic() - start
+
+    async def aacquire(self, tokens: int, priority: int) -> float:
+        """
+        acquire() for event-loop callers: waits with asyncio.sleep instead of
+        tying up an executor thread. Threads can't wake a coroutine through
+        `_cond`, so a caller behind others in line re-checks every
+        ASYNC_POLL_S. A cancelled wait leaves the queue without taking budget.
+        """
+        start = time.monotonic()
+        ticket = (priority, next(self._arrivals))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._admit(ticket, tokens)
+                if wait == 0:
+                    break
+                await asyncio.sleep(ASYNC_POLL_S if wait is None else min(wait, ASYNC_POLL_S))
+        except BaseException:
+            with self._cond:
+                self._leave(ticket)
+            raise
+        return time.monotonic() - start
+
+    def settle(self, estimated: int, actual: int):
+        if self.tokens and actual:
+            with self._cond:
+                self.tokens.settle(actual - estimated)
+
+    def pause(self, seconds: float):
+        """Holds every caller of this model back after the server said it is over its limit."""
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+# --- Retries ---
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """The server's Retry-After hint in seconds, if the error carries one."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+def retry_delay(error: Exception, attempt: int) -> Optional[float]:
+    """
+    Seconds to wait before retrying after `error` on the given (0-based)
+    attempt, or None if the error isn't worth retrying. Uses full-jitter
+    exponential backoff, but never less than the server's Retry-After.
+    """
+    status = _status_code(error)
+    if getattr(error, "code", None) == "insufficient_quota":
+        return None  # a 429 that waiting won't fix
+    if status not in RETRYABLE_STATUS and type(error).__name__ not in RETRYABLE_ERRORS:
+        return None
+    backoff = random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt))
+    hinted = _retry_after(error)
+    return max(backoff, hinted) if hinted is not None else backoff
+
+# --- Single Flight ---
+class FlightAbandoned(Exception):
+    """Handed to coalesced callers when the caller sending the request was cancelled or timed out."""
+
+def _abandons_flight(error: BaseException) -> bool:
+    """
+    Whether `error` belongs to the leading caller rather than the request
+    (cancellation, its own timeout, Ctrl-C), so followers shouldn't share it.
+    """
+    return not isinstance(error, Exception) or isinstance(error, (TimeoutError, asyncio.TimeoutError))
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: the first caller for a key runs the
+    call and everyone arriving while it is in flight gets the same result (or
+    exception). Nothing is kept once the call finishes. If the leader gives
+    up, followers get FlightAbandoned and one of them sends the call again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+
+    def join(self, key: str) -> Tuple[Future, bool]:
+        """Returns (future, is_leader); the leader must call finish()."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def finish(self, key: str, future: Future, result=None, error: BaseException = None):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        if error is not None and _abandons_flight(error):
+            future.set_exception(FlightAbandoned(key))
+        elif error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+# --- Scheduler ---
+class RequestScheduler:
+    """
+    Wraps OpenAI calls with per-model rate limits, retries, priority lanes and
+    in-flight coalescing. Thread-safe, and usable from sync and async code.
+    """
+
+    def __init__(self, rate_limits: dict = RATE_LIMITS, max_retries: int = MAX_RETRIES, enabled: bool = SCHEDULER_ENABLED):
+        self.rate_limits = rate_limits
+        self.max_retries = max_retries
+        self.enabled = enabled
+        self._limiters: Dict[str, ModelLimiter] = {}
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+
+    def limiter(self, model: str) -> ModelLimiter:
+        with self._lock:
+            if model not in self._limiters:
+                # Longest prefix first, so "gpt-4o-mini" doesn't get the "gpt-4o" limits
+                prefix = next((p for p in sorted(self.rate_limits, key=len, reverse=True) if model.startswith(p)), None)
+                rpm, tpm = self.rate_limits[prefix] if prefix else (None, None)
+                self._limiters[model] = ModelLimiter(model, rpm, tpm)
+            return self._limiters[model]
+
+    def _record(self, model: str, priority: int, waited: float):
+        lane_name = LANE_NAMES.get(priority, str(priority))
+        registry.inc("openai_requests_total", model=model, lane=lane_name)
+        registry.observe("openai_queue_seconds", waited, model=model, lane=lane_name)
+
+    def _on_error(self, model: str, error: Exception, attempt: int) -> float:
+        """Returns the delay before the next attempt, or re-raises if there shouldn't be one."""
+        delay = retry_delay(error, attempt)
+        if delay is None or attempt >= self.max_retries:
+            raise error
+        if _status_code(error) == 429:
+            self.limiter(model).pause(delay)
+        registry.inc("openai_retries_total", model=model, status=str(_status_code(error) or type(error).__name__))
+        print(f"OpenAI {model} call failed ({error}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s.")
+        return delay
+
+    def _send(self, model: str, fn: Callable, tokens: int, usage: Optional[Callable]):
+        limiter = self.limiter(model)
+        priority = current_lane()
+        for attempt in range(self.max_retries + 1):
+            self._record(model, priority, limiter.acquire(tokens, priority))
+            try:
+                result = fn()
+            except Exception as e:
+                time.sleep(self._on_error(model, e, attempt))
+                continue
+            if usage:
+                limiter.settle(tokens, usage(result))
+            return result
+
+    async def _asend(self, model: str, fn: Callable, tokens: int, usage: Optional[Callable]):
+        limiter = self.limiter(model)
+        priority = current_lane()
+        for attempt in range(self.max_retries + 1):
+            self._record(model, priority, await limiter.aacquire(tokens, priority))
+            try:
+                result = await fn()
+            except Exception as e:
+                await asyncio.sleep(self._on_error(model, e, attempt))
+                continue
+            if usage:
+                limiter.settle(tokens, usage(result))
+            return result
+
+    def call(
+        self,
+        model: str,
+        fn: Callable,
+        tokens: int = 0,
+        key: Optional[str] = None,
+        usage: Optional[Callable] = None,
+        share: Optional[Callable] = None,
+    ):
+        """
+        Sends `fn()` once `model`'s budget allows, retrying transient failures.
+        Args:
+            model: Model name, used to pick the rate limits.
+            fn: Makes the actual API call.
+            tokens: Estimated tokens the call will use (prompt + completion).
+            key: Coalescing key (see request_key); identical keys in flight share one call.
+            usage: Returns the actual tokens used from the result, to correct the estimate.
+            share: Applied to the result handed to coalesced callers (e.g. to zero its usage).
+        """
+        if not self.enabled:
+            return fn()
+        if key is None:
+            return self._send(model, fn, tokens, usage)
+        while True:
+            future, leader = self._flights.join(key)
+            if leader:
+                break
+            registry.inc("openai_coalesced_total", model=model)
+            try:
+                result = future.result()
+            except FlightAbandoned:
+                continue  # the leader gave up; send it ourselves (or follow whoever does)
+            return share(result) if share else result
+        try:
+            result = self._send(model, fn, tokens, usage)
+        except BaseException as e:
+            self._flights.finish(key, future, error=e)
+            raise
+        self._flights.finish(key, future, result)
+        return result
+
+    async def acall(
+        self,
+        model: str,
+        fn: Callable,
+        tokens: int = 0,
+        key: Optional[str] = None,
+        usage: Optional[Callable] = None,
+        share: Optional[Callable] = None,
+    ):
+        """Async version of call(); `fn()` must return an awaitable."""
+        if not self.enabled:
+            return await fn()
+        if key is None:
+            return await self._asend(model, fn, tokens, usage)
+        while True:
+            future, leader = self._flights.join(key)
+            if leader:
+                break
+            registry.inc("openai_coalesced_total", model=model)
+            try:
+                # Shielded so a cancelled follower doesn't cancel the leader's shared future
+                result = await asyncio.shield(asyncio.wrap_future(future))
+            except FlightAbandoned:
+                continue
+            return share(result) if share else result
+        try:
+            result = await self._asend(model, fn, tokens, usage)
+        except BaseException as e:
+            self._flights.finish(key, future, error=e)
+            raise
+        self._flights.finish(key, future, result)
+        return result
+
+# Shared by every client in the process
+scheduler = RequestScheduler()
@@ -1,4 +1,5 @@
-from typing import TypedDict, Optional
+from typing import TypedDict, Optional, List
+from src.artifacts import ImageArtifact
 
 class GraphState(TypedDict):
     """
@@ -7,9 +8,18 @@ class GraphState(TypedDict):
     user_request: str
     rag_context: str
     dalle_prompt: Optional[str]
+    # Fan-out mode: several prompt variants rendered and scored per iteration
+    num_variants: Optional[int]
+    dalle_prompts: Optional[List[str]]
+    fanout_candidates: Optional[List[dict]]
+    fanout_render_wall_s: Optional[float]
+    fanout_stats: Optional[dict]
+    planner_seconds: Optional[float]
     image_path: Optional[str]
+    image_artifact: Optional[ImageArtifact]
     analysis_results: Optional[dict]
     critique_feedback: Optional[str]
+    compliance_results: Optional[dict]
     human_approval: Optional[str]
     iteration_count: int
     final_report: Optional[str]
@@ -0,0 +1,290 @@
+# src/tiling.py
+
+import os
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+from src.coverage import union_area, union_area_polygons, DEFAULT_RASTER_SCALE
+
+# --- Tiling Settings ---
+TILE_SIZE = int(os.getenv("TILE_SIZE", "1024"))
+TILE_OVERLAP = int(os.getenv("TILE_OVERLAP", "128"))
+# Tiles sent through the model per forward pass (and held in memory at once)
+TILE_BATCH_SIZE = int(os.getenv("TILE_BATCH_SIZE", "4"))
+# Images with a side longer than this are analyzed tile by tile instead of downscaled
+TILED_MIN_SIDE = int(os.getenv("TILED_MIN_SIDE", "2048"))
+NMS_IOU = 0.5
+# Coverage is summed block by block so no full-resolution mask is ever allocated
+COVERAGE_BLOCK = 4096
+
+RASTERIO_EXTENSIONS = (".tif", ".tiff", ".jp2", ".img", ".vrt")
+
+# --- Raster Sources ---
+def _to_bgr_uint8(tile: np.ndarray) -> np.ndarray:
+    """Normalizes a tile to the 3-channel uint8 BGR layout the model expects."""
+    if tile.dtype == np.uint16:
+        tile = (tile // 257).astype(np.uint8)
+    elif tile.dtype != np.uint8:
+        tile = np.clip(tile, 0, 255).astype(np.uint8)
+    if tile.ndim == 2:
+        return cv2.cvtColor(tile, cv2.COLOR_GRAY2BGR)
+    if tile.shape[2] == 4:
+        return np.ascontiguousarray(tile[:, :, :3])
+    return np.ascontiguousarray(tile)
+
+class ArrayRaster:
+    """A raster held in memory or memory-mapped (np.memmap, np.load(mmap_mode="r"), tifffile.memmap)."""
+
+    def __init__(self, array: np.ndarray):
+        self.array = array
+        self.height, self.width = array.shape[:2]
+
+    def read(self, y0: int, x0: int, y1: int, x1: int) -> np.ndarray:
+        # Slicing a memmap only pages in this window
+        return _to_bgr_uint8(np.asarray(self.array[y0:y1, x0:x1]))
+
+    def close(self):
+        self.array = None
+
+class RasterioRaster:
+    """Windowed reads from GeoTIFF and other GDAL formats, including compressed ones. Needs rasterio."""
+
+    def __init__(self, path: str):
+        import rasterio
+        self._dataset = rasterio.open(path)
+        self.height, self.width = self._dataset.height, self._dataset.width
+
+    def read(self, y0: int, x0: int, y1: int, x1: int) -> np.ndarray:
+        from rasterio.windows import Window
+        bands = [1, 2, 3] if self._dataset.count >= 3 else [1]
+        data = self._dataset.read(bands, window=Window(x0, y0, x1 - x0, y1 - y0))
+        tile = np.moveaxis(data, 0, -1)
+        if len(bands) == 3:
+            tile = tile[:, :, ::-1]  # GDAL bands are RGB
+        return _to_bgr_uint8(tile.squeeze(-1) if len(bands) == 1 else tile)
+
+    def close(self):
+        self._dataset.close()
+
+def open_raster(source):
+    """
+    Opens `source` (a path or an array) for windowed reads. `.npy` files and
+    uncompressed TIFFs are memory-mapped and GDAL formats read by window when
+    rasterio is installed, so memory stays bounded by the tile batch. Other
+    formats have to be decoded whole with OpenCV.
+    """
+    if isinstance(source, np.ndarray):
+        return ArrayRaster(source)
+    path = str(source)
+    lower = path.lower()
+    if lower.endswith(".npy"):
+        return ArrayRaster(np.load(path, mmap_mode="r"))
+    if lower.endswith(RASTERIO_EXTENSIONS):
+        try:
+            return RasterioRaster(path)
+        except ImportError:
+            pass
+        if lower.endswith((".tif", ".tiff")):
+            try:
+                import tifffile
+                return ArrayRaster(tifffile.memmap(path, mode="r"))
+            except (ImportError, ValueError):
+                pass  # not installed, or compressed/tiled and can't be mapped
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise FileNotFoundError(f"Raster not found or could not be loaded: {path}")
+    return ArrayRaster(image)
+
+# Held while PIL's decompression-bomb limit is lifted, so concurrent calls can't restore each other's None
+_pil_limit_lock = threading.Lock()
+
+def raster_shape(path: str) -> Optional[Tuple[int, int]]:
+    """`(height, width)` of an image file, read from its header only. None if unknown."""
+    if path.lower().endswith(".npy"):
+        try:
+            return tuple(np.load(path, mmap_mode="r").shape[:2])
+        except (OSError, ValueError):
+            return None
+    from PIL import Image
+    with _pil_limit_lock:
+        previous_limit = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = None  # survey rasters are legitimately huge
+        try:
+            # Only the header is parsed; the limit is back in place before any pixels are decoded
+            with Image.open(path) as image:
+                return image.height, image.width
+        except (OSError, ValueError):
+            return None
+        finally:
+            Image.MAX_IMAGE_PIXELS = previous_limit
+
+def needs_tiling(height: int, width: int, min_side: int = TILED_MIN_SIDE) -> bool:
+    return max(height, width) > min_side
+
+# --- Windows ---
+@dataclass(frozen=True)
+class Tile:
+    """A window to run the model on, and the core region whose detections it owns."""
+    y0: int
+    x0: int
+    y1: int
+    x1: int
+    core_y0: float
+    core_x0: float
+    core_y1: float
+    core_x1: float
+
+def _spans(length: int, tile_size: int, overlap: int) -> List[Tuple[int, int, float, float]]:
+    """1D windows `(start, stop, core_start, core_stop)`; cores split each overlap down the middle."""
+    if length <= tile_size:
+        return [(0, length, 0.0, float(length))]
+    stride = max(1, tile_size - overlap)
+    starts = list(range(0, length - tile_size, stride)) + [length - tile_size]
+    stops = [start + tile_size for start in starts]
+    bounds = [0.0] + [(starts[i + 1] + stops[i]) / 2 for i in range(len(starts) - 1)] + [float(length)]
+    return [(starts[i], stops[i], bounds[i], bounds[i + 1]) for i in range(len(starts))]
+
+def tile_windows(height: int, width: int, tile_size: int = TILE_SIZE, overlap: int = TILE_OVERLAP) -> List[Tile]:
+    """Overlapping windows covering the full extent; their cores partition it exactly."""
+    return [
+        Tile(y0, x0, y1, x1, cy0, cx0, cy1, cx1)
+        for y0, y1, cy0, cy1 in _spans(height, tile_size, overlap)
+        for x0, x1, cx0, cx1 in _spans(width, tile_size, overlap)
+    ]
+
+# --- Detections ---
+@dataclass
+class Detections:
+    """Boxes in image pixels with their confidences, class IDs and optional mask polygons."""
+    xyxy: np.ndarray
+    conf: np.ndarray
+    cls: np.ndarray
+    polygons: Optional[List[np.ndarray]] = None
+
+    @classmethod
+    def empty(cls) -> "Detections":
+        return cls(np.zeros((0, 4)), np.zeros(0), np.zeros(0))
+
+    def select(self, keep: np.ndarray) -> "Detections":
+        indexes = np.flatnonzero(keep) if keep.dtype == bool else keep
+        polygons = [self.polygons[i] for i in indexes] if self.polygons is not None else None
+        return Detections(self.xyxy[indexes], self.conf[indexes], self.cls[indexes], polygons)
+
+    def shifted(self, dx: float, dy: float) -> "Detections":
+        polygons = [np.asarray(p) + (dx, dy) for p in self.polygons] if self.polygons is not None else None
+        return Detections(self.xyxy + (dx, dy, dx, dy), self.conf, self.cls, polygons)
+
+    @staticmethod
+    def concat(parts: List["Detections"]) -> "Detections":
+        parts = [p for p in parts if len(p.xyxy)]
+        if not parts:
+            return Detections.empty()
+        polygons = None
+        if all(p.polygons is not None for p in parts):
+            polygons = [poly for p in parts for poly in p.polygons]
+        return Detections(
+            np.concatenate([p.xyxy for p in parts]),
+            np.concatenate([p.conf for p in parts]),
+            np.concatenate([p.cls for p in parts]),
+            polygons,
+        )
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float = NMS_IOU) -> np.ndarray:
+    """Greedy non-maximum suppression. Returns the indexes of the kept boxes, best first."""
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        w = np.clip(np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest]), 0, None)
+        inter = w * h
+        iou = inter / np.maximum(areas[best] + areas[rest] - inter, 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.intp)
+
+def batched_nms(detections: Detections, iou_threshold: float = NMS_IOU) -> Detections:
+    """Class-aware NMS: boxes of different classes never suppress each other."""
+    if len(detections.xyxy) == 0:
+        return detections
+    # Move every class to its own region of the plane
+    offset = detections.cls.astype(np.float64)[:, None] * (detections.xyxy.max() + 1)
+    return detections.select(nms(detections.xyxy + offset, detections.conf, iou_threshold))
+
+def _owned_by(detections: Detections, tile: Tile) -> np.ndarray:
+    """Detections whose center lies in the tile's core, so each object is kept by exactly one tile."""
+    cx = (detections.xyxy[:, 0] + detections.xyxy[:, 2]) / 2
+    cy = (detections.xyxy[:, 1] + detections.xyxy[:, 3]) / 2
+    return (cx >= tile.core_x0) & (cx < tile.core_x1) & (cy >= tile.core_y0) & (cy < tile.core_y1)
+
+def detect_tiled(
+    raster,
+    detect: Callable[[List[np.ndarray]], List[Detections]],
+    tile_size: int = TILE_SIZE,
+    overlap: int = TILE_OVERLAP,
+    batch_size: int = TILE_BATCH_SIZE,
+    iou_threshold: float = NMS_IOU,
+) -> Detections:
+    """
+    Runs `detect` over overlapping windows of `raster`, `batch_size` tiles at
+    a time, and merges the results into full-extent detections. Objects cut by
+    a tile border are kept from the tile that owns their center, and NMS then
+    removes duplicates left in the overlaps.
+    """
+    tiles = tile_windows(raster.height, raster.width, tile_size, overlap)
+    merged = []
+    for start in range(0, len(tiles), batch_size):
+        batch = tiles[start:start + batch_size]
+        images = [raster.read(t.y0, t.x0, t.y1, t.x1) for t in batch]
+        for tile, found in zip(batch, detect(images)):
+            found = found.shifted(tile.x0, tile.y0)
+            merged.append(found.select(_owned_by(found, tile)))
+    return batched_nms(Detections.concat(merged), iou_threshold)
+
+# --- Coverage ---
+def _polygon_bounds(polygons: List[np.ndarray]) -> np.ndarray:
+    bounds = np.zeros((len(polygons), 4))
+    for i, polygon in enumerate(polygons):
+        polygon = np.asarray(polygon).reshape(-1, 2)
+        if len(polygon):
+            bounds[i] = (*polygon.min(axis=0), *polygon.max(axis=0))
+    return bounds
+
+def coverage_over_extent(
+    detections: Detections,
+    height: int,
+    width: int,
+    class_groups: Dict[str, List[int]],
+    use_polygons: bool = True,
+    method: str = "auto",
+    scale: float = DEFAULT_RASTER_SCALE,
+    block: int = COVERAGE_BLOCK,
+) -> Dict[str, float]:
+    """
+    Same result as coverage_percentages over the full raster, but the union
+    areas are computed block by block, so memory depends on `block` rather than
+    on the raster size.
+    """
+    polygons = detections.polygons if use_polygons else None
+    bounds = _polygon_bounds(polygons) if polygons is not None else detections.xyxy
+    cls = detections.cls.astype(np.int64)
+    areas = dict.fromkeys(class_groups, 0.0)
+    for by in range(0, height, block):
+        for bx in range(0, width, block):
+            bh, bw = min(block, height - by), min(block, width - bx)
+            inside = (bounds[:, 0] < bx + bw) & (bounds[:, 2] > bx) & (bounds[:, 1] < by + bh) & (bounds[:, 3] > by)
+            for key, class_ids in class_groups.items():
+                selected = np.flatnonzero(inside & np.isin(cls, class_ids))
+                if not len(selected):
+                    continue
+                if polygons is not None:
+                    shifted = [np.asarray(polygons[i]) - (bx, by) for i in selected]
+                    areas[key] += union_area_polygons(shifted, bh, bw, scale)
+                else:
+                    areas[key] += union_area(detections.xyxy[selected] - (bx, by, bx, by), bh, bw, method, scale)
+    total_pixel_area = height * width
+    return {key: round(area / total_pixel_area * 100, 2) for key, area in areas.items()}
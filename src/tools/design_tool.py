@@ -1,55 +1,213 @@
 # src/tools/design_tool.py
 
 import os
-from openai import OpenAI
+import time
+import asyncio
 import requests
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from langchain.tools import tool
 from datetime import datetime
+from typing import Optional
+from src.resources import register
+from src.design_cache import DesignCache, CACHE_ONLY, READ_THROUGH
+from src.artifacts import ImageArtifact
+from src.metrics import registry, record_images
+from src.scheduler import request_key, scheduler
 
-# Initialize the OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Retries are left to src/scheduler.py, which every DALL-E call goes through
+def create_client():
+    """Creates the OpenAI client used for DALL-E calls."""
+    from openai import OpenAI
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+def create_async_client():
+    """Creates an asyncio OpenAI client for arender_design (see AsyncClients)."""
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+def create_http_client():
+    """Pooled asyncio HTTP client for downloading generated images."""
+    import httpx
+    return httpx.AsyncClient(timeout=60, limits=httpx.Limits(max_connections=64, max_keepalive_connections=16))
+
+# The OpenAI client is created on first use
+client = register("openai_client", create_client)
+
+class AsyncClients:
+    """
+    The asyncio OpenAI and HTTP clients used by arender_design. They bind to
+    the event loop they are first used on, so they can't be shared process-wide
+    like the sync client: each AsyncWorkflowRunner opens its own set (see
+    async_clients) and closes it when it finishes.
+    """
+
+    def __init__(self):
+        self.openai = create_async_client()
+        self.http = create_http_client()
+
+    async def aclose(self):
+        await self.openai.close()
+        await self.http.aclose()
+
+_async_clients: ContextVar[Optional[AsyncClients]] = ContextVar("async_clients", default=None)
+
+def use_async_clients(clients: AsyncClients):
+    """Makes renders awaited in the current task (and tasks it starts) use `clients`; the caller closes them."""
+    _async_clients.set(clients)
+
+@asynccontextmanager
+async def async_clients():
+    """Opens asyncio clients for every render awaited inside the block, and closes them after it."""
+    clients = AsyncClients()
+    token = _async_clients.set(clients)
+    try:
+        yield clients
+    finally:
+        _async_clients.reset(token)
+        await clients.aclose()
 
 # Define the directory to save generated images
 OUTPUT_DIR = "./outputs"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# --- DALL-E Settings ---
+DALLE_MODEL = "dall-e-3"
+DALLE_SIZE = "1024x1024"
+DALLE_QUALITY = "standard"
+# Set IMAGE_BACKEND=fake to draw designs offline with src/fakes.py (for benchmarks)
+IMAGE_BACKEND = os.getenv("IMAGE_BACKEND", "openai")
+
+# --- Design Cache ---
+# Mode is one of "read_through", "cache_only" or "bypass"
+DESIGN_CACHE_DIR = os.path.join(OUTPUT_DIR, "cache")
+DESIGN_CACHE_MODE = os.getenv("DESIGN_CACHE_MODE", READ_THROUGH)
+DESIGN_CACHE_MAX_BYTES = int(os.getenv("DESIGN_CACHE_MAX_BYTES", str(500 * 1024 * 1024)))
+design_cache = DesignCache(DESIGN_CACHE_DIR, DESIGN_CACHE_MAX_BYTES, DESIGN_CACHE_MODE)
+
+def _full_prompt(design_prompt: str) -> str:
+    """Enhances the planner's prompt with specific instructions for DALL-E."""
+    return (
+        f"Highly detailed top-down architectural site plan diagram. "
+        f"Focus on clear, distinct shapes for: buildings, green parks, roads, and water bodies. "
+        f"Rendered in a clear, legible style suitable for computer vision analysis. "
+        f"The design should feature: {design_prompt}"
+    )
+
+def _cache_key(full_dalle_prompt: str) -> str:
+    model = "fake" if IMAGE_BACKEND == "fake" else DALLE_MODEL
+    return design_cache.key(full_dalle_prompt, model, DALLE_SIZE, DALLE_QUALITY)
+
+def _generate_args(full_dalle_prompt: str) -> dict:
+    return {"model": DALLE_MODEL, "prompt": full_dalle_prompt, "size": DALLE_SIZE, "quality": DALLE_QUALITY, "n": 1}
+
+def _dalle_render(args: dict) -> bytes:
+    """Generates one image with DALL-E and downloads it."""
+    start = time.perf_counter()
+    response = client.get().images.generate(**args)
+    # Download the generated image from the URL provided by the API
+    image_response = requests.get(response.data[0].url)
+    image_response.raise_for_status() # Raise an error for bad status codes
+    record_images(DALLE_MODEL, 1, time.perf_counter() - start)
+    return image_response.content
+
+async def _adalle_render(args: dict) -> bytes:
+    clients = _async_clients.get()
+    if clients is None:
+        # Called outside a runner: clients for this call only
+        async with async_clients():
+            return await _adalle_render(args)
+    start = time.perf_counter()
+    response = await clients.openai.images.generate(**args)
+    image_response = await clients.http.get(response.data[0].url)
+    image_response.raise_for_status()
+    record_images(DALLE_MODEL, 1, time.perf_counter() - start)
+    return image_response.content
+
+def _fake_render(full_dalle_prompt: str) -> bytes:
+    from src.fakes import fake_design_png
+    start = time.perf_counter()
+    image_bytes = fake_design_png(full_dalle_prompt)
+    record_images("fake", 1, time.perf_counter() - start)
+    return image_bytes
+
+def _design_path() -> str:
+    """A new file under OUTPUT_DIR, named with a unique timestamp."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    return os.path.join(OUTPUT_DIR, f"design_{timestamp}.png")
+
+def _from_cache(cache_key: str):
+    """Returns the cached design as an ImageArtifact, or None if it must be generated."""
+    # The run gets its own link to the image, which cache eviction can't take away
+    file_path = design_cache.get(cache_key) and design_cache.export(cache_key, _design_path())
+    if file_path:
+        print(f"Design served from cache: {file_path}")
+        registry.inc("design_cache_hits_total")
+        return ImageArtifact.from_file(file_path)
+    if design_cache.mode == CACHE_ONLY:
+        raise FileNotFoundError("design not in cache and cache_only mode is set.")
+    return None
+
+def _from_download(cache_key: str, image_bytes: bytes) -> ImageArtifact:
+    """Decodes downloaded image bytes and schedules saving them to disk (and to the cache)."""
+    # Reports and checkpoints point at a file of the run's own, never at the cache entry
+    file_path = _design_path()
+    writer = None
+    if design_cache.mode == READ_THROUGH:
+        writer = lambda: design_cache.put(cache_key, image_bytes, copy_to=file_path)
+
+    artifact = ImageArtifact.from_bytes(image_bytes, file_path, writer=writer)
+    print(f"Design saving to {file_path}")
+    return artifact
+
+def render_design(design_prompt: str) -> ImageArtifact:
+    """
+    Generates (or fetches from the design cache) a site plan for `design_prompt`
+    and returns it as an ImageArtifact decoded once in memory. The image is
+    written to disk in the background; raises on any failure.
+    """
+    full_dalle_prompt = _full_prompt(design_prompt)
+
+    # Reuse a previous render of the exact same request if we have one
+    cache_key = _cache_key(full_dalle_prompt)
+    cached = _from_cache(cache_key)
+    if cached:
+        return cached
+    if IMAGE_BACKEND == "fake":
+        return _from_download(cache_key, _fake_render(full_dalle_prompt))
+
+    print("Generating design with DALL-E...")
+    # Call the DALL-E 3 API; concurrent identical requests share one generation
+    args = _generate_args(full_dalle_prompt)
+    image_bytes = scheduler.call(DALLE_MODEL, lambda: _dalle_render(args), key=request_key("image", args))
+    return _from_download(cache_key, image_bytes)
+
+async def arender_design(design_prompt: str) -> ImageArtifact:
+    """
+    Async version of render_design: awaits DALL-E and the download on the event
+    loop (through a pooled HTTP client) and decodes the image in a worker thread.
+    """
+    full_dalle_prompt = _full_prompt(design_prompt)
+    cache_key = _cache_key(full_dalle_prompt)
+    cached = await asyncio.to_thread(_from_cache, cache_key)
+    if cached:
+        return cached
+    if IMAGE_BACKEND == "fake":
+        image_bytes = await asyncio.to_thread(_fake_render, full_dalle_prompt)
+        return await asyncio.to_thread(_from_download, cache_key, image_bytes)
+
+    args = _generate_args(full_dalle_prompt)
+    image_bytes = await scheduler.acall(DALLE_MODEL, lambda: _adalle_render(args), key=request_key("image", args))
+    return await asyncio.to_thread(_from_download, cache_key, image_bytes)
+
 @tool
 def generate_aerial_design(design_prompt: str) -> str:
     """
     Generates a detailed, top-down, architectural site plan diagram using DALL-E 3.
     """
-    print("Generating design with DALL-E...")
     try:
-        # Enhance the user's prompt with specific instructions for DALL-E
-        full_dalle_prompt = (
-            f"Highly detailed top-down architectural site plan diagram. "
-            f"Focus on clear, distinct shapes for: buildings, green parks, roads, and water bodies. "
-            f"Rendered in a clear, legible style suitable for computer vision analysis. "
-            f"The design should feature: {design_prompt}"
-        )
-        
-        # Call the DALL-E 3 API
-        response = client.images.generate(
-            model="dall-e-3", 
-            prompt=full_dalle_prompt, 
-            size="1024x1024", 
-            quality="standard", 
-            n=1
-        )
-
-        # Download the generated image from the URL provided by the API
-        image_url = response.data[0].url
-        image_response = requests.get(image_url)
-        image_response.raise_for_status() # Raise an error for bad status codes
-
-        # Save the image to a file with a unique timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_path = os.path.join(OUTPUT_DIR, f"design_{timestamp}.png")
-        
-        with open(file_path, "wb") as f:
-            f.write(image_response.content)
-            
-        print(f"Design saved to {file_path}")
-        return file_path
+        artifact = render_design(design_prompt)
+        # Tool callers only get the path, so make sure the file is there
+        return artifact.wait_persisted()
     except Exception as e:
-        return f"An error occurred during image generation: {str(e)}"
\ No newline at end of file
+        return f"An error occurred during image generation: {str(e)}"
@@ -1,51 +1,206 @@
 # src/tools/rag_tool.py
 
 import os
+import time
+import asyncio
 from langchain.tools import tool
-from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.document_loaders import PyPDFLoader, JSONLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from src.resources import register
+from src.metrics import record_context, record_retrieval, record_retrieval_route
+from src.query_cache import QueryCache
+from src.context_compression import CONTEXT_TOKEN_BUDGET, compress_context
+from src.lexical_index import HYBRID, LEXICAL, VECTOR, LexicalIndex, fuse, route
 
 # Define paths to the data and the persistent vector store
 VECTOR_STORE_PATH = "./chroma_db"
+# "mmap" uses the embedded memory-mapped index in src/vector_index.py instead of Chroma
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", "./vector_index")
+DATA_DIR = "./data"
 DATA_PATH_PDF = "./data/Master_Plan_for_Delhi_2021.pdf" 
 DATA_PATH_JSON = "./data/compliance_rules.json"
+# Chunks retrieved per query
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "4"))
+CHUNK_SEPARATOR = "\n---\n"
 
-def get_retriever():
+# --- Hybrid Retrieval ---
+# A BM25 index of the same chunks answers rule ID / metric / threshold lookups
+# locally and is fused with vector search for queries that mix them with prose
+HYBRID_RETRIEVAL_ENABLED = os.getenv("RAG_HYBRID", "on").lower() != "off"
+LEXICAL_INDEX_NAME = "lexical.sqlite3"
+
+# --- Context Compression ---
+# Retrieved chunks are stitched, reranked, deduplicated and packed into
+# RAG_CONTEXT_TOKEN_BUDGET before they reach the planner prompt
+CONTEXT_COMPRESSION_ENABLED = os.getenv("RAG_CONTEXT_COMPRESSION", "on").lower() != "off"
+
+# --- Query Cache ---
+# Retrieved context is cached by query text and, with QUERY_CACHE_SEMANTIC=on,
+# by query embedding for paraphrases; set QUERY_CACHE=off to always search the store
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE", "on").lower() != "off"
+# Off by default: tune QUERY_CACHE_MAX_DISTANCE on your own queries before turning it on
+QUERY_CACHE_SEMANTIC = os.getenv("QUERY_CACHE_SEMANTIC", "off").lower() == "on"
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH", "./outputs/query_cache.sqlite3")
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "2048"))
+QUERY_CACHE_TTL_S = float(os.getenv("QUERY_CACHE_TTL_S", str(7 * 24 * 3600)))
+# Cosine distance under which a cached query counts as the same question
+QUERY_CACHE_MAX_DISTANCE = float(os.getenv("QUERY_CACHE_MAX_DISTANCE", "0.08"))
+
+def get_retriever(embedding=None):
     """
-    Initializes a Chroma vector store. If the store doesn't exist, it creates it
-    by loading, splitting, and embedding the documents. Otherwise, it loads the
-    existing store from disk.
+    Opens the persistent vector store (Chroma, or the memory-mapped index with
+    VECTOR_BACKEND=mmap) and brings it up to date with the source documents:
+    the configured PDF/JSON files plus any other PDF or JSON file dropped into
+    DATA_DIR. Only new or changed chunks are embedded.
+    Args:
+        embedding: Optional embedding function (defaults to src.ingest.get_embeddings()).
     Returns:
         A LangChain retriever object.
     """
-    if not os.path.exists(VECTOR_STORE_PATH):
-        print("Creating new vector store...")
-        # Load documents from PDF and JSON sources
-        pdf_loader = PyPDFLoader(DATA_PATH_PDF)
-        pdf_docs = pdf_loader.load()
-        json_loader = JSONLoader(file_path=DATA_PATH_JSON, jq_schema='.rules[].description', text_content=False)
-        json_docs = json_loader.load()
-        
-        # Combine all documents
-        all_docs = pdf_docs + json_docs
-        
-        # Split documents into smaller, manageable chunks
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        splits = text_splitter.split_documents(all_docs)
-        
-        # Create and persist the vector store using OpenAI embeddings
-        vector_store = Chroma.from_documents(documents=splits, embedding=OpenAIEmbeddings(), persist_directory=VECTOR_STORE_PATH)
-        print("Vector store created successfully.")
+    # Imported here so that importing this module stays cheap
+    from src.ingest import get_embeddings, find_sources, sync_vector_store, MANIFEST_NAME
+
+    embedding = embedding or get_embeddings()
+    if VECTOR_BACKEND == "mmap":
+        from src.vector_index import MmapVectorStore
+        vector_store = MmapVectorStore(VECTOR_INDEX_PATH, embedding)
     else:
-        # Load the existing vector store from disk
-        vector_store = Chroma(persist_directory=VECTOR_STORE_PATH, embedding_function=OpenAIEmbeddings())
-    
-    return vector_store.as_retriever()
+        from langchain_community.vectorstores import Chroma
+        vector_store = Chroma(persist_directory=VECTOR_STORE_PATH, embedding_function=embedding)
+    sources = find_sources(DATA_PATH_PDF, DATA_PATH_JSON, DATA_DIR)
+    sync_vector_store(
+        vector_store,
+        sources,
+        os.path.join(_store_path(), MANIFEST_NAME),
+        lexical_index=lexical_index.get() if HYBRID_RETRIEVAL_ENABLED else None,
+    )
+    if VECTOR_BACKEND == "mmap":
+        vector_store.optimize()
+    if query_cache.loaded:
+        # Context cached before this sync may come from documents that changed
+        query_cache.get().set_corpus_version(_corpus_version())
+
+    return vector_store.as_retriever(search_kwargs={"k": RAG_TOP_K})
+
+def _store_path() -> str:
+    return VECTOR_INDEX_PATH if VECTOR_BACKEND == "mmap" else VECTOR_STORE_PATH
+
+def _corpus_version() -> str:
+    from src.ingest import corpus_version, MANIFEST_NAME
+    # The backends rank ties differently, so context cached from one isn't reused for the other
+    return f"{VECTOR_BACKEND}:{RAG_TOP_K}:{corpus_version(os.path.join(_store_path(), MANIFEST_NAME))}"
+
+def create_lexical_index() -> LexicalIndex:
+    return LexicalIndex(os.path.join(_store_path(), LEXICAL_INDEX_NAME))
+
+def create_query_cache() -> QueryCache:
+    return QueryCache(
+        QUERY_CACHE_PATH,
+        QUERY_CACHE_MAX_ENTRIES,
+        QUERY_CACHE_TTL_S,
+        QUERY_CACHE_MAX_DISTANCE,
+        corpus_version=_corpus_version(),
+    )
+
+# The retriever and the indexes and cache beside it are built on first use, not when the module is loaded
+retriever = register("retriever", get_retriever)
+lexical_index = register("lexical_index", create_lexical_index)
+query_cache = register("query_cache", create_query_cache)
+
+def _join(docs) -> str:
+    # Join the content of the retrieved documents into a single string
+    return CHUNK_SEPARATOR.join([doc.page_content for doc in docs])
+
+def compress(query: str, context: str) -> str:
+    """Compresses retrieved context for the prompt (see src/context_compression.py) and records the savings."""
+    if not CONTEXT_COMPRESSION_ENABLED or not context:
+        return context
+    result = compress_context(query, context.split(CHUNK_SEPARATOR), CONTEXT_TOKEN_BUDGET)
+    record_context(result.retrieved_tokens, result.tokens)
+    return CHUNK_SEPARATOR.join(result.chunks)
+
+def _lexical_search(query: str, strategy: str, k: int):
+    """Lexical hits for LEXICAL and HYBRID queries (the store must be synced first), else None."""
+    if not HYBRID_RETRIEVAL_ENABLED or strategy not in (LEXICAL, HYBRID):
+        return None
+    return lexical_index.get().search(query, k * 2 if strategy == HYBRID else k)
 
-# Initialize the retriever when the module is loaded
-retriever = get_retriever()
+def _vector_context(docs, lexical_docs, k: int) -> str:
+    # Vector results alone, or fused with the lexical ranking
+    return _join(fuse([docs, lexical_docs], k) if lexical_docs else docs)
+
+def lookup_context(query: str) -> str:
+    """
+    Retrieved context for `query`: from the exact tier of the query cache if
+    possible (no embedding call), else from its semantic tier (with
+    QUERY_CACHE_SEMANTIC=on), else from the vector store. The query is
+    embedded once for both the semantic tier and the search.
+
+    Pure rule ID / metric / number lookups are answered from the lexical
+    index without embedding the query (falling back to the vector path if
+    nothing matches); queries that mix such terms with prose fuse the lexical
+    and vector rankings. Only plain prose queries use the semantic tier: the
+    embeddings of "GRN-01 ..." and "GRN-02 ..." are nearly the same, so a
+    query with exact terms is cached (and matched) by its text alone.
+    """
+    cache = query_cache.get() if QUERY_CACHE_ENABLED else None
+    context = cache.get(query) if cache else None
+    if context is not None:
+        return context
+    vector_retriever = retriever.get()
+    k = vector_retriever.search_kwargs.get("k", RAG_TOP_K)
+    strategy = route(query)
+    lexical_docs = _lexical_search(query, strategy, k)
+    if strategy == LEXICAL and lexical_docs:
+        record_retrieval_route(LEXICAL)
+        return _join(lexical_docs)
+    record_retrieval_route(strategy if lexical_docs else "vector")
+    if cache is None:
+        return _vector_context(vector_retriever.invoke(query), lexical_docs, k)
+    if strategy != VECTOR or not QUERY_CACHE_SEMANTIC:
+        cache.record_miss()
+        context = _vector_context(vector_retriever.invoke(query), lexical_docs, k)
+        cache.put(query, None, context)
+        return context
+    store = vector_retriever.vectorstore
+    embedding = store.embeddings.embed_query(query)
+    context = cache.get_similar(query, embedding)
+    if context is None:
+        docs = store.similarity_search_by_vector(embedding, **vector_retriever.search_kwargs)
+        context = _vector_context(docs, lexical_docs, k)
+        cache.put(query, embedding, context)
+    return context
+
+async def alookup_context(query: str) -> str:
+    """Async version of lookup_context; a first-time store or cache load runs in a worker thread."""
+    cache = None
+    if QUERY_CACHE_ENABLED:
+        cache = query_cache.get() if query_cache.loaded else await asyncio.to_thread(query_cache.get)
+    context = cache.get(query) if cache else None
+    if context is not None:
+        return context
+    vector_retriever = retriever.get() if retriever.loaded else await asyncio.to_thread(retriever.get)
+    k = vector_retriever.search_kwargs.get("k", RAG_TOP_K)
+    strategy = route(query)
+    lexical_docs = _lexical_search(query, strategy, k)
+    if strategy == LEXICAL and lexical_docs:
+        record_retrieval_route(LEXICAL)
+        return _join(lexical_docs)
+    record_retrieval_route(strategy if lexical_docs else "vector")
+    if cache is None:
+        return _vector_context(await vector_retriever.ainvoke(query), lexical_docs, k)
+    if strategy != VECTOR or not QUERY_CACHE_SEMANTIC:
+        cache.record_miss()
+        context = _vector_context(await vector_retriever.ainvoke(query), lexical_docs, k)
+        await asyncio.to_thread(cache.put, query, None, context)
+        return context
+    store = vector_retriever.vectorstore
+    embedding = await store.embeddings.aembed_query(query)
+    context = cache.get_similar(query, embedding)
+    if context is None:
+        docs = await store.asimilarity_search_by_vector(embedding, **vector_retriever.search_kwargs)
+        context = _vector_context(docs, lexical_docs, k)
+        await asyncio.to_thread(cache.put, query, embedding, context)
+    return context
 
 @tool
 def rag_compliance_lookup(query: str) -> str:
@@ -53,6 +208,18 @@ def rag_compliance_lookup(query: str) -> str:
     Looks up relevant urban planning compliance rules from the vector store
     based on a user's query.
     """
-    docs = retriever.invoke(query)
-    # Join the content of the retrieved documents into a single string
-    return "\n---\n".join([doc.page_content for doc in docs])
\ No newline at end of file
+    start = time.perf_counter()
+    context = compress(query, lookup_context(query))
+    record_retrieval(time.perf_counter() - start)
+    return context
+
+async def arag_compliance_lookup(query: str) -> str:
+    """Async version of rag_compliance_lookup."""
+    start = time.perf_counter()
+    context = compress(query, await alookup_context(query))
+    record_retrieval(time.perf_counter() - start)
+    return context
+
+if __name__ == "__main__":
+    # python -m src.tools.rag_tool -- syncs the vector store and prints ingestion stats
+    get_retriever()
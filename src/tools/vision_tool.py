@@ -1,65 +1,352 @@
 # src/tools/vision_tool.py
 
+import os
+import glob
+import time
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from langchain.tools import tool
-from ultralytics import YOLO
 import cv2
-from typing import Dict
+import numpy as np
+from typing import Dict, List, Union
+from src.coverage import coverage_percentages, DEFAULT_RASTER_SCALE
+from src.resources import register
+from src.analysis_cache import AnalysisMemo, sha256_bytes, sha256_file
+from src.artifacts import ImageArtifact
+from src.metrics import record_yolo
+from src.analysis_pool import DEFAULT_ANALYSIS_CONCURRENCY, analysis_pool, in_worker
+from src.tiling import (
+    Detections, TILE_SIZE, TILE_OVERLAP, TILE_BATCH_SIZE, coverage_over_extent, detect_tiled, needs_tiling,
+    open_raster, raster_shape,
+)
 
 # --- Load Custom Model ---
 # This path points to your custom-trained model file in the 'models' directory
-MODEL_PATH = "models/urbanplan_yolov8.pt"
-model = YOLO(MODEL_PATH) 
+MODEL_PATH = os.getenv("YOLO_MODEL_PATH", "models/urbanplan_yolov8.pt")
+# "ultralytics" (PyTorch), "onnx" or "openvino" (exported on first use, see
+# src/model_export.py), or "stub" for the torch-free detector in src/fakes.py
+YOLO_BACKEND = os.getenv("YOLO_BACKEND", "ultralytics")
+# Set YOLO_INT8=on to run the onnx/openvino export with int8-quantized weights
+YOLO_INT8 = os.getenv("YOLO_INT8", "off").lower() == "on"
+
+def load_model(backend: str = None, int8: bool = None):
+    """
+    Loads the YOLO weights for `backend` (default YOLO_BACKEND). Ultralytics is
+    imported here because it pulls in torch. If an exported runtime can't be
+    built or loaded, it falls back to PyTorch.
+    """
+    backend = backend or YOLO_BACKEND
+    int8 = YOLO_INT8 if int8 is None else int8
+    if backend == "stub":
+        from src.fakes import StubYOLO
+        return StubYOLO()
+    from src.model_export import EXPORT_BACKENDS, load_exported
+    if backend in EXPORT_BACKENDS:
+        try:
+            return load_exported(MODEL_PATH, backend, int8)
+        except Exception as e:
+            print(f"Could not use the {backend} model ({e}); falling back to PyTorch.")
+    from ultralytics import YOLO
+    return YOLO(MODEL_PATH)
+
+# The model is loaded on first use, not at import time
+yolo_model = register("yolo_model", load_model)
+# Ultralytics models aren't safe to call from several threads at once
+_model_lock = threading.Lock()
+# What to warm up for analysis: the worker processes load their own model
+ANALYZER_RESOURCE = "analysis_pool" if analysis_pool is not None else "yolo_model"
 
 # --- Define Custom Class IDs ---
 # These IDs must match the ones from your Roboflow training project
 # 0: building, 1: green_space, 2: water_body (as an example)
-BUILDING_CLASSES = [0] 
+BUILDING_CLASSES = [0]
 GREEN_SPACE_CLASSES = [1]
+COVERAGE_CLASS_GROUPS = {
+    "green_cover_percentage": GREEN_SPACE_CLASSES,
+    "building_footprint_percentage": BUILDING_CLASSES,
+}
 
-@tool
-def yolo_site_analyzer(image_path: str) -> dict:
+# --- Coverage Settings ---
+# "exact" (union of boxes), "raster" (downsampled occupancy mask) or "auto"
+COVERAGE_METHOD = "auto"
+COVERAGE_RASTER_SCALE = DEFAULT_RASTER_SCALE
+# Use segmentation masks instead of boxes when the model provides them
+COVERAGE_USE_MASKS = True
+
+# --- Batch Settings ---
+# How many images are sent through the model in a single forward pass
+DEFAULT_BATCH_SIZE = 8
+
+# --- Async Settings ---
+# Async callers run YOLO (or wait on the analysis pool) on this many dedicated threads, off the event loop
+ANALYSIS_THREADS = int(os.getenv("ANALYSIS_THREADS", str(DEFAULT_ANALYSIS_CONCURRENCY)))
+_analysis_executor = ThreadPoolExecutor(max_workers=ANALYSIS_THREADS, thread_name_prefix="yolo")
+
+# --- Analysis Memo ---
+# Results are memoized by image content + model weights; set ANALYSIS_MEMO=off to disable
+ANALYSIS_MEMO_ENABLED = os.getenv("ANALYSIS_MEMO", "on").lower() != "off"
+ANALYSIS_MEMO_PATH = os.getenv("ANALYSIS_MEMO_PATH", "./outputs/analysis_memo.sqlite3")
+analysis_memo = register("analysis_memo", lambda: AnalysisMemo(ANALYSIS_MEMO_PATH))
+
+def _compute_model_key() -> str:
+    """Hash of the weights plus the coverage settings, since both change the result."""
+    settings = f"{COVERAGE_METHOD}:{COVERAGE_RASTER_SCALE}:{COVERAGE_USE_MASKS}"
+    if YOLO_BACKEND == "stub":
+        weights = "stub"
+    else:
+        # Exported and quantized models give slightly different results
+        weights = f"{sha256_file(MODEL_PATH)}:{YOLO_BACKEND}:{'int8' if YOLO_INT8 else 'fp32'}"
+    return f"{weights}:{settings}"
+
+model_key = register("yolo_model_key", _compute_model_key)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp")
+
+def _read_image(image: Union[str, np.ndarray, ImageArtifact]):
     """
-    Analyzes a site plan image using a custom-trained YOLOv8 model
-    to quantify the percentage of green space and building footprint.
+    Returns `(payload, content hash)` for a path, an ImageArtifact or an
+    already-decoded array, without decoding anything: the payload is the
+    file's encoded bytes (read once, and later decoded from the same bytes that
+    were hashed) or the BGR array itself. Returns `(None, None)` if a path
+    can't be read.
     """
+    if isinstance(image, ImageArtifact):
+        return image.image, image.content_hash
+    if isinstance(image, np.ndarray):
+        header = f"{image.dtype}:{image.shape}".encode("utf-8")
+        return image, sha256_bytes(header + np.ascontiguousarray(image).tobytes())
     try:
-        img = cv2.imread(image_path)
-        if img is None:
+        with open(image, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None, None
+    return data, sha256_bytes(data)
+
+def _decode(payload) -> Union[np.ndarray, None]:
+    """The BGR array for a payload from _read_image, or None if the bytes aren't an image."""
+    if isinstance(payload, np.ndarray):
+        return payload
+    return cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+def _detections_from_result(result) -> Detections:
+    """Converts one YOLO result into plain arrays (and mask polygons, if the model has them)."""
+    boxes = result.boxes
+    xyxy = boxes.xyxy.cpu().numpy()
+    conf = boxes.conf.cpu().numpy() if getattr(boxes, "conf", None) is not None else np.ones(len(xyxy))
+    polygons = list(result.masks.xy) if result.masks is not None else None
+    return Detections(xyxy, conf, boxes.cls.cpu().numpy(), polygons)
+
+def _run_model(images: List[np.ndarray]):
+    """One forward pass over a micro-batch of BGR images; passes from different threads run one at a time."""
+    model = yolo_model.get()
+    with _model_lock:
+        inference_start = time.perf_counter()
+        results = model(images, verbose=False)
+        record_yolo(time.perf_counter() - inference_start, len(images))
+    return results
+
+def _coverage_from_result(result, height: int, width: int) -> Dict[str, float]:
+    """Converts one YOLO result into green cover / building footprint percentages."""
+    boxes = result.boxes
+    polygons = None
+    if COVERAGE_USE_MASKS and result.masks is not None:
+        polygons = result.masks.xy
+    return coverage_percentages(
+        boxes.xyxy.cpu().numpy(),
+        boxes.cls.cpu().numpy(),
+        height,
+        width,
+        COVERAGE_CLASS_GROUPS,
+        polygons=polygons,
+        method=COVERAGE_METHOD,
+        scale=COVERAGE_RASTER_SCALE,
+    )
+
+# --- Tiled Analysis ---
+def analyze_raster_tiled(
+    source: Union[str, np.ndarray],
+    tile_size: int = TILE_SIZE,
+    overlap: int = TILE_OVERLAP,
+    batch_size: int = TILE_BATCH_SIZE,
+) -> Dict[str, float]:
+    """
+    Analyzes a large raster at full resolution in overlapping tiles instead of
+    downscaling it. Only `batch_size` tiles are in memory at once (the raster
+    itself is memory-mapped or read by window where the format allows), tile
+    detections are merged with NMS, and coverage is computed over the full extent.
+    """
+    raster = open_raster(source)
+    try:
+        detections = detect_tiled(
+            raster,
+            lambda tiles: [_detections_from_result(r) for r in _run_model(tiles)],
+            tile_size,
+            overlap,
+            batch_size,
+        )
+        return coverage_over_extent(
+            detections,
+            raster.height,
+            raster.width,
+            COVERAGE_CLASS_GROUPS,
+            use_polygons=COVERAGE_USE_MASKS,
+            method=COVERAGE_METHOD,
+            scale=COVERAGE_RASTER_SCALE,
+        )
+    finally:
+        raster.close()
+
+def _is_large(image: Union[str, np.ndarray, ImageArtifact]) -> bool:
+    """Whether `image` should go through the tiled path; checked without decoding paths."""
+    if isinstance(image, ImageArtifact):
+        image = image.image
+    if isinstance(image, np.ndarray):
+        return needs_tiling(*image.shape[:2])
+    if str(image).lower().endswith(".npy"):
+        return True  # only the tiled reader can open these
+    shape = raster_shape(image)
+    return shape is not None and needs_tiling(*shape)
+
+def _analyze_large(image: Union[str, np.ndarray, ImageArtifact], memo, key: str) -> dict:
+    """Tiled analysis of one large image, through the memo when it can be hashed cheaply."""
+    if isinstance(image, ImageArtifact):
+        image_hash, source = image.content_hash, image.image
+    elif isinstance(image, np.ndarray):
+        image_hash, source = None, image
+    else:
+        try:
+            image_hash, source = sha256_file(image), image
+        except OSError:
             return {"error": "Image not found or could not be loaded."}
-            
-        H, W, _ = img.shape
-        total_pixel_area = H * W
-
-        # Run inference with your custom model
-        results = model(img)
-
-        green_space_pixel_area = 0
-        building_footprint_pixel_area = 0
-
-        # Iterate through the detection results
-        for result in results:
-            for box in result.boxes:
-                # Get bounding box coordinates and class ID
-                x1, y1, x2, y2 = box.xyxy[0]
-                cls_id = int(box.cls[0])
-                box_pixel_area = (x2 - x1) * (y2 - y1)
-                
-                # Add the area to the correct category based on the class ID
-                if cls_id in GREEN_SPACE_CLASSES:
-                    green_space_pixel_area += box_pixel_area
-                elif cls_id in BUILDING_CLASSES:
-                    building_footprint_pixel_area += box_pixel_area
-
-        # Calculate the final percentages
-        green_cover_percentage = (green_space_pixel_area / total_pixel_area) * 100
-        building_footprint_percentage = (building_footprint_pixel_area / total_pixel_area) * 100
-
-        analysis_result = {
-            "green_cover_percentage": round(float(green_cover_percentage), 2),
-            "building_footprint_percentage": round(float(building_footprint_percentage), 2)
-        }
-        
+    tiled_key = f"{key}:tiled:{TILE_SIZE}:{TILE_OVERLAP}"
+    if memo and image_hash:
+        cached = memo.get(image_hash, tiled_key)
+        if cached is not None:
+            return cached
+    try:
+        analysis = analyze_raster_tiled(source)
+    except (OSError, ValueError) as e:
+        return {"error": f"Image not found or could not be loaded ({e})."}
+    if memo and image_hash:
+        memo.put(image_hash, tiled_key, analysis)
+    return analysis
+
+def analyze_site_images(
+    images: List[Union[str, np.ndarray, ImageArtifact]],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    use_memo: bool = ANALYSIS_MEMO_ENABLED,
+) -> List[dict]:
+    """
+    Analyzes many site plan images with the custom YOLOv8 model, sending them
+    through the model in micro-batches of `batch_size`.
+    Args:
+        images: Image paths, ImageArtifacts and/or already-decoded BGR arrays.
+        batch_size: Number of images per forward pass.
+        use_memo: Serve previously analyzed images from the analysis memo and
+            store new results in it.
+    Returns:
+        One dict per input image, in input order. Images that fail to load get
+        an `{"error": ...}` dict instead of the coverage metrics. Images with a
+        side over TILED_MIN_SIDE are analyzed in tiles (see analyze_raster_tiled).
+    """
+    analyses: List[dict] = [None] * len(images)
+    memo = analysis_memo.get() if use_memo else None
+    key = model_key.get() if use_memo else None
+
+    def run_batch(batch):
+        # Run inference with your custom model on the whole micro-batch
+        results = _run_model([img for _, img, _ in batch])
+        fresh = []
+        for (index, img, image_hash), result in zip(batch, results):
+            H, W = img.shape[:2]
+            analyses[index] = _coverage_from_result(result, H, W)
+            fresh.append((image_hash, analyses[index]))
+        if memo:
+            memo.put_many(fresh, key)
+
+    # Images are hashed and looked up in the memo one at a time, and only the
+    # misses are decoded, as they join the micro-batch: at most `batch_size`
+    # decoded images are in memory however many are passed in
+    batch = []
+    for index, image in enumerate(images):
+        if _is_large(image):
+            analyses[index] = _analyze_large(image, memo, key)
+            continue
+        payload, image_hash = _read_image(image)
+        cached = memo.get(image_hash, key) if memo and payload is not None else None
+        if cached is not None:
+            analyses[index] = cached
+            continue
+        img = _decode(payload) if payload is not None else None
+        if img is None:
+            analyses[index] = {"error": "Image not found or could not be loaded."}
+            continue
+        batch.append((index, img, image_hash))
+        if len(batch) >= batch_size:
+            run_batch(batch)
+            batch = []
+    if batch:
+        run_batch(batch)
+
+    return analyses
+
+def dispatch_analysis(
+    images: List[Union[str, np.ndarray, ImageArtifact]],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> List[dict]:
+    """
+    analyze_site_images, run in the analyzer process pool when ANALYSIS_WORKERS
+    is set (see src/analysis_pool.py) so inference doesn't compete with this
+    process for the GIL, and inline otherwise. Blocks until the results are in.
+    """
+    if analysis_pool is not None and not in_worker():
+        return analysis_pool.get().analyze(images, batch_size)
+    return analyze_site_images(images, batch_size)
+
+def prefetch_directory(directory: str, batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[str, dict]:
+    """
+    Analyzes every image in `directory` that isn't memoized yet, so later
+    lookups for those images are served from the memo.
+    Returns:
+        A dict mapping each image path to its analysis.
+    """
+    paths = sorted(
+        path for path in glob.glob(os.path.join(directory, "*"))
+        if path.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    return dict(zip(paths, dispatch_analysis(paths, batch_size)))
+
+def analyze_site_image(image: Union[str, ImageArtifact]):
+    """
+    Analyzes a single site plan image. Returns the coverage dict, an
+    `{"error": ...}` dict if the image can't be loaded, or an error string.
+    """
+    try:
+        analysis_result = dispatch_analysis([image])[0]
+        if "error" in analysis_result:
+            return analysis_result
+
         print(f"Custom Model Analysis Complete: {analysis_result}")
         return analysis_result
     except Exception as e:
-        return f"An error occurred during analysis: {str(e)}"
\ No newline at end of file
+        return f"An error occurred during analysis: {str(e)}"
+
+@tool
+def yolo_site_analyzer(image_path: str) -> dict:
+    """
+    Analyzes a site plan image using a custom-trained YOLOv8 model
+    to quantify the percentage of green space and building footprint.
+    """
+    return analyze_site_image(image_path)
+
+async def arun_analysis(fn, *args):
+    """Runs a blocking analysis function on the YOLO executor and awaits it."""
+    # run_in_executor doesn't carry context variables over, so the run's metrics would be lost
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_analysis_executor, context.run, fn, *args)
+
+async def aanalyze_site_image(image: Union[str, ImageArtifact]):
+    """Async version of analyze_site_image; inference runs off the event loop."""
+    return await arun_analysis(analyze_site_image, image)
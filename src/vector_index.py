@@ -0,0 +1,421 @@
+# src/vector_index.py
+
+import json
+import math
+import os
+import sqlite3
+import threading
+from typing import Iterable, List, NamedTuple, Optional
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+# --- Index Settings ---
+# "float16" halves the file size (and the memory touched per query) at a small cost in precision
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")
+# Rows scanned per matrix product, which bounds the memory an exact search needs
+SEARCH_BLOCK_ROWS = 65536
+# Corpora this large get an IVF coarse quantizer; smaller ones are searched exactly
+IVF_MIN_ROWS = int(os.getenv("VECTOR_INDEX_IVF_MIN_ROWS", "200000"))
+# Inverted lists scanned per query; more is slower but closer to exact
+IVF_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "16"))
+IVF_TRAIN_SAMPLE = 100_000
+IVF_ITERATIONS = 10
+# Rows added since the last IVF build are searched exactly; past this share, it is rebuilt
+IVF_MAX_TAIL = 0.1
+# Saved as one .npy file each, under the IVF generation recorded in the meta table
+IVF_ARRAYS = ("centroids", "order", "offsets")
+# Deleted rows are only tombstoned; past this share, the files are rewritten without them
+COMPACT_DELETED_SHARE = 0.3
+
+class _IVF(NamedTuple):
+    rows: int  # rows filed in the lists; later ones are the exactly searched tail
+    centroids: np.ndarray
+    order: np.ndarray
+    offsets: np.ndarray
+
+class _Snapshot(NamedTuple):
+    """What a search reads, published as one object so it never mixes two versions of the index."""
+    generation: int
+    count: int
+    vectors: np.ndarray
+    deleted: np.ndarray
+    ivf: Optional[_IVF]
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def _top_k(scores: np.ndarray, rows: np.ndarray, k: int):
+    """The k best (score, row) pairs, best first."""
+    if len(scores) > k:
+        keep = np.argpartition(-scores, k - 1)[:k]
+        scores, rows = scores[keep], rows[keep]
+    order = np.argsort(-scores, kind="stable")
+    return scores[order], rows[order]
+
+class MmapVectorStore(VectorStore):
+    """
+    Embedded vector store for corpora that don't need a database server.
+
+    Chunk embeddings are L2-normalized and appended to a memory-mapped matrix
+    file (`vectors.bin`), so opening the store maps the file instead of loading
+    it, and queries only touch the pages they scan. Text, metadata and
+    tombstones for deleted chunks live in a SQLite side table.
+
+    Search is an exact top-k by cosine similarity, done as NumPy dot products
+    in blocks of SEARCH_BLOCK_ROWS. Once a corpus is large, build_ivf() adds an
+    IVF coarse quantizer (spherical k-means), and queries then scan only the
+    IVF_NPROBE closest lists plus any rows added since the build.
+
+    Thread-safe: one writer at a time, searches run concurrently. Writers
+    publish the row count, matrix, tombstones and IVF lists together as one
+    snapshot, which each search reads once.
+    """
+
+    def __init__(self, path: str, embedding, dtype: str = VECTOR_INDEX_DTYPE):
+        self.path = path
+        self._embedding = embedding
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(path, "chunks.sqlite3"), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                id TEXT NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_id ON chunks (id)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        meta = dict(self._db.execute("SELECT name, value FROM meta").fetchall())
+        self.dtype = np.dtype(meta.get("dtype", dtype))
+        self.dim = int(meta.get("dim", 0))
+        # Each compaction writes a new matrix file; the committed generation says which one is current
+        generation = int(meta.get("generation", 0))
+        count = int(meta.get("count", 0))
+        self._vectors_path = self._vectors_file(generation)
+        # Likewise for the IVF arrays, which build_ivf() writes as a set under a new generation
+        self._ivf_generation = int(meta.get("ivf_generation", 0))
+        self._remove_stale_files()
+        self._truncate_partial_append(count)
+        rows = [r for (r,) in self._db.execute("SELECT row FROM chunks WHERE deleted = 1")]
+        deleted = np.zeros(count, dtype=bool)
+        deleted[rows] = True
+        self._publish(generation, count, deleted, self._load_ivf(self._ivf_generation, int(meta.get("ivf_rows", 0))))
+
+    # --- Files ---
+    def _vectors_file(self, generation: int) -> str:
+        return os.path.join(self.path, f"vectors.{generation}.bin" if generation else "vectors.bin")
+
+    def _remove_stale_files(self):
+        # An interrupted compaction or IVF build leaves files of the generation it didn't switch to (or from)
+        current_ivf = {self._ivf_file(self._ivf_generation, n) for n in IVF_ARRAYS}
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            if name.startswith("vectors.") and name.endswith((".bin", ".tmp")) and path != self._vectors_path:
+                os.remove(path)
+            elif name.startswith("ivf_") and name.endswith((".npy", ".tmp")) and path not in current_ivf:
+                os.remove(path)
+
+    def _truncate_partial_append(self, count: int):
+        # Vectors are appended before their rows are committed; drop any a crash left behind
+        expected = count * self.dim * self.dtype.itemsize
+        if os.path.exists(self._vectors_path) and os.path.getsize(self._vectors_path) > expected:
+            with open(self._vectors_path, "r+b") as f:
+                f.truncate(expected)
+
+    def _publish(self, generation: int, count: int, deleted: np.ndarray, ivf: Optional[_IVF]):
+        """Maps the first `count` rows of the current matrix file and swaps in the new snapshot. Caller holds the lock."""
+        if count:
+            vectors = np.memmap(self._vectors_path, dtype=self.dtype, mode="r", shape=(count, self.dim))
+        else:
+            vectors = np.empty((0, self.dim), dtype=self.dtype)
+        self._state = _Snapshot(generation, count, vectors, deleted, ivf)
+
+    def _save_meta(self, **values):
+        self._db.executemany(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", [(k, str(v)) for k, v in values.items()]
+        )
+
+    def _ivf_file(self, generation: int, name: str) -> str:
+        return os.path.join(self.path, f"ivf_{generation}_{name}.npy" if generation else f"ivf_{name}.npy")
+
+    def _load_ivf(self, generation: int, rows: int) -> Optional[_IVF]:
+        if not rows or not all(os.path.exists(self._ivf_file(generation, n)) for n in IVF_ARRAYS):
+            return None
+        return _IVF(
+            rows,
+            np.load(self._ivf_file(generation, "centroids")),
+            np.load(self._ivf_file(generation, "order"), mmap_mode="r"),
+            np.load(self._ivf_file(generation, "offsets")),
+        )
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    @property
+    def count(self) -> int:
+        """Rows in the matrix, deleted ones included."""
+        return self._state.count
+
+    @property
+    def ivf_rows(self) -> int:
+        ivf = self._state.ivf
+        return ivf.rows if ivf else 0
+
+    def __len__(self) -> int:
+        state = self._state
+        return int(state.count - state.deleted.sum())
+
+    # --- Writes ---
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, *, ids: Optional[List[str]] = None, **kwargs) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self._embedding.embed_documents(texts), metadatas, ids)
+
+    def add_embeddings(self, texts: List[str], embeddings, metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None) -> List[str]:
+        """Appends pre-computed embeddings; an existing ID is replaced."""
+        if not texts:
+            return []
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [os.urandom(16).hex() for _ in texts]
+        with self._lock:
+            if not self.dim:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding size {vectors.shape[1]} doesn't match the index ({self.dim}).")
+            self._tombstone(ids)
+            state = self._state
+            with open(self._vectors_path, "ab") as f:
+                f.write(vectors.astype(self.dtype).tobytes())
+            start = state.count
+            with self._db:
+                self._db.executemany(
+                    "INSERT INTO chunks (row, id, text, metadata) VALUES (?, ?, ?, ?)",
+                    [(start + i, cid, text, json.dumps(meta)) for i, (cid, text, meta) in enumerate(zip(ids, texts, metadatas))],
+                )
+                self._save_meta(count=start + len(texts), dim=self.dim, dtype=self.dtype.name)
+            deleted = np.concatenate([state.deleted, np.zeros(len(texts), dtype=bool)])
+            self._publish(state.generation, start + len(texts), deleted, state.ivf)
+        return ids
+
+    def _tombstone(self, ids: List[str]) -> int:
+        placeholders = ",".join("?" * len(ids))
+        rows = [r for (r,) in self._db.execute(f"SELECT row FROM chunks WHERE deleted = 0 AND id IN ({placeholders})", ids)]
+        if rows:
+            with self._db:
+                self._db.executemany("UPDATE chunks SET deleted = 1 WHERE row = ?", [(r,) for r in rows])
+            # Rows only ever become deleted, so searches can see this in place
+            self._state.deleted[rows] = True
+        return len(rows)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs) -> Optional[bool]:
+        if not ids:
+            return False
+        with self._lock:
+            return self._tombstone(list(ids)) > 0
+
+    def get(self, ids: Optional[List[str]] = None, include: Optional[List[str]] = None) -> dict:
+        """Chroma-style listing of the live chunks (used by src/ingest.py)."""
+        include = include if include is not None else ["documents", "metadatas"]
+        query = "SELECT id, text, metadata FROM chunks WHERE deleted = 0"
+        params: list = []
+        if ids:
+            query += f" AND id IN ({','.join('?' * len(ids))})"
+            params = list(ids)
+        rows = self._db.execute(query + " ORDER BY row", params).fetchall()
+        result = {"ids": [r[0] for r in rows]}
+        if "documents" in include:
+            result["documents"] = [r[1] for r in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [json.loads(r[2]) for r in rows]
+        return result
+
+    # --- Search ---
+    def _scan(self, state: _Snapshot, query: np.ndarray, rows: Optional[np.ndarray], k: int):
+        """Top k over `rows` (or every row), reading the matrix block by block."""
+        vectors, deleted = state.vectors, state.deleted
+        best_scores, best_rows = np.empty(0, np.float32), np.empty(0, np.int64)
+        total = len(rows) if rows is not None else len(vectors)
+        for start in range(0, total, SEARCH_BLOCK_ROWS):
+            if rows is None:
+                block_rows = np.arange(start, min(start + SEARCH_BLOCK_ROWS, total))
+                block = vectors[start:start + SEARCH_BLOCK_ROWS]
+            else:
+                block_rows = np.sort(rows[start:start + SEARCH_BLOCK_ROWS])
+                block = vectors[block_rows]
+            scores = block.astype(np.float32, copy=False) @ query
+            scores[deleted[block_rows]] = -np.inf
+            best_scores, best_rows = _top_k(
+                np.concatenate([best_scores, scores]), np.concatenate([best_rows, block_rows]), k
+            )
+        live = np.isfinite(best_scores)
+        return best_scores[live], best_rows[live]
+
+    def _candidate_rows(self, state: _Snapshot, query: np.ndarray) -> Optional[np.ndarray]:
+        """Rows in the IVF_NPROBE closest inverted lists plus the unindexed tail, or None to scan everything."""
+        ivf = state.ivf
+        if ivf is None:
+            return None
+        lists = np.argsort(-(ivf.centroids @ query))[:IVF_NPROBE]
+        parts = [np.asarray(ivf.order[ivf.offsets[l]:ivf.offsets[l + 1]]) for l in lists]
+        parts.append(np.arange(ivf.rows, state.count))
+        return np.concatenate(parts)
+
+    def _fetch_rows(self, rows: np.ndarray):
+        """(chunks by row, index generation they were read at); one statement, so both come from the same commit."""
+        placeholders = ",".join("?" * len(rows))
+        found, generation = {}, None
+        for row, cid, text, meta, gen in self._db.execute(
+            f"SELECT row, id, text, metadata, (SELECT value FROM meta WHERE name = 'generation') "
+            f"FROM chunks WHERE row IN ({placeholders})",
+            [int(r) for r in rows],
+        ):
+            found[row] = (cid, text, meta)
+            generation = int(gen or 0)
+        return found, generation
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4) -> List[tuple]:
+        """(Document, cosine similarity) pairs, most similar first."""
+        query = _normalize(np.asarray(embedding, dtype=np.float32)[None, :])[0]
+        while True:
+            state = self._state
+            if not state.count:
+                return []
+            scores, rows = self._scan(state, query, self._candidate_rows(state, query), k)
+            if not len(rows):
+                return []
+            found, generation = self._fetch_rows(rows)
+            if generation == state.generation:
+                break
+            # A compaction renumbered the rows meanwhile; wait for it to publish, then search again
+            with self._lock:
+                pass
+        results = []
+        for score, row in zip(scores, rows):
+            cid, text, meta = found[int(row)]
+            results.append((Document(page_content=text, metadata=json.loads(meta), id=cid), float(score)))
+        return results
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs) -> List[Document]:
+        if kwargs.get("filter"):
+            raise ValueError("Metadata filters are not supported by the mmap vector index.")
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs) -> List[tuple]:
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k)
+
+    def _select_relevance_score_fn(self):
+        # Cosine similarity is already "higher is better"; map [-1, 1] onto [0, 1]
+        return lambda score: min(1.0, max(0.0, (score + 1) / 2))
+
+    # --- Maintenance ---
+    def _save_array(self, path: str, array: np.ndarray):
+        with open(path, "wb") as f:
+            np.save(f, array)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def build_ivf(self, nlist: Optional[int] = None, seed: int = 0):
+        """
+        Trains the coarse quantizer with spherical k-means on a sample of the
+        live rows, then files every row under its closest centroid. The arrays
+        are written as a new IVF generation and one meta commit switches to it,
+        so a crash leaves either the old lists or the new ones, never a mix.
+        """
+        with self._lock:
+            state = self._state
+            live = np.flatnonzero(~state.deleted)
+            if not len(live):
+                return
+            nlist = nlist or max(1, int(4 * math.sqrt(len(live))))
+            rng = np.random.default_rng(seed)
+            sample = np.sort(rng.choice(live, size=min(len(live), max(IVF_TRAIN_SAMPLE, nlist)), replace=False))
+            train = state.vectors[sample].astype(np.float32)
+            centroids = train[rng.choice(len(train), size=nlist, replace=False)]
+            for _ in range(IVF_ITERATIONS):
+                assign = np.argmax(train @ centroids.T, axis=1)
+                counts = np.bincount(assign, minlength=nlist)
+                sums = np.zeros_like(centroids)
+                members = np.argsort(assign, kind="stable")
+                filled = counts > 0
+                sums[filled] = np.add.reduceat(train[members], np.cumsum(counts)[filled] - counts[filled])
+                empty = ~filled
+                sums[empty] = train[rng.choice(len(train), size=int(empty.sum()))]
+                centroids = _normalize(sums)
+
+            assign = np.empty(state.count, dtype=np.int32)
+            for start in range(0, state.count, SEARCH_BLOCK_ROWS):
+                block = state.vectors[start:start + SEARCH_BLOCK_ROWS].astype(np.float32)
+                assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+            order = np.argsort(assign, kind="stable").astype(np.int64)
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+            ivf_generation = self._ivf_generation + 1
+            for name, array in (("centroids", centroids), ("order", order), ("offsets", offsets)):
+                self._save_array(self._ivf_file(ivf_generation, name), array)
+            with self._db:
+                self._save_meta(ivf_rows=state.count, ivf_generation=ivf_generation)
+            old_generation, self._ivf_generation = self._ivf_generation, ivf_generation
+            self._publish(state.generation, state.count, state.deleted, self._load_ivf(ivf_generation, state.count))
+            for name in IVF_ARRAYS:
+                try:
+                    # Searches still mapping the old lists keep them alive until they finish
+                    os.remove(self._ivf_file(old_generation, name))
+                except OSError:
+                    pass  # never built, or still mapped on Windows; removed on the next open
+            print(f"Built IVF index: {nlist} lists over {state.count} vectors.")
+
+    def compact(self):
+        """
+        Rewrites the matrix and side table without the deleted rows. The new
+        matrix goes to a file of the next generation, and one transaction
+        renumbers the rows and switches to it, so a crash at any point leaves
+        either the old or the new index intact (the other file is removed on open).
+        """
+        with self._lock:
+            state = self._state
+            live = np.flatnonzero(~state.deleted)
+            generation = state.generation + 1
+            new_path = self._vectors_file(generation)
+            with open(new_path, "wb") as f:
+                for start in range(0, len(live), SEARCH_BLOCK_ROWS):
+                    f.write(np.ascontiguousarray(state.vectors[live[start:start + SEARCH_BLOCK_ROWS]]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with self._db:
+                # First: searches share this connection and see the transaction before it commits
+                self._save_meta(count=len(live), ivf_rows=0, generation=generation)
+                self._db.execute("DELETE FROM chunks WHERE deleted = 1")
+                self._db.executemany("UPDATE chunks SET row = ? WHERE row = ?", [(new, int(old)) for new, old in enumerate(live)])
+            old_path, self._vectors_path = self._vectors_path, new_path
+            self._publish(generation, len(live), np.zeros(len(live), dtype=bool), None)
+            try:
+                # Searches still mapping the old file keep it alive until they finish
+                os.remove(old_path)
+            except OSError:
+                pass  # e.g. still mapped on Windows; removed on the next open
+            print(f"Compacted vector index to {len(live)} vectors.")
+
+    def optimize(self):
+        """Compacts if many rows are deleted, and (re)builds the IVF once the corpus is large enough."""
+        state = self._state
+        if state.count and state.deleted.mean() > COMPACT_DELETED_SHARE:
+            self.compact()
+        live = len(self)
+        if live >= IVF_MIN_ROWS and (not self.ivf_rows or (self.count - self.ivf_rows) > IVF_MAX_TAIL * self.ivf_rows):
+            self.build_ivf()
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding, metadatas: Optional[List[dict]] = None, *, ids: Optional[List[str]] = None, path: str = "./vector_index", **kwargs) -> "MmapVectorStore":
+        store = cls(path, embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
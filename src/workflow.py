@@ -0,0 +1,254 @@
+# src/workflow.py
+
+import time
+from datetime import datetime
+from functools import lru_cache
+from langgraph.graph import StateGraph, END
+from src.state import GraphState
+from src.agents import get_planner_agent, get_report_agent
+from src.rules import critique_analysis
+from src.tools.design_tool import render_design
+from src.tools.vision_tool import analyze_site_image
+from src.fanout import FANOUT_VARIANTS, design_candidates, analyze_candidates
+from src.metrics import instrument_node, record_context_prompt
+
+# --- Workflow Settings ---
+DEFAULT_MAX_ITERATIONS = 3
+REPORTS_DIR = "./outputs"
+
+# --- Shared Node Helpers ---
+# Used by both these nodes and the async ones in src/async_workflow.py
+
+def planner_request(state: GraphState):
+    """Returns `(num_variants, planner inputs)` for the current state."""
+    num_variants = state.get("num_variants") or FANOUT_VARIANTS
+    # The context was retrieved and compressed once for the run; each iteration reuses it
+    record_context_prompt()
+    feedback = state.get("critique_feedback") or "N/A"
+    if state.get("human_approval") == "no":
+        feedback += " The previous visual design was rejected by the user. Please generate a significantly different design."
+    return num_variants, {
+        "user_request": state["user_request"],
+        "rag_context": state["rag_context"],
+        "critique_feedback": feedback
+    }
+
+def planner_update(state: GraphState, planner_output, num_variants: int, started: float) -> dict:
+    """Turns the planner's parsed output into the state update. Raises ValueError if it holds no prompt."""
+    if not planner_output:
+        raise ValueError("The planner did not return a design.")
+    design = planner_output[0]
+    prompts = design.dalle_prompts[:num_variants] if num_variants > 1 else [design.dalle_prompt]
+    prompts = [p for p in prompts if p.strip()]
+    if not prompts:
+        raise ValueError("The planner returned no DALL-E prompt.")
+    return {
+        "dalle_prompt": prompts[0],
+        "dalle_prompts": prompts,
+        "planner_seconds": time.perf_counter() - started,
+        "iteration_count": state["iteration_count"] + 1,
+        "human_approval": None # Reset human approval
+    }
+
+def design_error(e: Exception) -> dict:
+    return {"image_path": f"An error occurred during image generation: {str(e)}", "image_artifact": None}
+
+def save_report(state: GraphState, report_markdown: str) -> dict:
+    """Fills in the image path, writes the report to disk and returns the state update."""
+    final_report = report_markdown.replace("IMAGE_PATH_PLACEHOLDER", str(state["image_path"]))
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    report_path = f"{REPORTS_DIR}/report_{timestamp}.md"
+    with open(report_path, "w") as f:
+        f.write(final_report)
+    print(f"Final report saved to {report_path}")
+    return {"final_report": final_report}
+
+# --- Define Graph Nodes ---
+def planner_node(state: GraphState) -> dict:
+    print("\n--- 🧠 PLANNER ---")
+    num_variants, inputs = planner_request(state)
+    started = time.perf_counter()
+    planner_output = get_planner_agent(num_variants).invoke(inputs)
+    return planner_update(state, planner_output, num_variants, started)
+
+def designer_node(state: GraphState) -> dict:
+    print("\n--- 🎨 DESIGNER ---")
+    if len(state.get("dalle_prompts") or []) > 1:
+        return design_candidates(state)
+    try:
+        artifact = render_design(state["dalle_prompt"])
+    except Exception as e:
+        return design_error(e)
+    # The decoded image travels in the state; the file is written in the background
+    return {"image_path": artifact.path, "image_artifact": artifact}
+
+def show_design(state: GraphState):
+    """Prints where the design (or each fan-out candidate) can be reviewed."""
+    if state.get("fanout_candidates"):
+        for candidate in state["fanout_candidates"]:
+            if candidate["artifact"]:
+                candidate["artifact"].wait_persisted()
+            print(f"Candidate design: {candidate['artifact'].path if candidate['artifact'] else candidate['error']}")
+    else:
+        if state.get("image_artifact"):
+            state["image_artifact"].wait_persisted()
+        print(f"Design image generated at: {state['image_path']}")
+
+def ask_approval() -> str:
+    """Reads a yes/no decision from stdin. Raises EOFError if stdin is closed."""
+    user_input = ""
+    while user_input.lower() not in ["yes", "no"]:
+        user_input = input("Approve the visual design? (yes/no): ")
+    return user_input.lower()
+
+def human_in_the_loop_node(state: GraphState) -> dict:
+    print("\n--- 🧑‍⚖️ HUMAN APPROVAL ---")
+    show_design(state)
+    return {"human_approval": ask_approval()}
+
+def analyst_node(state: GraphState) -> dict:
+    print("\n--- 👁️ ANALYST ---")
+    if state.get("fanout_candidates"):
+        return analyze_candidates(state)
+    analysis = analyze_site_image(state.get("image_artifact") or state["image_path"])
+    return {"analysis_results": analysis}
+
+def critique_node(state: GraphState) -> dict:
+    print("\n--- 🧐 CRITIQUE ---")
+    critique_text, report = critique_analysis(state["analysis_results"])
+    print(f"Critique: {critique_text}")
+    return {"critique_feedback": critique_text, "compliance_results": report.to_dict()}
+
+def report_node(state: GraphState) -> dict:
+    print("\n--- 📝 REPORT ---")
+    if state.get("image_artifact"):
+        state["image_artifact"].wait_persisted()
+    report_markdown = get_report_agent().invoke({
+        "user_request": state["user_request"],
+        "analysis_results": state["analysis_results"]
+    }).content
+    return save_report(state, report_markdown)
+
+# --- Define Conditional Edge Logic ---
+def make_critique_router(max_iterations: int = DEFAULT_MAX_ITERATIONS):
+    """Returns the router that ends, reports or loops back after a critique."""
+    def after_critique_router(state: GraphState) -> str:
+        print("\n--- ❓ COMPLIANCE CHECK ---")
+        if state["critique_feedback"] == "PASS":
+            print("Decision: Design is compliant. Proceeding to report.")
+            return "report"
+        if state["iteration_count"] >= max_iterations:
+            print("Decision: Max iterations reached. Ending workflow.")
+            return "end"
+        print("Decision: Design is not compliant. Looping back to Planner.")
+        return "continue"
+    return after_critique_router
+
+def after_hitl_router(state: GraphState) -> str:
+    print("\n--- ❓ HUMAN DECISION ---")
+    if state["human_approval"] == "yes":
+        print("Decision: Human approved. Proceeding to analysis.")
+        return "analyst"
+    else:
+        print("Decision: Human rejected. Returning to Planner.")
+        return "planner"
+
+# --- Create and Compile the Graph ---
+def build_graph(human_approval: bool = False, max_iterations: int = DEFAULT_MAX_ITERATIONS, wrap_node=None, nodes=None, checkpointer=None):
+    """
+    Builds and compiles the workflow graph.
+    Args:
+        human_approval: Whether to pause for a yes/no approval after each design.
+            With a checkpointer the run stops before the approval step instead of
+            blocking on stdin; see `submit_approval`.
+        max_iterations: Planner iterations before giving up on a failing design.
+        wrap_node: Optional callable `(name, fn) -> fn` applied to every node,
+            e.g. to throttle it. Node timing (src/metrics.py) is always applied.
+        nodes: Optional mapping overriding node functions by name (used for
+            the async variants).
+        checkpointer: Optional LangGraph checkpointer that saves the state
+            after every node, so a run can be resumed by its run ID.
+    """
+    wrap = wrap_node or (lambda name, fn: fn)
+    node_fns = {
+        "planner": planner_node,
+        "designer": designer_node,
+        "analyst": analyst_node,
+        "critique": critique_node,
+        "report": report_node,
+        **(nodes or {}),
+    }
+    workflow = StateGraph(GraphState)
+    for name, fn in node_fns.items():
+        workflow.add_node(name, wrap(name, instrument_node(name, fn)))
+
+    workflow.set_entry_point("planner")
+
+    workflow.add_edge("planner", "designer")
+    if human_approval:
+        workflow.add_node("human_in_the_loop", human_in_the_loop_node)
+        workflow.add_edge("designer", "human_in_the_loop")
+        workflow.add_conditional_edges(
+            "human_in_the_loop", after_hitl_router, {"analyst": "analyst", "planner": "planner"}
+        )
+    else:
+        workflow.add_edge("designer", "analyst")
+    workflow.add_edge("analyst", "critique")
+
+    workflow.add_conditional_edges(
+        "critique", make_critique_router(max_iterations), {"continue": "planner", "report": "report", "end": END}
+    )
+
+    workflow.add_edge("report", END)
+
+    if checkpointer is None:
+        return workflow.compile()
+    interrupt_before = ["human_in_the_loop"] if human_approval else None
+    return workflow.compile(checkpointer=checkpointer, interrupt_before=interrupt_before)
+
+@lru_cache(maxsize=None)
+def get_workflow(human_approval: bool = False, max_iterations: int = DEFAULT_MAX_ITERATIONS, durable: bool = False):
+    """
+    The compiled graph for a configuration, built once per process and shared.
+    With `durable`, every node's output is checkpointed to SQLite (see src/checkpoint.py).
+    """
+    saver = None
+    if durable:
+        from src.checkpoint import checkpointer
+        saver = checkpointer.get()
+    return build_graph(human_approval=human_approval, max_iterations=max_iterations, checkpointer=saver)
+
+def run_config(max_iterations: int = DEFAULT_MAX_ITERATIONS, run_id: str = None) -> dict:
+    """
+    LangGraph config with a recursion limit that fits `max_iterations` loops,
+    and the run ID that durable workflows checkpoint under.
+    """
+    # Up to 5 steps per iteration (planner, designer, approval, analyst, critique) plus the report
+    config = {"recursion_limit": max_iterations * 5 + 2}
+    if run_id:
+        config["configurable"] = {"thread_id": run_id}
+    return config
+
+# --- Durable Runs ---
+def run_state(app, config: dict) -> dict:
+    """The last checkpointed state of a run (empty if the run ID is unknown)."""
+    return app.get_state(config).values or {}
+
+def next_nodes(app, config: dict) -> tuple:
+    """Nodes the run will execute when resumed; empty once it has finished."""
+    return tuple(app.get_state(config).next)
+
+def awaiting_approval(app, config: dict) -> bool:
+    return "human_in_the_loop" in next_nodes(app, config)
+
+def submit_approval(app, config: dict, decision: str):
+    """
+    Records a "yes"/"no" decision for a run paused before the approval step.
+    Resume it afterwards with `app.stream(None, config)`.
+    """
+    decision = decision.lower()
+    if decision not in ("yes", "no"):
+        raise ValueError(f"Approval must be 'yes' or 'no', got: {decision}")
+    if not awaiting_approval(app, config):
+        raise ValueError("This run is not waiting for an approval.")
+    app.update_state(config, {"human_approval": decision}, as_node="human_in_the_loop")
@@ -2,101 +2,26 @@
 
 import streamlit as st
 import os
-import time
-from PIL import Image
 
 # --- Load Environment Variables FIRST ---
 from dotenv import load_dotenv
 load_dotenv()
 
 # --- Import Core Project Components ---
-from langgraph.graph import StateGraph, END
-from src.state import GraphState
-from src.agents import create_planner_agent, create_critique_agent, create_report_agent
-from src.tools.rag_tool import rag_compliance_lookup
-from src.tools.design_tool import generate_aerial_design
-from src.tools.vision_tool import yolo_site_analyzer
-
-# --- LangGraph Workflow Definition ---
-
-# Define the nodes for the graph
-def planner_node(state: GraphState) -> dict:
-    planner = create_planner_agent()
-    feedback = state.get("critique_feedback", "N/A")
-    if state.get("human_approval") == "no":
-        feedback += " The previous visual design was rejected. Please generate a significantly different design."
-
-    planner_output = planner.invoke({
-        "user_request": state["user_request"],
-        "rag_context": state["rag_context"],
-        "critique_feedback": feedback
-    })
-    design = planner_output[0]
-    return {
-        "dalle_prompt": design.dalle_prompt,
-        "iteration_count": state["iteration_count"] + 1,
-        "human_approval": None
-    }
-
-def designer_node(state: GraphState) -> dict:
-    image_path = generate_aerial_design.invoke(state["dalle_prompt"])
-    return {"image_path": image_path}
-
-def analyst_node(state: GraphState) -> dict:
-    analysis = yolo_site_analyzer.invoke(state["image_path"])
-    return {"analysis_results": analysis}
-
-def critique_node(state: GraphState) -> dict:
-    critique_agent = create_critique_agent()
-    # --- THIS IS THE FIX ---
-    # We only pass 'analysis_results', matching the new prompt
-    critique_text = critique_agent.invoke({
-        "analysis_results": state["analysis_results"]
-    }).content
-    # --- END OF FIX ---
-    
-    if "FAIL" in critique_text.upper():
-        return {"critique_feedback": critique_text}
-    else:
-        return {"critique_feedback": "PASS"}
-
-def report_node(state: GraphState) -> dict:
-    report_agent = create_report_agent()
-    report_markdown = report_agent.invoke({
-        "user_request": state["user_request"],
-        "analysis_results": state["analysis_results"]
-    }).content
-    
-    final_report = report_markdown.replace("IMAGE_PATH_PLACEHOLDER", str(state["image_path"]))
-    return {"final_report": final_report}
-
-# Compile the graph
-@st.cache_resource
-def compile_graph():
-    workflow = StateGraph(GraphState)
-    workflow.add_node("planner", planner_node)
-    workflow.add_node("designer", designer_node)
-    workflow.add_node("analyst", analyst_node)
-    workflow.add_node("critique", critique_node)
-    workflow.add_node("report", report_node)
-
-    workflow.set_entry_point("planner")
-    workflow.add_edge("designer", "analyst")
-    workflow.add_edge("analyst", "critique")
-    
-    def after_critique_router(state: GraphState) -> str:
-        if state["critique_feedback"] == "PASS":
-            return "report"
-        else:
-            if state["iteration_count"] >= 3:
-                return END
-            return "planner"
+from src.resources import warm_up
+from src.tools.vision_tool import ANALYZER_RESOURCE
+from src.fanout import FANOUT_VARIANTS
+from src.checkpoint import new_run_id
+from src.jobs import job_queue, JobQueueFull, QUEUED, RUNNING, FAILED, CANCELLED
+from src.workflow import get_workflow, run_config, run_state, next_nodes, awaiting_approval, submit_approval
 
-    workflow.add_conditional_edges("critique", after_critique_router, {"report": "report", "planner": "planner", END: END})
-    workflow.add_edge("planner", "designer")
-    workflow.add_edge("report", END)
+# Seconds between progress polls of the session's job
+POLL_INTERVAL_S = float(os.getenv("UI_POLL_INTERVAL_S", "1"))
 
-    return workflow.compile()
+# Start loading the retriever and YOLO model (or the analysis pool, which loads
+# its own) and the job queue's workers in the background so the first run
+# doesn't pay for them; the registry is shared by every session.
+warm_up(exclude=[] if ANALYZER_RESOURCE == "yolo_model" else ["yolo_model"])
 
 # --- Streamlit UI ---
 
@@ -106,12 +31,18 @@ st.title("🏙️ UrbanPlan AI")
 st.markdown("A self-correcting, multi-modal planning agent that transforms design briefs into compliant urban prototypes.")
 
 # Initialize session state variables
+# Whether the session's job (keyed by its run ID) is queued or running
 if 'running' not in st.session_state:
     st.session_state.running = False
 if 'final_report' not in st.session_state:
     st.session_state.final_report = None
 if 'graph_state' not in st.session_state:
     st.session_state.graph_state = None
+# ID the current run is checkpointed under, and whether it pauses for approval
+if 'run_id' not in st.session_state:
+    st.session_state.run_id = None
+if 'review' not in st.session_state:
+    st.session_state.review = False
 
 
 # Sidebar for inputs and controls
@@ -123,74 +54,185 @@ with st.sidebar:
         height=150
     )
     
+    num_variants = st.number_input(
+        "Design variants per iteration:",
+        min_value=1,
+        max_value=8,
+        value=FANOUT_VARIANTS,
+        help="Render several candidates in parallel each iteration and keep the best one.",
+    )
+    
+    review = st.checkbox(
+        "Review each design before analysis",
+        value=False,
+        help="Pause after every design until you approve or reject it. When resuming, match the setting the run was started with.",
+    )
+    
     start_button = st.button("Generate Design", type="primary", disabled=st.session_state.running)
 
-# Main content area
-col1, col2 = st.columns(2)
-
-with col1:
-    st.subheader("Live Workflow")
-    workflow_placeholder = st.empty()
-
-with col2:
-    st.subheader("Latest Design")
-    image_placeholder = st.empty()
+    st.header("Resume a Run")
+    resume_id = st.text_input("Run ID:", help="Continue a checkpointed run from its last completed node.")
+    resume_button = st.button("Resume Run", disabled=st.session_state.running or not resume_id)
 
+def show_design(image_placeholder, image_path, caption):
+    """Loads a design from disk when it is shown; the worker may still be saving it."""
+    if os.path.exists(image_path):
+        image_placeholder.image(image_path, caption=caption, width='stretch')
+    else:
+        image_placeholder.caption("Saving the design...")
+
+def render_update(status, event, image_placeholder):
+    """Describes one job event (see src/jobs.py) in its status box; designs go to the image panel."""
+    key, summary, image_path = event["node"], event["summary"], event["image_path"]
+    if key == "rag":
+        status.write("Retrieved relevant rules from the Master Plan for Delhi and compliance JSON.")
+    elif key == "planner":
+        status.write("Drafting a new design plan...")
+    elif key == "designer" and summary.get('candidates'):
+        status.write(f"Generated {summary['candidates']} candidate site plans with DALL-E 3 in parallel...")
+    elif key == "designer":
+        status.write("Generating a visual site plan with DALL-E 3...")
+        if summary.get('error'):
+            status.error(summary['error'])
+        elif image_path:
+            show_design(image_placeholder, image_path, "Generated Site Plan")
+    elif key == "analyst":
+        status.write("Analyzing the design with the custom-trained YOLOv8 model...")
+        status.write(f"**Analysis Results:**")
+        status.json(summary['analysis_results'])
+        if summary.get('fanout_stats'):
+            if image_path:
+                show_design(image_placeholder, image_path, "Best Candidate Site Plan")
+            status.write(f"**Fan-out:** {summary['fanout_stats']}")
+    elif key == "critique":
+        status.write("Evaluating design compliance...")
+        feedback = summary['critique_feedback']
+        if feedback == "PASS":
+            status.success("✅ Design is compliant.")
+            status.update(label="✅ Critique: PASS", state="complete")
+        else:
+            status.warning(f"⚠️ Design is not compliant. Feedback: {feedback}")
+            status.update(label=f"⚠️ Critique: FAIL", state="complete")
+    elif key == "report":
+        status.write("Generating the final project report...")
+
+LABELS = {"rag": "📚 Compliance rules retrieved"}
+
+@st.fragment(run_every=POLL_INTERVAL_S)
+def show_progress():
+    """
+    Polls the session's job: queue position while it waits, then each node's
+    output as the worker records it. Only this fragment reruns on each poll;
+    the whole page reruns once the job stops.
+    """
+    job = job_queue.get().get(st.session_state.run_id)
+    if job is None or not job.active:
+        finish_job(job)
+        st.rerun()
+
+    info_col, cancel_col = st.columns([4, 1])
+    if job.status == QUEUED:
+        depth = job_queue.get().depth()
+        info_col.info(f"⏳ Run {job.run_id} is queued: position {job_queue.get().position(job.run_id)} ({depth['running']} of {depth['workers']} workers busy).")
+    else:
+        info_col.info(f"⚙️ Run {job.run_id} is running.")
+    if cancel_col.button("Cancel run"):
+        job_queue.get().cancel(job.run_id)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Live Workflow")
+    with col2:
+        st.subheader("Latest Design")
+        image_placeholder = st.empty()
+    events = list(job.events)
+    with col1:
+        for index, event in enumerate(events):
+            key = event["node"]
+            label = LABELS.get(key, f"Agent: **{key.upper()}**")
+            with st.status(label, expanded=index == len(events) - 1, state="complete") as status:
+                render_update(status, event, image_placeholder)
+        if job.status == RUNNING:
+            st.caption("Waiting for the next step...")
+
+def finish_job(job):
+    """Copies a stopped job's outcome into the session."""
+    st.session_state.running = False
+    if job is None:
+        return
+    if job.events:
+        st.session_state.graph_state = job.events[-1]
+    st.session_state.final_report = job.final_report
+    st.session_state.run_metrics = job.run_metrics
+    if job.status == FAILED:
+        st.session_state.run_error = job.error
+    elif job.status == CANCELLED:
+        st.session_state.run_error = "cancelled"
+
+def submit_run(inputs):
+    """Queues (or, when `inputs` is None, resumes) the session's run; the page then polls it."""
+    try:
+        job_queue.get().submit(st.session_state.run_id, inputs, review=st.session_state.review)
+    except JobQueueFull as e:
+        st.error(str(e))
+        return
+    st.session_state.running = True
+    st.rerun()
 
 if start_button:
-    st.session_state.running = True
     st.session_state.final_report = None
-    
-    with workflow_placeholder.status("📚 Looking up compliance rules...", expanded=True) as status:
-        rag_context = rag_compliance_lookup.invoke(user_request)
-        st.write("Retrieved relevant rules from the Master Plan for Delhi and compliance JSON.")
-        status.update(label="✅ Compliance rules retrieved.", state="complete")
-    
-    initial_state = {
+    st.session_state.run_error = None
+    st.session_state.run_id = new_run_id()
+    st.session_state.review = review
+    # The worker looks up the compliance rules before running the graph
+    submit_run({
         "user_request": user_request,
-        "rag_context": rag_context,
         "iteration_count": 0,
-    }
-
-    app = compile_graph()
-    
-    for output in app.stream(initial_state, {"recursion_limit": 5}):
-        for key, value in output.items():
-            st.session_state.graph_state = value
-            
-            with workflow_placeholder.status(f"Running Agent: **{key.upper()}**", expanded=True) as status:
-                if key == "planner":
-                    status.write("Drafting a new design plan...")
-                elif key == "designer":
-                    status.write("Generating a visual site plan with DALL-E 3...")
-                    image = Image.open(value['image_path'])
-                    # --- THIS IS THE FIX FOR THE STREAMLIT WARNING ---
-                    image_placeholder.image(image, caption="Generated Site Plan", width='stretch')
-                elif key == "analyst":
-                    status.write("Analyzing the design with the custom-trained YOLOv8 model...")
-                    st.write(f"**Analysis Results:**")
-                    st.json(value['analysis_results'])
-                elif key == "critique":
-                    status.write("Evaluating design compliance...")
-                    feedback = value['critique_feedback']
-                    if feedback == "PASS":
-                        st.success("✅ Design is compliant.")
-                        status.update(label="✅ Critique: PASS", state="complete")
-                    else:
-                        st.warning(f"⚠️ Design is not compliant. Feedback: {feedback}")
-                        status.update(label=f"⚠️ Critique: FAIL", state="running")
-                        time.sleep(2)
-                elif key == "report":
-                    status.write("Generating the final project report...")
-                    st.session_state.final_report = value.get("final_report")
+        "num_variants": int(num_variants),
+    })
 
-    st.session_state.running = False
-    st.rerun()
+if resume_button:
+    st.session_state.final_report = None
+    st.session_state.run_error = None
+    st.session_state.run_id = resume_id.strip()
+    st.session_state.review = review
+    submit_run(None)
+
+if st.session_state.running:
+    show_progress()
+
+if st.session_state.run_id and not st.session_state.running:
+    app = get_workflow(human_approval=st.session_state.review, durable=True)
+    config = run_config(run_id=st.session_state.run_id)
+    if st.session_state.get("run_error") == "cancelled":
+        st.warning(f"Run {st.session_state.run_id} was cancelled. Completed steps are saved; use Resume Run to continue.")
+    elif st.session_state.get("run_error"):
+        st.error(f"Run {st.session_state.run_id} failed: {st.session_state.run_error}. Completed steps are saved; use Resume Run to continue.")
+    if awaiting_approval(app, config):
+        state = run_state(app, config)
+        st.subheader(f"Approve Design (run {st.session_state.run_id})")
+        candidates = [c["artifact"] for c in state.get("fanout_candidates") or [] if c["artifact"]]
+        for artifact in candidates or [state.get("image_artifact")]:
+            if artifact is not None:
+                st.image(artifact.image, channels="BGR", caption=artifact.path, width='stretch')
+        approve_col, reject_col = st.columns(2)
+        if approve_col.button("Approve", type="primary"):
+            submit_approval(app, config, "yes")
+            submit_run(None)
+        if reject_col.button("Reject and redesign"):
+            submit_approval(app, config, "no")
+            submit_run(None)
+    elif next_nodes(app, config) and not st.session_state.get("run_error"):
+        st.info(f"Run {st.session_state.run_id} stopped before '{next_nodes(app, config)[0]}'. Use Resume Run to continue.")
 
 if st.session_state.final_report:
     st.subheader("Final Project Report")
     st.markdown(st.session_state.final_report)
     
+    if st.session_state.get("run_metrics"):
+        with st.expander("Run metrics"):
+            st.json(st.session_state.run_metrics)
+    
     if os.getenv("LANGCHAIN_TRACING_V2") == "true" and st.session_state.graph_state:
         st.success("Workflow complete. You can view the full trace of this run in LangSmith.")
 
@@ -198,4 +240,5 @@ if not st.session_state.running and st.session_state.final_report:
     if st.button("Start New Design"):
         st.session_state.final_report = None
         st.session_state.graph_state = None
+        st.session_state.run_id = None
         st.rerun()
\ No newline at end of file
@@ -0,0 +1,62 @@
+# tests/test_analysis_cache.py
+
+import hashlib
+import threading
+from src.analysis_cache import AnalysisMemo, sha256_bytes, sha256_file
+
+RESULT = {"building_footprint_percentage": 31.5, "green_cover_percentage": 22.0}
+
+def test_hits_and_misses(tmp_path):
+    memo = AnalysisMemo(str(tmp_path / "memo.sqlite3"))
+    assert memo.get("img", "model-a") is None
+    memo.put("img", "model-a", RESULT)
+    assert memo.get("img", "model-a") == RESULT
+    assert memo.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+def test_get_many_returns_only_hits(tmp_path):
+    memo = AnalysisMemo(str(tmp_path / "memo.sqlite3"))
+    memo.put_many([("a", RESULT), ("b", {"green_cover_percentage": 5.0})], "model-a")
+    found = memo.get_many(["a", "b", "c", "a"], "model-a")
+    assert found == {"a": RESULT, "b": {"green_cover_percentage": 5.0}}
+
+def test_new_model_key_misses(tmp_path):
+    memo = AnalysisMemo(str(tmp_path / "memo.sqlite3"))
+    memo.put("img", "model-a", RESULT)
+    assert memo.get("img", "model-b") is None
+
+def test_model_key_follows_the_weights(tmp_path):
+    weights = tmp_path / "weights.pt"
+    weights.write_bytes(b"v1" * 1000)
+    before = sha256_file(str(weights), chunk_size=7)
+    assert before == hashlib.sha256(b"v1" * 1000).hexdigest() == sha256_bytes(b"v1" * 1000)
+    weights.write_bytes(b"v2" * 1000)
+    assert sha256_file(str(weights)) != before
+
+def test_entries_persist_across_instances(tmp_path):
+    path = str(tmp_path / "memo.sqlite3")
+    AnalysisMemo(path).put("img", "model-a", RESULT)
+    assert AnalysisMemo(path).get("img", "model-a") == RESULT
+
+def test_each_thread_gets_its_own_connection(tmp_path):
+    memo = AnalysisMemo(str(tmp_path / "memo.sqlite3"))
+    connections, errors = {}, []
+
+    def worker(n: int):
+        try:
+            conn = memo._connection()
+            assert memo._connection() is conn  # reused within the thread
+            connections[n] = conn
+            memo.put(f"img-{n}", "model-a", {"n": n})
+            assert memo.get(f"img-{n}", "model-a") == {"n": n}
+        except Exception as e:
+            errors.append(repr(e))
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len({id(conn) for conn in connections.values()}) == 4
+    assert memo._connection() not in connections.values()
+    assert len(memo.get_many([f"img-{n}" for n in range(4)], "model-a")) == 4
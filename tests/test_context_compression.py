@@ -0,0 +1,50 @@
+# tests/test_context_compression.py
+
+from src.context_compression import (
+    compress_context, drop_near_duplicates, estimate_tokens, merge_overlapping, pack, rerank,
+)
+
+GREEN = (
+    "GRN-01: The total green cover, including parks and planted areas, must be at least 10% of the site. "
+    "Rooftop gardens count towards it only where they are accessible to residents."
+)
+FOOTPRINT = (
+    "BLD-01: The total footprint of all buildings must not exceed 40% of the total site area. "
+    "Basements that are fully underground are not counted in the footprint."
+)
+SETBACK = "SET-01: Buildings must be set back at least 6 metres from any road wider than 18 metres."
+
+def test_overlapping_chunks_are_stitched():
+    text = GREEN + " " + FOOTPRINT
+    first, second = text[:150], text[100:]  # the splitter repeats 50 characters
+    assert merge_overlapping([first, SETBACK, second]) == [text, SETBACK]
+
+def test_unrelated_chunks_are_not_merged():
+    assert merge_overlapping([GREEN, FOOTPRINT]) == [GREEN, FOOTPRINT]
+
+def test_near_duplicates_keep_the_better_ranked_copy():
+    # The same rule extracted from another copy of the document: different punctuation and case
+    copy = GREEN.replace(",", "").upper()
+    assert drop_near_duplicates([GREEN, FOOTPRINT, copy]) == [GREEN, FOOTPRINT]
+    assert drop_near_duplicates([GREEN, FOOTPRINT, SETBACK]) == [GREEN, FOOTPRINT, SETBACK]
+
+def test_rerank_lifts_chunks_matching_the_query():
+    ranked = rerank("building footprint basements", [SETBACK, GREEN, FOOTPRINT])
+    assert ranked[0] == FOOTPRINT
+    assert set(ranked) == {SETBACK, GREEN, FOOTPRINT}
+
+def test_pack_fits_the_budget_and_trims_at_a_sentence():
+    budget = estimate_tokens(GREEN) + 30
+    # FOOTPRINT doesn't fit and too little room is left to trim it, but the shorter SETBACK does
+    assert pack([GREEN, FOOTPRINT, SETBACK], budget) == [GREEN, SETBACK]
+    budget = estimate_tokens(GREEN) + 45
+    packed = pack([GREEN, FOOTPRINT + " " + SETBACK], budget)
+    assert packed == [GREEN, FOOTPRINT]
+    assert sum(estimate_tokens(c) for c in packed) <= budget
+
+def test_compress_context_reports_what_it_removed():
+    copy = GREEN.replace(",", "").upper()
+    result = compress_context("green cover", [GREEN, copy, FOOTPRINT, SETBACK], budget=1000)
+    assert result.duplicates == 1 and result.merged == 0 and result.dropped == 0
+    assert result.chunks[0] == GREEN
+    assert result.tokens < result.retrieved_tokens
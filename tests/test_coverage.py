@@ -0,0 +1,34 @@
+# tests/test_coverage.py
+
+import numpy as np
+from src.coverage import union_area_exact, union_area_polygons, union_area_raster
+
+HEIGHT, WIDTH = 200, 300
+# Two overlapping squares plus one disjoint box
+BOXES = [(10, 10, 70, 70), (40, 40, 100, 100), (150, 20, 210, 60)]
+
+def brute_force_area(boxes) -> int:
+    mask = np.zeros((HEIGHT, WIDTH), dtype=bool)
+    for x1, y1, x2, y2 in boxes:
+        mask[y1:y2, x1:x2] = True
+    return int(mask.sum())
+
+def as_polygon(box) -> np.ndarray:
+    x1, y1, x2, y2 = box
+    # fillPoly includes the far edge, so the last pixel row/column is x2 - 1 / y2 - 1
+    return np.array([(x1, y1), (x2 - 1, y1), (x2 - 1, y2 - 1), (x1, y2 - 1)])
+
+def test_overlapping_squares_counted_once():
+    expected = brute_force_area(BOXES[:2])
+    assert expected == 6300
+    assert union_area_exact(BOXES[:2]) == expected
+    assert union_area_raster(BOXES[:2], HEIGHT, WIDTH, scale=1.0) == expected
+    assert union_area_polygons([as_polygon(b) for b in BOXES[:2]], HEIGHT, WIDTH, scale=1.0) == expected
+
+def test_union_methods_match_brute_force():
+    expected = brute_force_area(BOXES)
+    assert union_area_exact(BOXES) == expected
+    assert union_area_raster(BOXES, HEIGHT, WIDTH, scale=1.0) == expected
+    assert union_area_polygons([as_polygon(b) for b in BOXES], HEIGHT, WIDTH, scale=1.0) == expected
+    # The default quarter-resolution raster stays within a few percent
+    assert abs(union_area_raster(BOXES, HEIGHT, WIDTH) - expected) / expected < 0.05
@@ -0,0 +1,108 @@
+# tests/test_ingest.py
+
+import json
+import os
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src.ingest import chunk_id, iter_rule_documents, load_manifest, sync_vector_store
+
+class FakeVectorStore:
+    """In-memory stand-in for the Chroma store that embeds with a local fake embedding."""
+
+    def __init__(self):
+        self.embedding = DeterministicFakeEmbedding(size=16)
+        self.vectors = {}
+        self.embedded = 0
+
+    def add_texts(self, texts, metadatas=None, ids=None):
+        for cid, vector in zip(ids, self.embedding.embed_documents(list(texts))):
+            self.vectors[cid] = vector
+        self.embedded += len(texts)
+
+    def delete(self, ids=None):
+        for cid in ids or []:
+            self.vectors.pop(cid, None)
+
+    def get(self, include=None):
+        return {"ids": list(self.vectors)}
+
+def write_rules(path, rules):
+    with open(path, "w") as f:
+        json.dump({"rules": rules}, f)
+
+RULES = [
+    {"id": "R1", "compliance_metric": "green_cover", "direction": "min", "threshold": 30, "unit": "%", "description": "Keep a third of the site green."},
+    {"id": "R2", "compliance_metric": "ground_coverage", "direction": "max", "threshold": 40, "unit": "%", "description": "Limit built footprint."},
+]
+
+@pytest.fixture
+def corpus(tmp_path):
+    source = str(tmp_path / "rules.json")
+    write_rules(source, RULES)
+    return source, str(tmp_path / "store" / "manifest.json")
+
+def test_unchanged_sources_are_skipped(corpus):
+    source, manifest_path = corpus
+    store = FakeVectorStore()
+    first = sync_vector_store(store, [source], manifest_path)
+    assert first["files_changed"] == 1 and first["chunks_added"] == 2
+    second = sync_vector_store(store, [source], manifest_path)
+    assert second["files_skipped"] == 1 and second["files_changed"] == 0
+    assert store.embedded == 2
+
+def test_touched_but_identical_source_is_not_reembedded(corpus):
+    source, manifest_path = corpus
+    store = FakeVectorStore()
+    sync_vector_store(store, [source], manifest_path)
+    stat = os.stat(source)
+    os.utime(source, (stat.st_atime, stat.st_mtime + 10))
+    stats = sync_vector_store(store, [source], manifest_path)
+    assert stats["files_skipped"] == 1
+    assert store.embedded == 2
+    # The new mtime is recorded, so the next run skips without hashing
+    assert load_manifest(manifest_path)["sources"][source]["mtime"] == stat.st_mtime + 10
+
+def test_changed_source_embeds_only_new_chunks(corpus):
+    source, manifest_path = corpus
+    store = FakeVectorStore()
+    sync_vector_store(store, [source], manifest_path)
+    old_ids = set(store.vectors)
+    write_rules(source, [RULES[0], {**RULES[1], "threshold": 35}])
+    stats = sync_vector_store(store, [source], manifest_path)
+    assert stats["files_changed"] == 1
+    assert stats["chunks_added"] == 1 and stats["chunks_removed"] == 1
+    assert store.embedded == 3
+    assert len(store.vectors) == 2 and len(old_ids & set(store.vectors)) == 1
+
+def test_chunk_ids_are_stable(corpus):
+    source, manifest_path = corpus
+    ids = [chunk_id(source, doc) for doc in iter_rule_documents(source)]
+    assert ids == [chunk_id(source, doc) for doc in iter_rule_documents(source)]
+    assert len(set(ids)) == len(ids)
+    sync_vector_store(FakeVectorStore(), [source], manifest_path)
+    assert load_manifest(manifest_path)["sources"][source]["chunk_ids"] == ids
+
+def test_removed_source_deletes_its_vectors(corpus, tmp_path):
+    source, manifest_path = corpus
+    other = str(tmp_path / "more_rules.json")
+    write_rules(other, [{"id": "R3", "compliance_metric": "far", "direction": "max", "threshold": 2, "description": "FAR cap."}])
+    store = FakeVectorStore()
+    sync_vector_store(store, [source, other], manifest_path)
+    stats = sync_vector_store(store, [source], manifest_path)
+    assert stats["files_removed"] == 1 and stats["chunks_removed"] == 1
+    assert set(store.vectors) == set(load_manifest(manifest_path)["sources"][source]["chunk_ids"])
+
+def test_legacy_store_without_manifest_is_reset(corpus):
+    source, manifest_path = corpus
+    store = FakeVectorStore()
+    store.add_texts(["untracked chunk"], ids=["legacy-1"])
+    sync_vector_store(store, [source], manifest_path)
+    assert "legacy-1" not in store.vectors
+    assert len(store.vectors) == 2
+
+def test_json_without_rules_is_skipped(tmp_path):
+    for name, content in (("list.json", [1, 2]), ("scalar.json", 3), ("other.json", {"name": "x"})):
+        path = str(tmp_path / name)
+        with open(path, "w") as f:
+            json.dump(content, f)
+        assert list(iter_rule_documents(path)) == []
@@ -0,0 +1,52 @@
+# tests/test_lexical_index.py
+
+import sqlite3
+import pytest
+from langchain_core.documents import Document
+from src.lexical_index import LexicalIndex
+
+def chunk(cid: str, text: str):
+    return cid, Document(page_content=text, metadata={"rule_id": cid})
+
+def test_replace_source_swaps_chunks_when_the_block_ends(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+    with index.replace_source("rules.json", "h1") as add:
+        add([chunk("GRN-01", "GRN-01 green_cover min 30%")])
+    with index.replace_source("rules.json", "h2") as add:
+        add([chunk("GRN-02", "GRN-02 green_cover min 35%")])
+        # Staged only: searches still see the committed chunks
+        assert [d.id for d in index.search("GRN-01")] == ["GRN-01"]
+        assert index.search("GRN-02") == []
+    assert index.search("GRN-01") == []
+    assert [d.id for d in index.search("GRN-02")] == ["GRN-02"]
+    assert index.source_hash("rules.json") == "h2"
+    assert len(index) == 1
+
+def test_failed_replace_leaves_the_old_chunks(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+    with index.replace_source("rules.json", "h1") as add:
+        add([chunk("GRN-01", "GRN-01 green_cover min 30%")])
+    with pytest.raises(RuntimeError):
+        with index.replace_source("rules.json", "h2") as add:
+            add([chunk("GRN-02", "GRN-02 green_cover min 35%")])
+            raise RuntimeError("embedding failed")
+    assert [d.id for d in index.search("GRN-01")] == ["GRN-01"]
+    assert index.source_hash("rules.json") == "h1"
+    # Nothing staged is left behind for the next replace to pick up
+    with index.replace_source("rules.json", "h3"):
+        pass
+    assert len(index) == 0
+
+def test_no_write_lock_held_between_batches(tmp_path):
+    path = str(tmp_path / "lexical.sqlite3")
+    index = LexicalIndex(path)
+    with index.replace_source("rules.json", "h1") as add:
+        add([chunk("GRN-01", "GRN-01 green_cover min 30%")])
+        # Another writer (e.g. a second ingest) isn't blocked while the caller embeds
+        other = sqlite3.connect(path, timeout=0)
+        with other:
+            other.execute("INSERT INTO sources (source, hash) VALUES ('other.json', 'x')")
+        other.close()
+        add([chunk("FAR-01", "FAR-01 floor_area_ratio max 2")])
+    assert sorted(index.sources()) == ["other.json", "rules.json"]
+    assert len(index) == 2
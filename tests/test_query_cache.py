@@ -0,0 +1,76 @@
+# tests/test_query_cache.py
+
+import pytest
+import src.query_cache as query_cache_module
+from src.query_cache import QueryCache, exact_terms, normalize_query
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(query_cache_module.time, "time", clock)
+    return clock
+
+def open_cache(tmp_path, max_entries: int = 8, ttl_s: float = 60, version: str = "v1") -> QueryCache:
+    return QueryCache(str(tmp_path / "cache.sqlite3"), max_entries, ttl_s, max_distance=0.05, corpus_version=version)
+
+def test_queries_are_normalized():
+    assert normalize_query("  Green   Cover rules? ") == "green cover rules"
+    assert exact_terms("GRN-01 above 40.0%") == exact_terms("grn-01 above 40") == frozenset({"grn-01", "40"})
+
+def test_exact_tier(tmp_path, clock):
+    cache = open_cache(tmp_path)
+    assert cache.get("green cover rules") is None
+    cache.put("Green cover rules?", None, "context A")
+    assert cache.get("green cover rules") == "context A"
+    assert cache.stats()["exact_hits"] == 1
+
+def test_entries_expire(tmp_path, clock):
+    cache = open_cache(tmp_path, ttl_s=60)
+    cache.put("green cover rules", None, "context A")
+    clock.now += 61
+    assert cache.get("green cover rules") is None
+    cache.put("setback rules", None, "context B")
+    clock.now += 61
+    # Expired entries aren't reloaded either
+    assert open_cache(tmp_path, ttl_s=60).get("setback rules") is None
+
+def test_least_recently_used_entry_is_evicted(tmp_path, clock):
+    cache = open_cache(tmp_path, max_entries=2)
+    cache.put("a", None, "A")
+    clock.now += 1
+    cache.put("b", None, "B")
+    clock.now += 1
+    assert cache.get("a") == "A"  # "b" is now the least recently used
+    cache.put("c", None, "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A" and cache.get("c") == "C"
+    reopened = open_cache(tmp_path, max_entries=2)
+    assert reopened.get("b") is None and reopened.get("c") == "C"
+
+def test_new_corpus_version_clears_the_cache(tmp_path, clock):
+    cache = open_cache(tmp_path, version="v1")
+    cache.put("green cover rules", None, "context A")
+    assert open_cache(tmp_path, version="v1").get("green cover rules") == "context A"
+    cache.set_corpus_version("v2")
+    assert cache.get("green cover rules") is None
+    assert open_cache(tmp_path, version="v2").get("green cover rules") is None
+    # Opening with another version than the one on disk starts empty too
+    cache.put("setback rules", None, "context B")
+    assert open_cache(tmp_path, version="v3").get("setback rules") is None
+
+def test_semantic_tier_requires_the_same_exact_terms(tmp_path, clock):
+    cache = open_cache(tmp_path)
+    cache.put("minimum green cover above 40%", [1.0, 0.0, 0.0], "context 40")
+    near = [0.999, 0.04, 0.0]
+    assert cache.get_similar("green cover at least 40%", near) == "context 40"
+    assert cache.get_similar("green cover at least 45%", near) is None
+    assert cache.get_similar("green cover at least 40%", [0.0, 1.0, 0.0]) is None
+    # The paraphrase that hit is now an exact-tier entry of its own
+    assert cache.get("green cover at least 40%") == "context 40"
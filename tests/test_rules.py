@@ -0,0 +1,68 @@
+# tests/test_rules.py
+
+import os
+import pytest
+from src.rules import MAX, MIN, RuleEngine, parse_rules
+
+RULEBOOK = {
+    "rules": [
+        {"id": "GRN-01", "compliance_metric": "green_cover_percentage", "threshold": 10, "unit": "%", "direction": "min"},
+        {"id": "BLD-01", "compliance_metric": "building_footprint_percentage", "threshold": 40, "unit": "%", "direction": "max"},
+        # Only checked for designs in the residential zone
+        {"id": "GRN-R1", "compliance_metric": "green_cover_percentage", "threshold": 25, "unit": "%", "direction": "min", "zone": "residential"},
+    ]
+}
+
+@pytest.fixture
+def engine():
+    return RuleEngine(parse_rules(RULEBOOK))
+
+def test_direction_is_inferred_from_the_wording():
+    rules = parse_rules({"rules": [
+        {"id": "A", "compliance_metric": "m", "threshold": 1, "description": "Must not exceed 1."},
+        {"id": "B", "compliance_metric": "m", "threshold": 1, "description": "Must be at least 1."},
+    ]})
+    assert [r.direction for r in rules] == [MAX, MIN]
+
+def test_unknown_direction_is_rejected():
+    with pytest.raises(ValueError):
+        parse_rules({"rules": [{"id": "A", "compliance_metric": "m", "threshold": 1, "direction": "equal"}]})
+
+def test_min_and_max_rules(engine):
+    report = engine.evaluate({"green_cover_percentage": 8.0, "building_footprint_percentage": 45.0})
+    assert not report.passed
+    assert {r.rule_id: r.margin for r in report.results} == {"GRN-01": -2.0, "BLD-01": -5.0}
+    assert report.shortfall == 7.0
+    assert report.feedback() == (
+        "FAIL: green_cover_percentage is 8% but must be at least 10% (GRN-01); "
+        "building_footprint_percentage is 45% but must be at most 40% (BLD-01)."
+    )
+
+def test_threshold_itself_passes(engine):
+    report = engine.evaluate({"green_cover_percentage": 10.0, "building_footprint_percentage": 40.0})
+    assert report.passed and report.feedback() == "PASS" and report.shortfall == 0
+
+def test_zone_rules_apply_only_in_their_zone(engine):
+    analysis = {"green_cover_percentage": 15.0}
+    assert engine.evaluate(analysis).passed
+    report = engine.evaluate(analysis, zone="residential")
+    assert not report.passed
+    assert [r.rule_id for r in report.violations] == ["GRN-R1"]
+    assert engine.evaluate(analysis, zone="industrial").passed
+
+def test_unmatched_metrics_are_ignored(engine):
+    report = engine.evaluate({"green_cover_percentage": 12.0, "water_body_percentage": 3.0})
+    assert [r.rule_id for r in report.results] == ["GRN-01"]
+
+def test_no_matching_rule_fails(engine):
+    report = engine.evaluate({"water_body_percentage": 3.0})
+    assert not report.passed and report.error
+    assert report.shortfall == float("inf")
+
+def test_failed_analysis_fails(engine):
+    assert engine.evaluate({"error": "no image"}).feedback() == "FAIL: analysis failed (no image)"
+    assert not engine.evaluate("not a dict").passed
+
+def test_shipped_rulebook_loads():
+    engine = RuleEngine.from_file(os.path.join(os.path.dirname(__file__), "..", "rag_data", "compliance_rules.json"))
+    assert {r.id for r in engine.rules} >= {"GRN-01", "BLD-01"}
@@ -0,0 +1,158 @@
+# tests/test_scheduler.py
+
+import asyncio
+import threading
+import time
+import pytest
+from src.scheduler import BATCH, INTERACTIVE, ModelLimiter, RequestScheduler, TokenBucket
+
+class FakeServer:
+    """Stands in for the OpenAI API: counts requests and answers after `latency` seconds."""
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.requests = 0
+
+    async def acomplete(self, prompt: str) -> str:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        return f"reply to {prompt}"
+
+    def complete(self, prompt: str) -> str:
+        self.requests += 1
+        time.sleep(self.latency)
+        return f"reply to {prompt}"
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(per_minute=60)  # one unit per second
+    now = bucket.updated
+    assert bucket.wait_time(60, now) == 0
+    bucket.take(60)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now + 0.5) == pytest.approx(0.5)
+    # Larger than the bucket: waits for a full bucket rather than forever
+    assert bucket.wait_time(120, now + 0.5) == pytest.approx(59.5)
+
+def test_limiter_blocks_until_budget_refills():
+    limiter = ModelLimiter("fake", rpm=600, tpm=None)  # one request per 0.1 s
+    limiter.requests.level = 0
+    waited = limiter.acquire(0, INTERACTIVE)
+    assert 0.05 < waited < 0.5
+
+def test_interactive_lane_admitted_before_batch():
+    limiter = ModelLimiter("fake", rpm=600, tpm=None)
+    limiter.requests.level = 0
+    order = []
+
+    async def caller(priority, name):
+        await limiter.aacquire(0, priority)
+        order.append(name)
+
+    async def main():
+        await asyncio.gather(caller(BATCH, "batch-1"), caller(BATCH, "batch-2"), caller(INTERACTIVE, "interactive"))
+
+    asyncio.run(main())
+    assert order == ["interactive", "batch-1", "batch-2"]
+
+def test_cancelled_wait_takes_no_budget():
+    limiter = ModelLimiter("fake", rpm=60, tpm=None)
+    limiter.requests.level = 0
+
+    async def main():
+        task = asyncio.create_task(limiter.aacquire(0, INTERACTIVE))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert limiter._waiting == []
+    assert limiter.requests.level > 0
+
+def test_identical_calls_coalesce():
+    server = FakeServer()
+    scheduler = RequestScheduler(rate_limits={}, enabled=True)
+
+    async def main():
+        calls = [scheduler.acall("fake", lambda: server.acomplete("hi"), key="same") for _ in range(5)]
+        return await asyncio.gather(*calls)
+
+    assert asyncio.run(main()) == ["reply to hi"] * 5
+    assert server.requests == 1
+
+def test_identical_sync_calls_coalesce():
+    server = FakeServer(latency=0.2)
+    scheduler = RequestScheduler(rate_limits={}, enabled=True)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(scheduler.call("fake", lambda: server.complete("hi"), key="same")))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["reply to hi"] * 4
+    assert server.requests == 1
+
+def test_api_errors_are_shared_with_followers():
+    scheduler = RequestScheduler(rate_limits={}, max_retries=0, enabled=True)
+    requests = []
+
+    async def failing():
+        requests.append(1)
+        await asyncio.sleep(0.05)
+        raise ValueError("bad request")
+
+    async def main():
+        calls = [scheduler.acall("fake", failing, key="same") for _ in range(3)]
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert len(requests) == 1
+
+def test_cancelled_leader_hands_request_to_follower():
+    server = FakeServer(latency=0.2)
+    scheduler = RequestScheduler(rate_limits={}, enabled=True)
+
+    async def main():
+        leader = asyncio.create_task(scheduler.acall("fake", lambda: server.acomplete("hi"), key="same"))
+        await asyncio.sleep(0.05)
+        follower = asyncio.create_task(scheduler.acall("fake", lambda: server.acomplete("hi"), key="same"))
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == "reply to hi"
+    assert server.requests == 2
+
+def test_timed_out_leader_does_not_fail_follower():
+    server = FakeServer(latency=0.2)
+    scheduler = RequestScheduler(rate_limits={}, enabled=True)
+
+    async def main():
+        leader = asyncio.wait_for(scheduler.acall("fake", lambda: server.acomplete("hi"), key="same"), timeout=0.1)
+        follower = scheduler.acall("fake", lambda: server.acomplete("hi"), key="same")
+        return await asyncio.gather(leader, follower, return_exceptions=True)
+
+    leader_result, follower_result = asyncio.run(main())
+    assert isinstance(leader_result, asyncio.TimeoutError)
+    assert follower_result == "reply to hi"
+
+def test_cancelled_follower_leaves_leader_running():
+    server = FakeServer(latency=0.2)
+    scheduler = RequestScheduler(rate_limits={}, enabled=True)
+
+    async def main():
+        leader = asyncio.create_task(scheduler.acall("fake", lambda: server.acomplete("hi"), key="same"))
+        await asyncio.sleep(0.05)
+        follower = asyncio.create_task(scheduler.acall("fake", lambda: server.acomplete("hi"), key="same"))
+        await asyncio.sleep(0.05)
+        follower.cancel()
+        return await leader
+
+    assert asyncio.run(main()) == "reply to hi"
+    assert server.requests == 1
@@ -0,0 +1,109 @@
+# tests/test_vector_index.py
+
+import os
+import threading
+import numpy as np
+from src.vector_index import MmapVectorStore
+
+DIM = 8
+
+class NoEmbedding:
+    """The tests add pre-computed vectors, so nothing should be embedded."""
+
+    def embed_documents(self, texts):
+        raise AssertionError("unexpected embedding call")
+
+    def embed_query(self, text):
+        raise AssertionError("unexpected embedding call")
+
+def random_vectors(count: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(count, DIM)).astype(np.float32)
+
+def fill(store, count: int, seed: int = 0):
+    vectors = random_vectors(count, seed)
+    ids = [f"chunk-{seed}-{i}" for i in range(count)]
+    store.add_embeddings([f"text {cid}" for cid in ids], vectors, [{"n": i} for i in range(count)], ids)
+    return vectors, ids
+
+def data_files(path: str):
+    return sorted(name for name in os.listdir(path) if name.startswith(("vectors", "ivf_")))
+
+def test_compaction_switches_generation(tmp_path):
+    path = str(tmp_path / "index")
+    store = MmapVectorStore(path, NoEmbedding())
+    vectors, ids = fill(store, 50)
+    store.delete(ids[:20])
+    store.compact()
+    assert store.count == 30 and len(store) == 30
+    assert data_files(path) == ["vectors.1.bin"]
+    # Every surviving chunk is still found by its own vector after renumbering
+    for vector, cid in zip(vectors[20:], ids[20:]):
+        assert store.similarity_search_by_vector(vector, k=1)[0].id == cid
+    reopened = MmapVectorStore(path, NoEmbedding())
+    assert reopened.count == 30
+    assert reopened.similarity_search_by_vector(vectors[25], k=1)[0].id == ids[25]
+
+def test_interrupted_compaction_is_discarded_on_open(tmp_path):
+    path = str(tmp_path / "index")
+    store = MmapVectorStore(path, NoEmbedding())
+    vectors, ids = fill(store, 20)
+    # A crash after writing the next generation's matrix but before the meta commit
+    with open(os.path.join(path, "vectors.1.bin"), "wb") as f:
+        f.write(b"\0" * 64)
+    reopened = MmapVectorStore(path, NoEmbedding())
+    assert data_files(path) == ["vectors.bin"]
+    assert reopened.similarity_search_by_vector(vectors[3], k=1)[0].id == ids[3]
+
+def test_ivf_build_switches_generation(tmp_path):
+    path = str(tmp_path / "index")
+    store = MmapVectorStore(path, NoEmbedding())
+    vectors, ids = fill(store, 200)
+    store.build_ivf(nlist=4)
+    assert data_files(path) == ["ivf_1_centroids.npy", "ivf_1_offsets.npy", "ivf_1_order.npy", "vectors.bin"]
+    fill(store, 50, seed=1)
+    store.build_ivf(nlist=4)
+    assert store.ivf_rows == 250
+    assert data_files(path) == ["ivf_2_centroids.npy", "ivf_2_offsets.npy", "ivf_2_order.npy", "vectors.bin"]
+    assert store.similarity_search_by_vector(vectors[7], k=1)[0].id == ids[7]
+
+def test_interrupted_ivf_build_keeps_the_old_lists(tmp_path):
+    path = str(tmp_path / "index")
+    store = MmapVectorStore(path, NoEmbedding())
+    fill(store, 200)
+    store.build_ivf(nlist=4)
+    # A crash after writing part of the next IVF generation but before the meta commit
+    np.save(os.path.join(path, "ivf_2_centroids.npy"), np.zeros((4, DIM), dtype=np.float32))
+    reopened = MmapVectorStore(path, NoEmbedding())
+    assert reopened.ivf_rows == 200
+    assert data_files(path) == ["ivf_1_centroids.npy", "ivf_1_offsets.npy", "ivf_1_order.npy", "vectors.bin"]
+
+def test_searches_during_compaction_and_appends(tmp_path):
+    store = MmapVectorStore(str(tmp_path / "index"), NoEmbedding())
+    vectors, ids = fill(store, 400)
+    expected = dict(zip(ids, vectors))
+    errors = []
+    stop = threading.Event()
+
+    def search():
+        rng = np.random.default_rng(threading.get_ident() % 1000)
+        while not stop.is_set():
+            cid = ids[int(rng.integers(200, 400))]  # never deleted below
+            try:
+                found = store.similarity_search_by_vector(expected[cid], k=1)
+                if found[0].id != cid:
+                    errors.append(f"{cid} found as {found[0].id}")
+            except Exception as e:
+                errors.append(repr(e))
+
+    threads = [threading.Thread(target=search) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for round_no in range(5):
+        store.delete(ids[round_no * 40:(round_no + 1) * 40])
+        fill(store, 20, seed=round_no + 1)
+        store.compact()
+    stop.set()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(store) == 400 - 200 + 100